@@ -8,15 +8,30 @@
 """
 import logging
 import hashlib
+import os
 import shutil
 import parmed
-from HTPolyNet.command import Command
+from HTPolyNet.command import Command, run_concurrently
 from HTPolyNet.coordinates import Coordinates
 logger=logging.getLogger(__name__)
 
 def GAFFParameterize(inputPrefix,outputPrefix,input_structure_format='mol2',**kwargs):
     """GAFFParameterize manages execution of antechamber, tleap, and parmchk2 to generate
-    GAFF parameters
+    GAFF parameters; synchronous wrapper around GAFFParameterize_async
+
+    :param inputPrefix: basename of input structure file
+    :type inputPrefix: str
+    :param outputPrefix: basename of output files
+    :type outputPrefix: str
+    :param input_structure_format: format of input structure file, defaults to 'mol2'; 'pdb' is other option        
+    :type input_structure_format: str, optional
+    :raises parmed.exceptions.GromacsError: if parmed fails
+    """
+    run_concurrently(GAFFParameterize_async(inputPrefix,outputPrefix,input_structure_format=input_structure_format,**kwargs))
+
+async def GAFFParameterize_async(inputPrefix,outputPrefix,input_structure_format='mol2',**kwargs):
+    """GAFFParameterize_async manages execution of antechamber, tleap, and parmchk2 to generate
+    GAFF parameters; parameterizations of different molecules may be awaited concurrently
 
     :param inputPrefix: basename of input structure file
     :type inputPrefix: str
@@ -44,10 +59,10 @@ def GAFFParameterize(inputPrefix,outputPrefix,input_structure_format='mol2',**kw
     topOut=f'{outputPrefix}.top'
     itpOut=f'{outputPrefix}.itp'
     c=Command('antechamber',j=4,fi=input_structure_format,fo='mol2',c=chargemethod,at='gaff',i=new_structin,o=mol2out,pf='Y',nc=0,eq=1,pl=10)
-    c.run(quiet=False)
+    await c.run_async(quiet=False)
     logger.debug(f'AmberTools> Antechamber generated {mol2out}')
     c=Command('parmchk2',i=mol2out,o=frcmodout,f='mol2',s='gaff')
-    c.run(quiet=False)
+    await c.run_async(quiet=False)
     # Antechamber ignores SUBSTRUCTURES but we would like tleap to 
     # recognize them.  So we will simply use the antechamber-INPUT mol2 file
     # resName and resNum atom record fields over the antechamber-OUTPUT mol2 file
@@ -65,7 +80,7 @@ def GAFFParameterize(inputPrefix,outputPrefix,input_structure_format='mol2',**kw
     leapprefix=hashlib.shake_128(outputPrefix.encode("utf-8")).hexdigest(16).replace('e','x')
     goodMol2.write_mol2(f'{leapprefix}.mol2')
     logger.debug(f'Replacing string "{outputPrefix}" with hash "{leapprefix}" for leap input files.')
-    Command(f'cp {frcmodout} {leapprefix}.frcmod').run()
+    shutil.copy(frcmodout,f'{leapprefix}.frcmod')
     with open(f'{inputPrefix}-tleap.in', 'w') as f:
         f.write(f'source leaprc.gaff\n')
         f.write(f'mymol = loadmol2 {leapprefix}.mol2\n')
@@ -74,11 +89,10 @@ def GAFFParameterize(inputPrefix,outputPrefix,input_structure_format='mol2',**kw
         f.write(f'saveamberparm mymol {leapprefix}-tleap.top {leapprefix}-tleap.crd\n')
         f.write('quit\n')
     c=Command('tleap',f=f'{inputPrefix}-tleap.in')
-    c.run(override=('Error!','Unspecified tleap error'))
-    Command(f'rm -f {leapprefix}.frcmod').run()
-    Command(f'mv {leapprefix}.mol2 {outputPrefix}.mol2').run()
-    Command(f'mv {leapprefix}-tleap.top {outputPrefix}-tleap.top').run()
-    Command(f'mv {leapprefix}-tleap.crd {outputPrefix}-tleap.crd').run()
+    await c.run_async(override=('Error!','Unspecified tleap error'))
+    os.remove(f'{leapprefix}.frcmod')
+    for sfx in ['.mol2','-tleap.top','-tleap.crd']:
+        shutil.move(f'{leapprefix}{sfx}',f'{outputPrefix}{sfx}')
     # save the results of the antechamber/parmchk2/tleap sequence as Gromacs gro and top files
     try:
         file=parmed.load_file(f'{outputPrefix}-tleap.top', xyz=f'{outputPrefix}-tleap.crd')
@@ -14,6 +14,7 @@ import HTPolyNet.projectfilesystem as pfs
 from HTPolyNet.gromacs import gmx_command
 import HTPolyNet.software as software
 from HTPolyNet.configuration import Configuration
+from HTPolyNet.scheduler import run_projects, run_stages
 from pathlib import Path
 
 logger=logging.getLogger(__name__)
@@ -231,8 +232,37 @@ class AnalyzeConfiguration:
             else:
                 self.stagelist.append(self.default_class(content))
 
+def _analyze_project(d,mdrun_options,cfg,ogromacs,lib,root):
+    """_analyze_project runs all analyses of one project in order
+
+    :param d: project directory
+    :type d: str
+    :param mdrun_options: unused; analyses do not run mdrun
+    :type mdrun_options: dict
+    :param cfg: analysis configuration
+    :type cfg: AnalyzeConfiguration
+    :param ogromacs: gromacs directives from the original config file
+    :type ogromacs: dict
+    :param lib: user library
+    :type lib: str
+    :param root: directory containing the project directories
+    :type root: str
+    :return: stage timings
+    :rtype: list(JobTiming)
+    """
+    pfs.pfs_setup(root=root,topdirs=['molecules','systems','plots','postsim','analyze'],verbose=True,projdir=d,reProject=False,userlibrary=lib)
+    pfs.go_to('analyze')
+    def run_stage(stage):
+        stage.do(**ogromacs)
+        stage.parse_console_output()
+    try:
+        return run_stages(d,[(stage.params['subdir'],stage) for stage in cfg.stagelist],run_stage)
+    finally:
+        pfs.go_root()
+
 def analyze(args):
-    """postsim handles the analyze subcommand for managing gromacs-based trajectory analyses
+    """analyze handles the analyze subcommand for managing gromacs-based trajectory analyses;
+    projects are independent, so up to args.max_concurrent of them run at once
 
     :param args: command-line arguments
     :type args: argparse.Namespace
@@ -249,10 +279,4 @@ def analyze(args):
     logger.info(f'Project director{ess}: {args.proj}')
     software.sw_setup()
     logger.debug(f'ogromacs {ogromacs}')
-    for d in args.proj:
-        pfs.pfs_setup(root=os.getcwd(),topdirs=['molecules','systems','plots','postsim','analyze'],verbose=True,projdir=d,reProject=False,userlibrary=args.lib)
-        pfs.go_to('analyze')
-        for stage in cfg.stagelist:
-            stage.do(**ogromacs)
-            stage.parse_console_output()
-        pfs.go_root()
+    run_projects(_analyze_project,args.proj,args=(cfg,ogromacs,args.lib,os.getcwd()),max_concurrent=args.max_concurrent,pin=False)
@@ -10,23 +10,63 @@
 import numpy as np
 import networkx as nx
 import pandas as pd
+from scipy.sparse import csr_matrix
 
 import logging
+import HTPolyNet.checks as checks
 logger=logging.getLogger(__name__)
 
 class Bondlist:
-    """ The member "B" is a dictionary keyed on atom index whose values of lists 
-    of atom indices indicating bond partners of the key atom
+    """ Bidirectional bondlist stored as integer edge arrays with a compressed-sparse-row
+    (CSR) neighbor index.  Each bond is stored once in the edge arrays ``ei``, ``ej`` in
+    insertion order; the CSR arrays ``indptr`` and ``indices`` hold both directions, so
+    the partners of atom i are ``indices[indptr[i]:indptr[i+1]]``, in the same order
+    in which the bonds were added.  Bonds appended one at a time are kept in a small
+    overlay dictionary and folded into the CSR arrays in bulk once the overlay exceeds
+    ``overlay_limit`` bonds.
     """
+    overlay_limit=1024
     def __init__(self):
-        self.B={}
-    
+        self.ei=np.zeros(0,dtype=int)
+        self.ej=np.zeros(0,dtype=int)
+        self.indptr=np.zeros(1,dtype=int)
+        self.indices=np.zeros(0,dtype=int)
+        self.present=np.zeros(0,dtype=bool)
+        self.overlay={}
+        self._pending=[]
+        self.noverlay=0
+
     @classmethod
     def fromDataFrame(cls,df:pd.DataFrame):
         inst=cls()
         inst.update(df)
         return inst
 
+    def _build(self):
+        """_build folds any overlay bonds into the edge arrays and rebuilds the CSR index
+        """
+        if self.noverlay>0:
+            pend=self._pending
+            self.ei=np.concatenate((self.ei,np.array([p[0] for p in pend],dtype=int)))
+            self.ej=np.concatenate((self.ej,np.array([p[1] for p in pend],dtype=int)))
+        self.overlay={}
+        self.noverlay=0
+        self._pending=[]
+        n=len(self.ei)
+        src=np.empty(2*n,dtype=int)
+        dst=np.empty(2*n,dtype=int)
+        src[0::2]=self.ei
+        src[1::2]=self.ej
+        dst[0::2]=self.ej
+        dst[1::2]=self.ei
+        order=np.argsort(src,kind='stable')
+        N=(src.max()+1) if n>0 else 0
+        self.indptr=np.zeros(N+1,dtype=int)
+        np.cumsum(np.bincount(src,minlength=N),out=self.indptr[1:])
+        self.indices=dst[order]
+        self.present=np.zeros(N,dtype=bool)
+        self.present[src]=True
+
     def update(self,df:pd.DataFrame):
         """update updates the bondlist using data in the parameter dataframe df
 
@@ -36,24 +76,39 @@ class Bondlist:
         """
         if not 'ai' in df.columns and not 'aj' in df.columns:
             raise Exception('Bondlist expects a dataframe with columns "ai" and "aj".')
-        assert df['ai'].dtype==int
-        assert df['aj'].dtype==int
-        aiset=set(df.ai)
-        ajset=set(df.aj)
-        keyset=aiset.union(ajset)
-        keys=sorted(list(keyset))
-        self.B.update({k:[] for k in keys})
-        assert all([type(x)==int for x in self.B.keys()])
-        for r in df.itertuples():
-            ai=r.ai 
-            aj=r.aj
-            self.B[ai].append(aj)
-            self.B[aj].append(ai)
-        for k,v in self.B.items():
-            this_check=all([type(x)==int for x in v])
-            if not this_check:
-                logger.error(f'{k} {v}')
-            assert this_check
+        if checks.active('cheap'):
+            assert df['ai'].dtype==int
+            assert df['aj'].dtype==int
+        if checks.active('full'):
+            with checks.timed('Bondlist.update'):
+                assert not (df['ai']==df['aj']).any(),f'Error: self-bond in {df[df["ai"]==df["aj"]].to_string()}'
+        if self.noverlay>0:
+            self._build()
+        self.ei=np.concatenate((self.ei,df['ai'].to_numpy(dtype=int)))
+        self.ej=np.concatenate((self.ej,df['aj'].to_numpy(dtype=int)))
+        self._build()
+
+    @property
+    def B(self):
+        """B dictionary view of the bondlist, keyed on atom index, whose values are lists
+        of bond partners; built on demand, so modifying it does not modify the bondlist
+
+        :return: dictionary of partner lists
+        :rtype: dict
+        """
+        return {k:self.partners_of(k) for k in self.atoms()}
+
+    def atoms(self):
+        """atoms returns the sorted indices of all atoms with at least one bond
+
+        :return: atom indices
+        :rtype: list
+        """
+        a=np.nonzero(self.present)[0].tolist()
+        return sorted(set(a).union(self.overlay.keys()))
+
+    def __len__(self):
+        return len(self.ei)+self.noverlay
 
     def __str__(self):
         retstr=''
@@ -62,17 +117,58 @@ class Bondlist:
         return retstr
     
     def partners_of(self,idx):
-        """partners_of returns a copy of the value of self.B[idx]
+        """partners_of returns a list of the bond partners of atom idx
 
         :param idx: atom index
         :type idx: int
         :return: list of indices of atoms to which atom 'idx' is bound
         :rtype: list
         """
-        if idx in self.B:
-            assert all([type(x)==int for x in self.B[idx]])
-            return self.B[idx][:]
-        return []
+        res=[]
+        if 0<=idx<len(self.indptr)-1:
+            res=self.indices[self.indptr[idx]:self.indptr[idx+1]].tolist()
+        if idx in self.overlay:
+            res.extend(self.overlay[idx])
+        return res
+
+    def partners_of_many(self,idx,positions=False):
+        """partners_of_many vectorized neighbor query for an array of atoms; bonds still
+        in the overlay are folded into the CSR index first
+
+        :param idx: atom indices
+        :type idx: array-like of int
+        :param positions: if True, the first returned array holds positions in idx rather than atom indices, defaults to False
+        :type positions: bool, optional
+        :return: two arrays (atom, partner) listing every bond partner of every atom in idx
+        :rtype: tuple(numpy.ndarray,numpy.ndarray)
+        """
+        if self.noverlay>0:
+            self._build()
+        idx=np.asarray(idx,dtype=int)
+        pos=np.arange(len(idx))
+        valid=(idx>=0)&(idx<len(self.indptr)-1)
+        idx,pos=idx[valid],pos[valid]
+        starts=self.indptr[idx]
+        counts=self.indptr[idx+1]-starts
+        owner=np.repeat(pos if positions else idx,counts)
+        offsets=np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts,counts)
+        return owner,self.indices[np.repeat(starts,counts)+offsets]
+
+    def degree(self,idx):
+        """degree returns the number of bond partners of each atom in idx
+
+        :param idx: atom indices
+        :type idx: array-like of int
+        :return: number of partners of each atom
+        :rtype: numpy.ndarray
+        """
+        if self.noverlay>0:
+            self._build()
+        idx=np.asarray(idx,dtype=int)
+        res=np.zeros(len(idx),dtype=int)
+        ok=(idx>=0)&(idx<len(self.indptr)-1)
+        res[ok]=self.indptr[idx[ok]+1]-self.indptr[idx[ok]]
+        return res
 
     def are_bonded(self,idx,jdx):
         """are_bonded returns True if atoms with indices idx and jdx are bonded neighbors
@@ -84,8 +180,10 @@ class Bondlist:
         :return: True if idx and jdx are bonded neighbors
         :rtype: bool
         """
-        if idx in self.B and jdx in self.B:
-            return jdx in self.B[idx]
+        if jdx in self.overlay.get(idx,[]):
+            return True
+        if 0<=idx<len(self.indptr)-1:
+            return bool(np.any(self.indices[self.indptr[idx]:self.indptr[idx+1]]==jdx))
         return False
 
     def append(self,pair):
@@ -98,42 +196,45 @@ class Bondlist:
         ai,aj=min(pair),max(pair)
         assert type(ai)==int
         assert type(aj)==int
-        if not ai in self.B:
-            self.B[ai]=[]
-        self.B[ai].append(aj)
-        if not aj in self.B:
-            self.B[aj]=[]
-        self.B[aj].append(ai)
-
-    def delete_atoms(self,idx):
+        self._pending.append((ai,aj))
+        self.overlay.setdefault(ai,[]).append(aj)
+        self.overlay.setdefault(aj,[]).append(ai)
+        self.noverlay+=1
+        if self.noverlay>self.overlay_limit:
+            self._build()
+
+    def delete_atoms(self,idx,lookup=None):
         """delete_atoms deletes all instances of atoms in the list idx from the bondlist
 
         :param idx: list of indices for atoms to delete
         :type idx: list
+        :param lookup: optional old-to-new index lookup array (see dataframetools.idx_lookup) used to reindex surviving entries, defaults to None
+        :type lookup: numpy.ndarray, optional
         """
-        ''' delete entries '''
-        for i in idx:
-            if i in self.B:
-                del self.B[i]
-        ''' delete members in other entries '''
-        for k,v in self.B.items():
-            for i in idx:
-                if i in v:
-                    self.B[k].remove(i)
+        if self.noverlay>0:
+            self._build()
+        idx=np.asarray(list(idx),dtype=int)
+        keep=~(np.isin(self.ei,idx)|np.isin(self.ej,idx))
+        self.ei=self.ei[keep]
+        self.ej=self.ej[keep]
+        if lookup is not None:
+            self.ei=lookup[self.ei]
+            self.ej=lookup[self.ej]
+        self._build()
     
     def adjacency_matrix(self):
-        """adjacency_matrix generate and return an adjacency matrix built from the bondlist
+        """adjacency_matrix generate and return a sparse adjacency matrix built from the bondlist;
+        row/column i corresponds to atom index i+1
 
-        :return: _description_
-        :rtype: _type_
+        :return: symmetric adjacency matrix
+        :rtype: scipy.sparse.csr_matrix
         """
-        N=len(self.B)
-        A=np.zeros((N,N)).astype(int)
-        for i,n in self.B.items():
-            for j in n:
-                A[i-1,j-1]=1
-                A[j-1,i-1]=1
-        return A
+        if self.noverlay>0:
+            self._build()
+        N=len(self.indptr)-1
+        if N==0:
+            return csr_matrix((0,0),dtype=int)
+        return csr_matrix((np.ones(len(self.indices),dtype=int),self.indices-1,self.indptr[1:]),shape=(N-1,N-1))
 
     def as_list(self,root,depth):
         """as_list recursively build a list of all atoms that form a bonded cluster by traversing maximally depth bonds
@@ -197,8 +298,9 @@ class Bondlist:
         :return: a networkx Graph object
         :rtype: networkx.Graph
         """
+        if self.noverlay>0:
+            self._build()
         g=nx.Graph()
-        for i,n in self.B.items():
-            for j in n:
-                g.add_edge(i,j)
+        g.add_nodes_from(self.atoms())
+        g.add_edges_from(zip(self.ei.tolist(),self.ej.tolist()))
         return g
@@ -9,6 +9,11 @@
 import logging
 from copy import deepcopy
 
+def _hashable(x):
+    if isinstance(x,(list,tuple)):
+        return tuple(_hashable(y) for y in x)
+    return x
+
 class BondTemplate:
     def __init__(self,names,resnames,intraresidue,order,bystander_resnames,bystander_atomnames,oneaway_resnames,oneaway_atomnames):
         """__init__ create a BondTemplate object
@@ -58,6 +63,21 @@ class BondTemplate:
         check=check and self.oneaway_resnames==other.oneaway_resnames
         check=check and self.oneaway_atomnames==other.oneaway_atomnames
         return check
+    def _as_tuple(self,reverse=False):
+        d=-1 if reverse else 1
+        return _hashable((self.names[::d],self.resnames[::d],self.intraresidue,self.bystander_resnames[::d],self.bystander_atomnames[::d],self.oneaway_resnames[::d],self.oneaway_atomnames[::d]))
+    def key(self):
+        """key returns an orientation-normalized, hashable key for this template; a template and its reverse have the same key.
+        Like __eq__, the key ignores bond order.
+
+        :return: the key and a flag that is True if self is the reverse of the orientation used in the key
+        :rtype: tuple(tuple,bool)
+        """
+        fwd=self._as_tuple()
+        rev=self._as_tuple(reverse=True)
+        if fwd==rev or repr(fwd)<=repr(rev):
+            return fwd,False
+        return rev,True
     def is_reverse_of(self,other):
         """is_reverse_of return True if self and other are reverse of each other
 
@@ -0,0 +1,96 @@
+"""
+
+.. module:: checks
+   :synopsis: Manages the level of internal-consistency checking and keeps track of how much time the checks cost
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import logging
+import time
+from functools import wraps
+
+logger=logging.getLogger(__name__)
+
+_CHECK_LEVELS_={'off':0,'cheap':1,'full':2}
+
+level='cheap'
+timings={}
+
+def set_check_level(lvl='cheap'):
+    """set_check_level sets the global check level
+
+    :param lvl: one of 'off', 'cheap', or 'full', defaults to 'cheap'
+    :type lvl: str, optional
+    :raises Exception: if lvl is not a recognized check level
+    """
+    global level
+    if not lvl in _CHECK_LEVELS_:
+        raise Exception(f'Check level "{lvl}" not recognized; must be one of {list(_CHECK_LEVELS_.keys())}')
+    level=lvl
+    logger.debug(f'Internal consistency check level set to "{level}"')
+
+def set_check_level_from_cfg(parameters:dict):
+    """set_check_level_from_cfg sets the global check level from the 'check_level' directive
+    in the 'controls' section of the 'CURE' cfg dictionary, if present
+
+    :param parameters: cfg parameters dictionary
+    :type parameters: dict
+    """
+    lvl=parameters.get('CURE',{}).get('controls',{}).get('check_level','cheap')
+    set_check_level(lvl)
+
+def active(lvl='cheap'):
+    """active returns True if checks at level lvl should be performed under the current global check level
+
+    :param lvl: level of the check, defaults to 'cheap'
+    :type lvl: str, optional
+    :return: True if check should be performed
+    :rtype: bool
+    """
+    return _CHECK_LEVELS_[level]>=_CHECK_LEVELS_[lvl]
+
+class timed:
+    """timed context manager that accumulates the wall time spent in a named check
+    """
+    def __init__(self,name):
+        self.name=name
+    def __enter__(self):
+        self.t0=time.perf_counter()
+        return self
+    def __exit__(self,*args):
+        rec=timings.setdefault(self.name,[0,0.0])
+        rec[0]+=1
+        rec[1]+=time.perf_counter()-self.t0
+        return False
+
+def timed_check(name):
+    """timed_check decorator that accumulates the wall time spent in a check function
+
+    :param name: name under which the time is recorded
+    :type name: str
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args,**kwargs):
+            with timed(name):
+                return fn(*args,**kwargs)
+        return wrapper
+    return decorator
+
+def report(logf=logger.info):
+    """report writes the accumulated check timings using the logging function logf
+
+    :param logf: logging function, defaults to logger.info
+    :type logf: function, optional
+    """
+    if len(timings)==0: return
+    total=sum([v[1] for v in timings.values()])
+    logf(f'Consistency checks (level "{level}") took {total:.3f} s in total')
+    for name,(ncalls,secs) in sorted(timings.items(),key=lambda x: -x[1][1]):
+        logf(f'{name:>40s}: {ncalls:>7d} calls {secs:>10.3f} s')
+
+def reset_timings():
+    """reset_timings clears all accumulated check timings
+    """
+    timings.clear()
@@ -1,42 +1,270 @@
 """
 
 .. module:: command
-   :synopsis: Custom handling of calls to subprocess.Popen() 
-   
+   :synopsis: Custom handling of calls to subprocess.Popen()
+
 .. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
 
 """
+import asyncio
+import codecs
 import logging
+import os
+import re
+import shlex
+import signal
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 logger=logging.getLogger(__name__)
 
+timeout_policy={}
+"""Per-tool wall-clock limits for asynchronously run commands, keyed by executable or gmx
+subcommand name (e.g., 'mdrun', 'grompp', 'antechamber'); each value is a dict with keys
+'timeout' (seconds) and 'retries' (number of times a timed-out command is killed and rerun)"""
+
+def set_timeout_policy(parameters:dict):
+    """set_timeout_policy sets the per-tool timeout policy from the optional 'timeouts' subdirectives
+    of the 'gromacs' and 'ambertools' sections of the cfg dictionary.  Each entry is either a number
+    of seconds or a dict with 'timeout' and 'retries' keys.
+
+    :param parameters: cfg parameters dictionary
+    :type parameters: dict
+    """
+    timeout_policy.clear()
+    for section in ['gromacs','ambertools']:
+        for tool,spec in parameters.get(section,{}).get('timeouts',{}).items():
+            if type(spec)==dict:
+                timeout_policy[tool]={'timeout':spec.get('timeout',None),'retries':spec.get('retries',0)}
+            else:
+                timeout_policy[tool]={'timeout':spec,'retries':0}
+    if timeout_policy:
+        logger.debug(f'Command timeout policy {timeout_policy}')
+
+def _kill(proc):
+    """_kill kills a subprocess started in its own session, together with its process group
+
+    :param proc: the subprocess
+    :type proc: asyncio.subprocess.Process
+    """
+    try:
+        os.killpg(proc.pid,signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+_SHELL_CHARS_=set(';&|<>()`$*?~{}')
+"""Characters that, outside of plain '<' and '>' redirections, mark a command as needing a shell"""
+
+def _option_str(key,value):
+    """_option_str formats one command-line option; the value is quoted so that it is always passed
+    as a single argument, unless it is a list or tuple, whose elements are passed as separate arguments,
+    or an empty string, in which case the option is a bare flag
+
+    :param key: option name, without the leading '-'
+    :type key: str
+    :param value: option value
+    :type value: scalar, str, list, or tuple
+    :return: option string
+    :rtype: str
+    """
+    if type(value) in [list,tuple]:
+        values=[shlex.quote(str(v)) for v in value]
+    elif type(value)==str and value=='':
+        values=[]
+    else:
+        values=[shlex.quote(str(value))]
+    return ' '.join([f'-{key}']+values)
+
 class Command:
     linelen=55
+    taillen=200
     def __init__(self,command,**options):
         self.command=command
         self.options=options
-        self.c=f'{self.command} '+' '.join([f'-{k} {v}' for k,v in self.options.items()])
-        
+        self.c=f'{self.command} '+' '.join([_option_str(k,v) for k,v in self.options.items()])
+
     def run(self,override=(),ignore_codes=[],quiet=True):
         if not quiet:
             logger.debug(f'{self.c}')
         process=subprocess.Popen(self.c,shell=True,stdout=subprocess.PIPE,stderr=subprocess.PIPE,text=True)
         out,err=process.communicate()
-        if process.returncode!=0 and not process.returncode in ignore_codes:
-            logger.error(f'Returncode: {process.returncode}')
+        self._check(process.returncode,out,err,override,ignore_codes)
+        return out,err
+
+    def _check(self,returncode,out,err,override=(),ignore_codes=[]):
+        if returncode!=0 and not returncode in ignore_codes:
+            logger.error(f'Returncode: {returncode}')
             if len(out)>0:
                 logger.error('stdout buffer follows\n'+'*'*self.linelen+'\n'+out+'\n'+'*'*self.linelen)
             if len(err)>0:
                 logger.error('stderr buffer follows\n'+'*'*self.linelen+'\n'+err+'\n'+'*'*self.linelen)
-            raise subprocess.SubprocessError(f'Command "{self.c}" failed with returncode {process.returncode}')
+            raise subprocess.SubprocessError(f'Command "{self.c}" failed with returncode {returncode}')
         else:
             if len(override)==2:
                 needle,msg=override
                 if needle in out or needle in err:
-                    logger.error(f'Returncode: {process.returncode}, but another error was detected:')
+                    logger.error(f'Returncode: {returncode}, but another error was detected:')
                     logger.error(msg)
                     if len(out)>0:
                         logger.error('stdout buffer follows\n'+'*'*self.linelen+'\n'+out+'\n'+'*'*self.linelen)
                     if len(err)>0:
                         logger.error('stderr buffer follows\n'+'*'*self.linelen+'\n'+err+'\n'+'*'*self.linelen)
-        return out,err
\ No newline at end of file
+
+    def argv(self):
+        """argv splits the command into an argument vector, separating out any
+        shell-style input ('<') and output ('>') redirections
+
+        :return: argument vector, name of stdin file ('' if none), name of stdout file ('' if none)
+        :rtype: tuple(list,str,str)
+        """
+        tokens=shlex.split(self.c)
+        args,stdin,stdout=[],'',''
+        i=0
+        while i<len(tokens):
+            t=tokens[i]
+            if t=='<':
+                stdin=tokens[i+1]
+                i+=1
+            elif t=='>':
+                stdout=tokens[i+1]
+                i+=1
+            elif t!='2>&1':
+                args.append(t)
+            i+=1
+        return args,stdin,stdout
+
+    def needs_shell(self):
+        """needs_shell returns True if the command uses shell syntax that argv cannot represent, such as
+        a leading variable assignment ('OMP_NUM_THREADS=4 gmx mdrun'), command separators or pipes
+        (';', '&&', '|'), other redirections, or variable expansion; run_async runs such commands through
+        a shell
+
+        :rtype: bool
+        """
+        args,stdin,stdout=self.argv()
+        if len(args)>0 and re.match(r'^[A-Za-z_][A-Za-z0-9_]*=',args[0]):
+            return True
+        return any([len(_SHELL_CHARS_.intersection(a))>0 for a in args+[stdin,stdout]])
+
+    def tool(self):
+        """tool returns the first word of the command that names an entry in the timeout policy
+
+        :return: tool name, or '' if none of the command's words is in the policy
+        :rtype: str
+        """
+        args,stdin,stdout=self.argv()
+        for a in args:
+            if not a.startswith('-') and os.path.basename(a) in timeout_policy:
+                return os.path.basename(a)
+        return ''
+
+    async def _attempt(self,args,stdin,log,timeout):
+        """_attempt launches the command once and streams its output; if args is None, the command
+        is run through a shell
+
+        :return: returncode (None if the command timed out), stdout text, stderr text
+        :rtype: tuple
+        """
+        fin=open(stdin,'r') if stdin else subprocess.DEVNULL
+        try:
+            # own process group, so that a timed-out command is killed along with any children it spawned
+            if args is None:
+                proc=await asyncio.create_subprocess_shell(self.c,stdin=fin,stdout=asyncio.subprocess.PIPE,stderr=asyncio.subprocess.PIPE,start_new_session=True)
+            else:
+                proc=await asyncio.create_subprocess_exec(*args,stdin=fin,stdout=asyncio.subprocess.PIPE,stderr=asyncio.subprocess.PIPE,start_new_session=True)
+        finally:
+            if stdin:
+                fin.close()
+        # output is kept whole if there is no log file; otherwise only its tail is kept
+        keep=[deque(maxlen=self.taillen if log else None) for i in range(2)]
+        flog=open(log,'a') if log else None
+        async def drain(stream,store):
+            # read in blocks rather than lines; progress output may not contain newlines for a long time
+            decoder=codecs.getincrementaldecoder('utf-8')(errors='replace')
+            while True:
+                block=await stream.read(65536)
+                text=decoder.decode(block,final=(len(block)==0))
+                if text:
+                    store.append(text)
+                    if flog:
+                        flog.write(text)
+                if len(block)==0:
+                    break
+        readers=asyncio.gather(drain(proc.stdout,keep[0]),drain(proc.stderr,keep[1]))
+        try:
+            await asyncio.wait_for(asyncio.shield(proc.wait()),timeout)
+            returncode=proc.returncode
+        except asyncio.TimeoutError:
+            _kill(proc)
+            await proc.wait()
+            returncode=None
+        except BaseException:
+            # cancelled or interrupted
+            _kill(proc)
+            raise
+        finally:
+            await readers
+            if flog:
+                flog.close()
+        return returncode,''.join(keep[0]),''.join(keep[1])
+
+    async def run_async(self,override=(),ignore_codes=[],quiet=True,log='',timeout=None,retries=None):
+        """run_async runs the command as a subprocess, without a shell unless needs_shell says one is
+        required; awaiting several of these concurrently runs the commands concurrently
+
+        :param override: (needle,message) pair; message is logged if needle appears in the output, defaults to ()
+        :type override: tuple, optional
+        :param ignore_codes: nonzero return codes that are not errors, defaults to []
+        :type ignore_codes: list, optional
+        :param quiet: if False, the command is logged before it is run, defaults to True
+        :type quiet: bool, optional
+        :param log: name of file to which stdout and stderr are streamed (appended); if not given, a '>' redirection in the command is used; if neither, output is kept in memory, defaults to ''
+        :type log: str, optional
+        :param timeout: wall-clock limit in seconds, defaults to None (the tool's entry in the timeout policy, if any)
+        :type timeout: float, optional
+        :param retries: number of times a timed-out command is killed and rerun, defaults to None (the tool's entry in the timeout policy, or 0)
+        :type retries: int, optional
+        :raises subprocess.TimeoutExpired: if the command times out on every attempt
+        :raises subprocess.SubprocessError: if the command fails
+        :return: stdout and stderr (only their tails if output is streamed to a log)
+        :rtype: tuple(str,str)
+        """
+        args,stdin,stdout=self.argv()
+        if self.needs_shell():
+            # the shell does any redirection
+            logger.debug(f'Running "{self.c}" through a shell')
+            args,stdin,stdout=None,'',''
+        log=log or stdout
+        policy=timeout_policy.get(self.tool(),{})
+        if timeout is None:
+            timeout=policy.get('timeout',None)
+        if retries is None:
+            retries=policy.get('retries',0)
+        if not quiet:
+            logger.debug(f'{self.c}')
+        for attempt in range(retries+1):
+            returncode,out,err=await self._attempt(args,stdin,log,timeout)
+            if returncode is not None:
+                break
+            logger.warning(f'Command "{self.c}" exceeded {timeout} s and was killed (attempt {attempt+1} of {retries+1})')
+        else:
+            raise subprocess.TimeoutExpired(self.c,timeout,output=out,stderr=err)
+        self._check(returncode,out,err,override,ignore_codes)
+        return out,err
+
+def run_concurrently(*aws):
+    """run_concurrently runs awaitables (e.g., from Command.run_async) concurrently from synchronous code;
+    if it is called while an event loop is already running in this thread (e.g., in a notebook), they
+    are run in a new event loop in a worker thread, and this call blocks until they finish
+
+    :return: list of their results, in order
+    :rtype: list
+    """
+    async def _gather():
+        return await asyncio.gather(*aws)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_gather())
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run,_gather()).result()
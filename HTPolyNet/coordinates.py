@@ -12,7 +12,8 @@ import numpy as np
 from io import StringIO
 import os
 import logging
-from itertools import product
+import importlib.util
+from itertools import product, chain
 
 from HTPolyNet.bondlist import Bondlist
 from HTPolyNet.linkcell import Linkcell
@@ -37,6 +38,52 @@ GRX_ATTRIBUTES     =[  'z','nreactions','reactantName','sea_idx','bondchain','bo
 GRX_GLOBALLY_UNIQUE=[False,       False,         False,     True,  True,      False,      True,          False]
 GRX_UNSET_DEFAULTS =[    0,           0,       'UNSET',       -1,    -1,          -1,       -1,        'UNSET']
 
+_GRX_FORMATS_=['npz','parquet','text']
+_GRO_WRITE_CHUNK_=100000
+"""Number of atom records formatted and written at a time by write_gro"""
+grx_format='text'
+"""Format used when writing atom-attribute (grx) files; any format can be read regardless of this setting"""
+
+def set_grx_format(fmt='text'):
+    """set_grx_format sets the format used to write atom-attribute (grx) files
+
+    :param fmt: one of 'text', 'npz' (numpy binary), or 'parquet' (requires pyarrow; npz is used if it is not available), defaults to 'text'
+    :type fmt: str, optional
+    :raises Exception: if fmt is not a recognized format
+    """
+    global grx_format
+    if not fmt in _GRX_FORMATS_:
+        raise Exception(f'GRX format "{fmt}" not recognized; must be one of {_GRX_FORMATS_}')
+    if fmt=='parquet' and importlib.util.find_spec('pyarrow') is None:
+        logger.debug(f'pyarrow is not available; GRX files will be written in npz format')
+        fmt='npz'
+    grx_format=fmt
+
+def set_grx_format_from_cfg(parameters:dict):
+    """set_grx_format_from_cfg sets the grx file format from the 'grx_format' directive in the 'controls'
+    section of the 'CURE' cfg dictionary, if present; text is used otherwise
+
+    :param parameters: cfg parameters dictionary
+    :type parameters: dict
+    """
+    set_grx_format(parameters.get('CURE',{}).get('controls',{}).get('grx_format','text'))
+
+def _grx_file_format(filename):
+    """_grx_file_format identifies the format of an existing atom-attribute file from its leading bytes
+
+    :param filename: name of file
+    :type filename: str
+    :return: 'npz', 'parquet', or 'text'
+    :rtype: str
+    """
+    with open(filename,'rb') as f:
+        magic=f.read(4)
+    if magic==b'PK\x03\x04':
+        return 'npz'
+    if magic==b'PAR1':
+        return 'parquet'
+    return 'text'
+
 def dfrotate(df:pd.DataFrame,R):
     """dfrotate applies rotation matrix R to coordinates in dataframe
 
@@ -50,6 +97,83 @@ def dfrotate(df:pd.DataFrame,R):
         newri=np.matmul(R,ri)
         df.loc[i,'posX':'posZ']=newri
 
+def minimum_image(D,box,pbc=[1,1,1]):
+    """minimum_image applies the minimum image convention to one or more displacement vectors
+
+    The rows of box are the box vectors, as read from a Gromacs gro file.  For an
+    orthorhombic box each component is shifted by an integer number of box lengths; for a
+    triclinic box the displacements are first reduced along the third, second, and first
+    box vectors in turn and then compared against the neighboring images to find the
+    shortest one.  Dimensions whose pbc flag is zero, or whose box length is zero, are not shifted.
+
+    :param D: displacement vector(s)
+    :type D: np.ndarray((3,) or (N,3),float)
+    :param box: box vectors as rows
+    :type box: np.ndarray((3,3),float)
+    :param pbc: periodic boundary condition flags, one per dimension, defaults to [1,1,1]
+    :type pbc: list, optional
+    :return: minimum-image displacement vector(s), same shape as D
+    :rtype: np.ndarray
+    """
+    D=np.array(D,dtype=float)
+    single=(D.ndim==1)
+    D=np.atleast_2d(D)
+    box=np.asarray(box,dtype=float)
+    L=box.diagonal()
+    per=np.asarray(pbc,dtype=bool)&(L>0)
+    if not np.any(per):
+        return D[0] if single else D
+    if np.count_nonzero(box-np.diag(L))==0:
+        D[:,per]-=L[per]*np.round(D[:,per]/L[per])
+    else:
+        V=box*per[:,np.newaxis]
+        for c in [2,1,0]:
+            if per[c]:
+                D-=np.outer(np.round(D[:,c]/L[c]),V[c])
+        # the sequential reduction is not guaranteed to find the shortest image in strongly skewed boxes
+        shifts=np.array(list(product([-1,0,1],repeat=3)))@V
+        cand=D[:,np.newaxis,:]+shifts[np.newaxis,:,:]
+        best=np.argmin((cand*cand).sum(axis=2),axis=1)
+        D=cand[np.arange(D.shape[0]),best]
+    return D[0] if single else D
+
+def wrap_positions(P,box):
+    """wrap_positions wraps one or more points into the central periodic image defined by the box diagonal
+
+    :param P: point(s)
+    :type P: np.ndarray((3,) or (N,3),float)
+    :param box: box vectors as rows
+    :type box: np.ndarray((3,3),float)
+    :return: a tuple containing (1) the wrapped point(s) and (2) the number of box lengths added to each coordinate to wrap it
+    :rtype: tuple
+    """
+    R=np.array(P,dtype=float)
+    L=np.asarray(box,dtype=float).diagonal()
+    per=L>0
+    n=np.zeros(R.shape,dtype=int)
+    n[...,per]=-np.floor(R[...,per]/L[per]).astype(int)
+    R[...,per]+=n[...,per]*L[per]
+    # guard against roundoff leaving a coordinate exactly on the upper face
+    over=(R>=L)&per
+    R[over]-=np.broadcast_to(L,R.shape)[over]
+    n[over]-=1
+    return R,n
+
+def _fixed_width_fields(lines,spans):
+    """_fixed_width_fields extracts fixed-width fields from an array of byte strings
+
+    :param lines: lines of text
+    :type lines: numpy.ndarray of bytes
+    :param spans: (start,end) character positions of each field
+    :type spans: list of tuples
+    :return: one array of byte strings per field; fields beyond the end of a line are empty
+    :rtype: list of numpy.ndarray
+    """
+    n=len(lines)
+    width=max(lines.dtype.itemsize,max([e for b,e in spans]))
+    M=lines.astype(f'S{width}').view('S1').reshape(n,width)
+    return [np.ascontiguousarray(M[:,b:e]).view(f'S{e-b}').ravel() for b,e in spans]
+
 class Coordinates:
     """ Handles atom coordinates.
 
@@ -99,7 +223,7 @@ class Coordinates:
         
     @classmethod
     def read_gro(cls,filename,wrap_coords=True):
-        """read_gro Read a Gromacs gro file
+        """read_gro Read a Gromacs gro file; the atom records are decoded as fixed-width fields of a byte array
 
         :param filename: name of gro file
         :type filename: str
@@ -108,60 +232,45 @@ class Coordinates:
         """
         inst=cls(filename)
         if filename!='':
-            with open(filename,'r') as f:
-                data=f.read().split('\n')
-                while '' in data:
-                    data.remove('')
-                inst.name=data[0]
-                inst.N=int(data[1])
-                inst.metadat['N']=inst.N
-                series={k:[] for k in cls.gro_attributes}
-                lc_globalIdx=1
-                for x in data[2:-1]:
-                    series['resNum'].append(int(x[0:5].strip()))
-                    series['resName'].append(x[5:10].strip())
-                    series['atomName'].append(x[10:15].strip())
-                    ''' if formatted correctly, globalIdx is row index + 1 always! '''
-                    series['globalIdx'].append(lc_globalIdx)
-                    lc_globalIdx+=1
-                    # split won't work since sometimes there might be no spaces
-                    # "%5d%-5s%5s%5d%8.3f%8.3f%8.3f%8.4f%8.4f%8.4f"
-                    #numbers=list(map(float,[y.strip() for y in x[20:].split()]))
-                    numbers=list(map(float,[x[20+8*i:20+8*(i+1)] for i in range(0,3)]))
-                    if len(x)>44:
-                        numbers.extend(list(map(float,[x[44+8*i:44+8*(i+1)] for i in range(0,3)])))
-                    series['posX'].append(numbers[0])
-                    series['posY'].append(numbers[1])
-                    series['posZ'].append(numbers[2])
-                    if len(numbers)==6:
-                        series['velX'].append(numbers[3])
-                        series['velY'].append(numbers[4])
-                        series['velZ'].append(numbers[5])
-                if len(series['velX'])==0:
-                    del series['velX']
-                    del series['velY']
-                    del series['velZ']
-                assert inst.N==len(series['globalIdx']), f'Atom count mismatch inside {filename}'
-                # for k,v in series.items():
-                #     logger.debug(f'in coordinates.read_gro: {k} has {len(v)} items.')
-                inst.A=pd.DataFrame(series)
-                boxdataline=data[-1]
-                boxdata=list(map(float,boxdataline.split()))
-                # logger.debug(f'boxdata {boxdata}')
-                inst.box[0][0]=boxdata[0]
-                inst.box[1][1]=boxdata[1]
-                inst.box[2][2]=boxdata[2]
-                # logger.debug(f'box: {inst.box}')
-                if len(boxdata)==9:
-                    inst.box[0][1],inst.box[0][2],inst.box[1][0],inst.box[1][2],inst.box[2][0],inst.box[2][1]=boxdata[3:]
+            with open(filename,'rb') as f:
+                data=[x for x in f.read().replace(b'\r\n',b'\n').split(b'\n') if x!=b'']
+            inst.name=data[0].decode()
+            inst.N=int(data[1])
+            inst.metadat['N']=inst.N
+            # "%5d%-5s%5s%5d%8.3f%8.3f%8.3f%8.4f%8.4f%8.4f"
+            # split won't work since sometimes there might be no spaces
+            atomlines=np.array(data[2:-1],dtype=bytes)
+            assert inst.N==len(atomlines), f'Atom count mismatch inside {filename}'
+            # velocities are present if the atom records extend past the position fields;
+            # either all records have them or none do
+            vel=np.char.str_len(np.char.rstrip(atomlines))>44
+            has_vel=len(atomlines)>0 and bool(vel[0])
+            if (vel!=has_vel).any():
+                bad=np.flatnonzero(vel!=has_vel)
+                raise Exception(f'Error: {filename} mixes atom records with and without velocities; line 3 {"has" if has_vel else "does not have"} them but line(s) {(bad+3).tolist()[:10]} {"do not" if has_vel else "do"}')
+            spans=[(0,5),(5,10),(10,15),(20,28),(28,36),(36,44)]
+            if has_vel:
+                spans.extend([(44,52),(52,60),(60,68)])
+            fields=_fixed_width_fields(atomlines,spans)
+            series={}
+            series['resNum']=fields[0].astype(int)
+            series['resName']=np.char.strip(fields[1]).astype(str).astype(object)
+            series['atomName']=np.char.strip(fields[2]).astype(str).astype(object)
+            ''' if formatted correctly, globalIdx is row index + 1 always! '''
+            series['globalIdx']=np.arange(1,len(atomlines)+1)
+            for k,fld in zip(['posX','posY','posZ','velX','velY','velZ'],fields[3:]):
+                series[k]=fld.astype(float)
+            inst.A=pd.DataFrame(series)
+            boxdataline=data[-1].decode()
+            boxdata=list(map(float,boxdataline.split()))
+            inst.box[0][0]=boxdata[0]
+            inst.box[1][1]=boxdata[1]
+            inst.box[2][2]=boxdata[2]
+            if len(boxdata)==9:
+                inst.box[0][1],inst.box[0][2],inst.box[1][0],inst.box[1][2],inst.box[2][0],inst.box[2][1]=boxdata[3:]
         inst.empty=False
-        # logger.debug(f'{inst.checkbox()}')
-        # logger.debug('Box vectors:')
-        # for ln in str(inst.box).split('\n'):
-        #     logger.debug(ln)
         if wrap_coords:
             inst.wrap_coords()
-        # logger.debug(inst.A.dtypes)
         return inst
 
     @classmethod
@@ -349,7 +458,7 @@ class Coordinates:
         CC=np.array(C[['posX','posY','posZ']])
         # get both atoms in bond into CPI
         # get all atoms in ring into CPI (but not necessarily wrt bond)
-        CC[1:]=np.array([self.unwrap(c,CC[0],pbc) for c in CC[1:]])
+        CC[1:]=CC[0]-self.mic(CC[0]-CC[1:],pbc)
         BC[0]=self.unwrap(BC[0],CC[0],pbc)
         BC[1]=self.unwrap(BC[1],BC[0],pbc)
         B[['posX','posY','posZ']]=BC
@@ -435,24 +544,16 @@ class Coordinates:
         return np.sqrt(Rij.dot(Rij))
 
     def mic(self,r,pbc):
-        """mic applies minimum image convention to displacement vector r
-
-        :param r: displacement vector
-        :type r: np.ndarray(3,float)
-        :param pbc: periodic boundary condition 
-        :type pbc: _type_
-        :return: _description_
-        :rtype: _type_
+        """mic applies minimum image convention to displacement vector(s) r
+
+        :param r: displacement vector(s)
+        :type r: np.ndarray((3,) or (N,3),float)
+        :param pbc: periodic boundary condition flags, one per dimension
+        :type pbc: list
+        :return: minimum-image displacement vector(s)
+        :rtype: np.ndarray
         """
-        '''  '''
-        for c in range(0,3):
-            if pbc[c]:
-                hbx=self.box[c][c]/2
-                while r[c]<-hbx:
-                    r[c]+=self.box[c][c]
-                while r[c]>hbx:
-                    r[c]-=self.box[c][c]
-        return r
+        return minimum_image(r,self.box,pbc)
 
     def wrap_point(self,ri):
         """wrap_point wraps point ri into the central periodic image
@@ -462,32 +563,17 @@ class Coordinates:
         :return: a tuple containing (1) the wrapped point and (2) number of box lengths required to wrap this point, per dimension
         :rtype: tuple
         """
-        R=ri.copy()
-        box_lengths=np.array([0,0,0],dtype=int)
-        for i in range(3):
-            while R[i]<0:
-                R[i]+=self.box[i][i]
-                box_lengths[i]+=1
-            while R[i]>=self.box[i][i]:
-                R[i]-=self.box[i][i]
-                box_lengths[i]-=1
-        return R,box_lengths
+        return wrap_positions(ri,self.box)
 
     def wrap_coords(self):
         """wrap_coords Wraps all atomic coordinates into box
         """
         assert np.any(self.box),f'Cannot wrap if boxsize is not set: {self.box}'
-        sp=self.A[['posX','posY','posZ']]
-        boxL=[]
-        for i,srow in sp.iterrows():
-            p,box_lengths=self.wrap_point(srow.values)
-            self.A.loc[i,'posX':'posZ']=p
-            boxL.append(box_lengths)
-        boxL=np.array(boxL)
+        R,boxL=wrap_positions(self.A[['posX','posY','posZ']].to_numpy(dtype=float),self.box)
+        self.A[['posX','posY','posZ']]=R
         self.A['boxLx']=boxL[:,0]
         self.A['boxLy']=boxL[:,1]
         self.A['boxLz']=boxL[:,2]
-        # logger.debug(f'Wrapped {self._nwrap}/{self.A.shape[0]*3} coordinates.')
 
     def merge(self,other):
         """merge Merge two Coordinates objects
@@ -526,28 +612,56 @@ class Coordinates:
         
         return (idxshift,bdxshift,rdxshift)
             
-    def write_atomset_attributes(self,attributes,filename,formatters=[]):
+    def write_atomset_attributes(self,attributes,filename,formatters=[],fmt=None):
         """write_atomset_attributes Writes atom attributes to a file
 
         :param attributes: List of attribute names to write
         :type attributes: list, optional
         :param filename: Name of file to write
         :type filename: str
-        :param formatters: formatting methods per attribute, defaults to []
+        :param formatters: formatting methods per attribute (text format only), defaults to []
         :type formatters: list
+        :param fmt: file format, defaults to None (use the module-wide grx_format; 'text' if formatters are given); an npz file is written as text instead if any object column holds values that are not strings
+        :type fmt: str, optional
         :raises Exception: All items in attributes must exist in the coordinates dataframe
         """
         for a in attributes:
             if not a in self.A.columns:
                 raise Exception(f'There is no column "{a}" in this atoms dataframe')
-        with open(filename,'w') as f:
-            if len(formatters)>0:
-                f.write(self.A[['globalIdx']+attributes].to_string(header=True,index=False,formatters=formatters)+'\n')
-            else:
-                f.write(self.A[['globalIdx']+attributes].to_string(header=True,index=False)+'\n')
+        if fmt is None:
+            fmt='text' if len(formatters)>0 else grx_format
+        df=self.A[['globalIdx']+attributes]
+        if fmt=='npz':
+            mixed=[c for c in df.columns if df[c].dtype==object and not pd.api.types.infer_dtype(df[c],skipna=True) in ['string','empty']]
+            if len(mixed)>0:
+                logger.debug(f'Columns {mixed} hold values that are not strings; writing {filename} in text format')
+                fmt='text'
+        if fmt=='npz':
+            # strings are stored as fixed-width unicode so that no pickling is needed to read them back;
+            # each string column has a mask of its null entries
+            arrays={}
+            for c in df.columns:
+                if df[c].dtype==object:
+                    null=df[c].isna().to_numpy()
+                    arrays[c]=df[c].where(~null,'').to_numpy(dtype=str)
+                    arrays[f'_null_{c}']=null
+                else:
+                    arrays[c]=df[c].to_numpy()
+            with open(filename,'wb') as f:
+                np.savez(f,_columns_=np.array(list(df.columns)),**arrays)
+        elif fmt=='parquet':
+            df.to_parquet(filename,index=False)
+        else:
+            with open(filename,'w') as f:
+                if len(formatters)>0:
+                    f.write(df.to_string(header=True,index=False,formatters=formatters)+'\n')
+                else:
+                    f.write(df.to_string(header=True,index=False)+'\n')
 
     def read_atomset_attributes(self,filename,attributes=[]):
-        """Reads atomic attributes from input file
+        """Reads atomic attributes from input file; the file may be text, npz, or parquet.
+        If the file's atoms are the same as and in the same order as those in self.A,
+        the attributes are assigned column-wise; otherwise they are merged in on globalIdx.
 
         :param filename: name of file
         :type filename: str
@@ -555,19 +669,40 @@ class Coordinates:
         :type attributes: list, optional
         """
         assert os.path.exists(filename),f'Error: {filename} not found'
+        fmt=_grx_file_format(filename)
+        if fmt=='npz':
+            with np.load(filename,allow_pickle=False) as z:
+                columns=z['_columns_'].tolist()
+                series={}
+                for c in columns:
+                    series[c]=z[c]
+                    if z[c].dtype.kind=='U':
+                        series[c]=z[c].astype(object)
+                        if f'_null_{c}' in z:
+                            series[c][z[f'_null_{c}']]=np.nan
+                df=pd.DataFrame(series)
+        elif fmt=='parquet':
+            df=pd.read_parquet(filename)
         # if no particular attributes are asked for, read them all in
         if len(attributes)==0:
-            df=pd.read_csv(filename,sep='\s+',header=0)
+            if fmt=='text':
+                df=pd.read_csv(filename,sep=r'\s+',header=0)
             assert 'globalIdx' in df,f'Error: {filename} does not have a \'globalIdx\' column'
             attributes_read=list(df.columns)
             attributes_read.remove('globalIdx')
         else:
-            df=pd.read_csv(filename,sep='\s+',names=['globalIdx']+attributes,header=0)
+            if fmt=='text':
+                df=pd.read_csv(filename,sep=r'\s+',names=['globalIdx']+attributes,header=0)
+            else:
+                # like the text reader, take the columns positionally under the requested names
+                df=df.iloc[:,:len(attributes)+1].copy()
+                df.columns=['globalIdx']+attributes
             attributes_read=attributes
-            # logger.debug(f'Read from {filename}\n{df.head().to_string()}')
-        # logger.debug(f'Merge:\n{self.A.head().to_string()}\nand\n{df.head().to_string()}')
-        self.A=self.A.merge(df,how='outer',on='globalIdx')
-        # logger.debug(f'Result:\n{self.A.head().to_string()}')
+        if df.shape[0]==self.A.shape[0] and np.array_equal(df['globalIdx'].to_numpy(),self.A['globalIdx'].to_numpy()):
+            for a in attributes_read:
+                self.A[a]=df[a].to_numpy()
+        else:
+            self.A=self.A.merge(df,how='outer',on='globalIdx')
         return attributes_read
 
     def set_atomset_attribute(self,attribute,srs):
@@ -862,13 +997,13 @@ class Coordinates:
         :return: list of global atom indices to delete
         :rtype: list
         """
+        implicit=[i for i in range(len(pairs)) if not i in explicit_sacH]
+        exclude=[h for v in explicit_sacH.values() for h in v]
+        picks=self.sacH_many([pairs[i][:2] for i in implicit],T,rename=rename,exclude=exclude)
+        picks=dict(zip(implicit,picks))
         idx_to_delete=[]
-        for i,b in enumerate(pairs):
-            if not i in explicit_sacH:
-                ai,aj,o=b
-                idx_to_delete.extend(self.sacH(ai,aj,T,rename=rename))
-            else:
-                idx_to_delete.extend(explicit_sacH[i])
+        for i in range(len(pairs)):
+            idx_to_delete.extend(picks[i] if i in picks else explicit_sacH[i])
         return idx_to_delete
 
     def sacH(self,ai,aj,T,rename=False):
@@ -885,47 +1020,89 @@ class Coordinates:
         :return: global indexes of two H atoms
         :rtype: list
         """
-        bondlist=T.bondlist
-        i_partners=bondlist.partners_of(ai)
-        j_partners=bondlist.partners_of(aj)
-        i_Hpartners={k:v for k,v in zip(i_partners,[self.A[self.A['globalIdx']==i]['atomName'].values[0] for i in i_partners]) if v.startswith('H')}
-        j_Hpartners={k:v for k,v in zip(j_partners,[self.A[self.A['globalIdx']==i]['atomName'].values[0] for i in j_partners]) if v.startswith('H')}
-        assert len(i_Hpartners)>0,f'Error: atom {ai} does not have a deletable H atom!'
-        assert len(j_Hpartners)>0,f'Error: atom {aj} does not have a deletable H atom!'
-        minHH=(1.e9,-1,-1)
-        for ih in i_Hpartners:
-            RiH=self.get_R(ih)
-            for jh in j_Hpartners:
-                RjH=self.get_R(jh)
-                RijH=RiH-RjH
-                rijh=np.sqrt(RijH.dot(RijH))
-                if rijh<minHH[0]:
-                    minHH=(rijh,ih,jh)
-        ''' rename remaining H atoms '''
+        return self.sacH_many([(ai,aj)],T,rename=rename)[0]
+
+    def sacH_many(self,bonds,T,rename=False,exclude=[]):
+        """sacH_many for each bond (ai,aj), finds the two H's, one bound to ai, the other to aj, that are closest
+        to each other under the minimum-image convention; no H is chosen for more than one bond
+
+        :param bonds: list of (ai,aj) global atom index pairs
+        :type bonds: list
+        :param T: global topology
+        :type T: Topology
+        :param rename: whether to rename remaining H atoms bound to bond atoms so that it appears highest-sorted by name atoms are found, defaults to False
+        :type rename: bool, optional
+        :param exclude: global indices of H atoms that may not be chosen, defaults to []
+        :type exclude: list, optional
+        :return: list of [iH,jH] global index pairs, one per bond
+        :rtype: list
+        """
+        bonds=np.asarray(bonds,dtype=int).reshape(-1,2)
+        nb=bonds.shape[0]
+        if nb==0: return []
+        rowof=pd.Index(self.A['globalIdx'])
+        names=self.A['atomName'].to_numpy()
+        excluded=np.asarray(list(exclude),dtype=int)
+        side=[]
+        for s in [0,1]:
+            b,h=T.bondlist.partners_of_many(bonds[:,s],positions=True)
+            keep=np.char.startswith(names[rowof.get_indexer(h)].astype(str),'H')&~np.isin(h,excluded)
+            b,h=b[keep],h[keep]
+            nH=np.bincount(b,minlength=nb)
+            assert (nH>0).all(),f'Error: atom(s) {bonds[nH==0,s].tolist()} do not have a deletable H atom!'
+            side.append(pd.DataFrame({'b':b,f'h{s}':h}))
+        # all candidate H-H pairs of all bonds, ordered by bond then by distance
+        c=side[0].merge(side[1],on='b',how='inner')
+        P=self.A[['posX','posY','posZ']].to_numpy()
+        D=P[rowof.get_indexer(c['h0'])]-P[rowof.get_indexer(c['h1'])]
+        D=minimum_image(D,self.box)
+        dist=np.sqrt((D*D).sum(axis=1))
+        order=np.lexsort((dist,c['b'].to_numpy()))
+        cb,ih,jh=c['b'].to_numpy()[order],c['h0'].to_numpy()[order],c['h1'].to_numpy()[order]
+        first=np.searchsorted(cb,np.arange(nb))
+        picks=np.stack((ih[first],jh[first]),axis=1)
+        if len(np.unique(picks))<2*nb:
+            # some H's are closest for more than one bond; choose greedily in bond order
+            last=np.searchsorted(cb,np.arange(nb),side='right')
+            used=set()
+            for k in range(nb):
+                for n in range(first[k],last[k]):
+                    if not ih[n] in used and not jh[n] in used:
+                        picks[k]=[ih[n],jh[n]]
+                        used.update([ih[n],jh[n]])
+                        break
+                else:
+                    raise Exception(f'Error: no unclaimed sacrificial H pair for bond {bonds[k].tolist()}')
         if rename:
-            # reverse sort names of hydrogen ligands by their number
-            i_avails=list(sorted(i_Hpartners.values(),key=lambda x: int(x.split('H')[1] if x.split('H')[1]!='' else '0')))[:-1]
-            j_avails=list(sorted(j_Hpartners.values(),key=lambda x: int(x.split('H')[1] if x.split('H')[1]!='' else '0')))[:-1]
-            logger.debug(f'i_avails {i_avails}')
-            logger.debug(f'j_avails {j_avails}')
-            # remove the globalIdx of the sacrificial H's from their atom's dictionaries of H-atoms
-            del i_Hpartners[ih]
-            del j_Hpartners[jh]
-            Top=T.D['atoms']
-            Cor=self.A
-            # for all remaining H neighbor globalIdx of each atom, rename starting from lowest number
-            for h in i_Hpartners:
-                i_Hpartners[h]=i_avails.pop(0)
-                Top.iloc[h-1,Top.columns=='atom']=i_Hpartners[h]
-                Cor.iloc[h-1,Cor.columns=='atomName']=i_Hpartners[h]
-                logger.debug(f'i: changed name of {h} to {i_Hpartners[h]}')
-            for h in j_Hpartners:
-                j_Hpartners[h]=j_avails.pop(0)
-                Top.iloc[h-1,Top.columns=='atom']=j_Hpartners[h]
-                Cor.iloc[h-1,Cor.columns=='atomName']=j_Hpartners[h]
-                logger.debug(f'j: changed name of {h} to {j_Hpartners[h]}')
-        # this makes sure that it always looks like the same atom was deleted
-        return [ih,jh] # return the globalIdx's of the two sacrificial H's
+            self._rename_remaining_H(bonds,picks,T)
+        return [[int(x) for x in p] for p in picks]
+
+    def _rename_remaining_H(self,bonds,picks,T):
+        """_rename_remaining_H renames the H atoms that remain bound to each bond atom after its sacrificial H's are removed,
+        so that they take the lowest-numbered names among that atom's H's
+
+        :param bonds: array of (ai,aj) global atom index pairs
+        :type bonds: numpy.ndarray
+        :param picks: array of sacrificial (iH,jH) global atom index pairs, parallel to bonds
+        :type picks: numpy.ndarray
+        :param T: global topology
+        :type T: Topology
+        """
+        rowof=pd.Index(self.A['globalIdx'])
+        names=self.A['atomName'].to_numpy()
+        doomed=set(picks.ravel().tolist())
+        Hidx=[]
+        Hnames=[]
+        for a in np.unique(bonds):
+            Hs=[h for h in T.bondlist.partners_of(a) if names[rowof.get_loc(h)].startswith('H')]
+            avails=sorted([names[rowof.get_loc(h)] for h in Hs],key=lambda x: int(x.split('H')[1] if x.split('H')[1]!='' else '0'))
+            remaining=[h for h in Hs if not h in doomed]
+            Hidx.extend(remaining)
+            Hnames.extend(avails[:len(remaining)])
+            logger.debug(f'{a}: renaming H atoms {remaining} to {avails[:len(remaining)]}')
+        self.A.iloc[rowof.get_indexer(Hidx),self.A.columns.get_loc('atomName')]=Hnames
+        Top=T.D['atoms']
+        Top.iloc[pd.Index(Top['nr']).get_indexer(Hidx),Top.columns.get_loc('atom')]=Hnames
 
     def delete_atoms(self,idx=[],reindex=True):
         """delete_atoms Deletes atoms whose global indices appear in the list idx.
@@ -938,31 +1115,22 @@ class Coordinates:
         :param reindex: reindex remaining atoms, defaults to True
         :type reindex: bool, optional
         """
-        # logger.debug(f'Coordinates:delete_atoms {idx}')
         adf=self.A
-        indexes_to_drop=adf[adf.globalIdx.isin(idx)].index
-        indexes_to_keep=set(range(adf.shape[0]))-set(indexes_to_drop)
-        self.A=adf.take(list(indexes_to_keep)).reset_index(drop=True)
+        keep,lookup=idx_lookup(adf['globalIdx'].to_numpy(),list(idx))
+        self.A=adf.loc[keep].reset_index(drop=True)
         if reindex:
-            adf=self.A
-            oldGI=adf['globalIdx'].copy()
-            adf['globalIdx']=adf.index+1
-            mapper={k:v for k,v in zip(oldGI,adf['globalIdx'])}
+            self.A['globalIdx']=lookup[self.A['globalIdx'].to_numpy()]
         self.N-=len(idx)
         ''' delete appropriate bonds '''
         if not self.mol2_bonds.empty:
-            d=self.mol2_bonds
-            indexes_to_drop=d[(d.ai.isin(idx))|(d.aj.isin(idx))].index
-            indexes_to_keep=set(range(d.shape[0]))-set(indexes_to_drop)
-            self.mol2_bonds=d.take(list(indexes_to_keep)).reset_index(drop=True)
+            self.mol2_bonds,ndrop=drop_rows_with_idx(self.mol2_bonds,['ai','aj'],list(idx))
             if reindex:
                 d=self.mol2_bonds
-                d.ai=d.ai.map(mapper)
-                d.aj=d.aj.map(mapper)
-                d.bondIdx=d.index+1
+                remap_idx_columns(d,['ai','aj'],lookup)
+                d['bondIdx']=d.index+1
             if 'nBonds' in self.metadat:
                 self.metadat['nBonds']=len(self.mol2_bonds)
-            self.bondlist=Bondlist.fromDataFrame(self.mol2_bonds)
+            self.mol2_bondlist=Bondlist.fromDataFrame(self.mol2_bonds)
 
     def write_gro(self,filename,grotitle=''):
         """write_gro Write coordinates and if present, velocities, to a Gromacs-format coordinate file
@@ -972,33 +1140,35 @@ class Coordinates:
         """
         title=self.name if not grotitle else grotitle
         has_vel='velX' in self.A.columns
+        # C-format: “%5i%5s%5s%5i%8.3f%8.3f%8.3f%8.4f%8.4f%8.4f”
+        # Note that the gro atom number is not used; gromacs assigns atom indicies based
+        # on counting input lines!  We will wrap the index so that it only has 5 digits.
+        # Each column is converted once and the atom block is formatted and written in
+        # chunks of rows, each by a single %-operation, rather than row by row.
+        attr=self.gro_attributes if has_vel else self.gro_attributes[:-3]
+        fmt='%5d%-5s%5s%5d'+'%8.3f'*3+('%8.4f'*3 if has_vel else '')+'\n'
+        cols=[self.A['resNum'].to_numpy(dtype=int)%100000,
+              self.A['resName'].astype(str).to_numpy(),
+              self.A['atomName'].astype(str).to_numpy(),
+              self.A['globalIdx'].to_numpy(dtype=int)%100000]
+        cols+=[self.A[k].to_numpy(dtype=float) for k in attr[4:]]
+        n=len(self.A)
+        if not np.any(self.box):
+            logger.debug('Writing Gromacs coordinates file but boxsize is not set.')
+        boxline=f'{self.box[0][0]:10.5f}{self.box[1][1]:10.5f}{self.box[2][2]:10.5f}'
+        # output off-diagonals only if at least one of them is non-zero
+        x,y=self.box.nonzero()
+        if not all(x==y):
+            boxline+=f'{self.box[0][1]:10.5f}{self.box[0][2]:10.5f}'
+            boxline+=f'{self.box[1][0]:10.5f}{self.box[1][2]:10.5f}'
+            boxline+=f'{self.box[2][0]:10.5f}{self.box[2][1]:10.5f}'
+        # unfortunately, DataFrame.to_string() can't write fields with zero whitespace
         with open(filename,'w') as f:
-            f.write(title+'\n')
-            f.write(f'{self.N:>5d}\n')
-            # C-format: “%5i%5s%5s%5i%8.3f%8.3f%8.3f%8.4f%8.4f%8.4f”
-            # Note that the gro atom number is not used; gromacs assigns atom indicies based
-            # on counting input lines!  We will wrap the index so that it only has 5 digits.
-            atomformatters = [
-                lambda x: f'{x:>5d}',
-                lambda x: f'{x:<5s}',
-                lambda x: f'{x:>5s}',
-                lambda x: f'{x%10000:5d}']+[lambda x: f'{x:8.3f}']*3 + [lambda x: f'{x:8.4f}']*3
-            # unfortunately, DataFrame.to_string() can't write fields with zero whitespace
-            for i,r in self.A.iterrows():
-                if has_vel:
-                    f.write(''.join([atomformatters[i](v) for i,v in enumerate(list(r[self.gro_attributes]))])+'\n')
-                else:
-                    f.write(''.join([atomformatters[i](v) for i,v in enumerate(list(r[self.gro_attributes[:-3]]))])+'\n')
-            if not np.any(self.box):
-                logger.debug('Writing Gromacs coordinates file but boxsize is not set.')
-            f.write(f'{self.box[0][0]:10.5f}{self.box[1][1]:10.5f}{self.box[2][2]:10.5f}')
-            # output off-diagonals only if at least one of them is non-zero
-            x,y=self.box.nonzero()
-            if not all(x==y):
-                f.write(f'{self.box[0][1]:10.5f}{self.box[0][2]:10.5f}')
-                f.write(f'{self.box[1][0]:10.5f}{self.box[1][2]:10.5f}')
-                f.write(f'{self.box[2][0]:10.5f}{self.box[2][1]:10.5f}')
-            f.write('\n')
+            f.write(f'{title}\n{self.N:>5d}\n')
+            for b in range(0,n,_GRO_WRITE_CHUNK_):
+                chunk=[c[b:b+_GRO_WRITE_CHUNK_].tolist() for c in cols]
+                f.write((fmt*len(chunk[0]))%tuple(chain.from_iterable(zip(*chunk))))
+            f.write(boxline+'\n')
 
     def write_mol2(self,filename,bondsDF=pd.DataFrame(),molname='',other_attributes=pd.DataFrame()):
         """write_mol2 Write a mol2-format file from coordinates, and optionally, a bonds DataFrame
@@ -124,7 +124,10 @@ class CureController:
             'max_iterations': 100,
             'desired_conversion': 0.5,
             'min_allowable_bondcycle_length':-1, # not set
-            'ncpu' : os.cpu_count()
+            'ncpu' : os.cpu_count(),
+            'check_level': 'cheap', # off, cheap, or full
+            'grx_format': 'text', # text, npz, or parquet
+            'max_ring_size': 0 # largest ring tracked as new bonds form; 0 (default) disables
         },
         'drag': {
             'limit': 0.0,
@@ -193,7 +196,7 @@ class CureController:
         st.max_radidx=int((st.max_search_radius-d['search_radius'])/d['radial_increment'])
 
     @cp.enableCheckpoint
-    def do_iter(self,TC:TopoCoord,RL:ReactionList,MD:MoleculeDict,gromacs_dict={}):
+    def do_iter(self,TC:TopoCoord,RL:ReactionList,MD:MoleculeDict,gromacs_dict={},template_index=None):
         """do_iter performs one CURE iteration
 
         :param TC: TopoCoord object; all topological and coordinate information is in here
@@ -204,6 +207,8 @@ class CureController:
         :type MD: MoleculeDict
         :param gromacs_dict: dictionary of custom gromacs parameters, defaults to {}
         :type gromacs_dict: dict, optional
+        :param template_index: bond template index of MD, from topocoord.build_template_index, defaults to None
+        :type template_index: dict, optional
         :return: dictionary of resulting output file names
         :rtype: dict
         """
@@ -212,7 +217,7 @@ class CureController:
         self.state.step=cure_step.cure_bondsearch
         self._do_bondsearch(TC,RL,MD)
         self._do_preupdate_dragging(TC,gromacs_dict)
-        self._do_topology_update(TC,MD)
+        self._do_topology_update(TC,MD,template_index=template_index)
         self._do_relax(TC,gromacs_dict)
         self._do_equilibrate(TC,gromacs_dict)
         self.state.cum_nxlinkbonds+=self.bonds_df.shape[0]
@@ -220,7 +225,7 @@ class CureController:
         return {c:os.path.basename(x) for c,x in TC.files.items() if c!='mol2'}
 
     @cp.enableCheckpoint
-    def do_capping(self,TC:TopoCoord,RL:ReactionList,MD:MoleculeDict,gromacs_dict={}):
+    def do_capping(self,TC:TopoCoord,RL:ReactionList,MD:MoleculeDict,gromacs_dict={},template_index=None):
         """do_capping manages generation of all capping bonds
 
         :param TC: TopoCoord object containing all topology and coordinate information
@@ -231,11 +236,13 @@ class CureController:
         :type MD: MoleculeDict
         :param gromacs_dict: dictionary of custom gromacs parameters, defaults to {}
         :type gromacs_dict: dict, optional
+        :param template_index: bond template index of MD, from topocoord.build_template_index, defaults to None
+        :type template_index: dict, optional
         :return: dictionary of resulting output files, keyed by extension ('gro', 'top', 'grx')
         :rtype: dict
         """
         self._do_cap_bondsearch(TC,RL,MD)
-        self._do_topology_update(TC,MD)
+        self._do_topology_update(TC,MD,template_index=template_index)
         self._do_relax(TC)
         self._do_equilibrate(TC,gromacs_dict)
         return {c:os.path.basename(x) for c,x in TC.files.items() if c!='mol2'}
@@ -387,18 +394,20 @@ class CureController:
         self.state._to_yaml()
         logger.debug(f'next: {self.state.step}')
 
-    def _do_topology_update(self,TC:TopoCoord,MD:MoleculeDict):
+    def _do_topology_update(self,TC:TopoCoord,MD:MoleculeDict,template_index=None):
         """_do_topology_update manages the topology update in CURE
 
         :param TC: global system topology and coordinates
         :type TC: TopoCoord
         :param MD: dictionary of all molecular templates
         :type MD: MoleculeDict
+        :param template_index: bond template index of MD, defaults to None
+        :type template_index: dict, optional
         """
         if self.state.step!=cure_step.cure_update and self.state.step!=cure_step.cap_update: return
         opfx=self._pfx()
         logger.debug(f'Topology update')
-        bonds_df,pairs_df=TC.update_topology_and_coordinates(self.bonds_df,template_dict=MD,write_mapper_to=f'{opfx}-idx-mapper.csv')
+        bonds_df,pairs_df=TC.update_topology_and_coordinates(self.bonds_df,template_dict=MD,template_index=template_index,write_mapper_to=f'{opfx}-idx-mapper.csv',max_ring_size=self.dicts['controls']['max_ring_size'])
         TC.add_length_attribute(bonds_df,attr_name='initial_distance')
         TC.add_length_attribute(pairs_df,attr_name='initial_distance')
         self._register_bonds(bonds_df,pairs_df,f'{opfx}-bonds.csv',bonds_are='unrelaxed')
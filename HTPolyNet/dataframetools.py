@@ -6,6 +6,7 @@
 .. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
 
 """
+import numpy as np
 import pandas as pd
 import logging
 
@@ -132,3 +133,111 @@ def set_rows_attributes_from_dict(df:pd.DataFrame,valdict,attributes):
         for k,v in valdict.items():
             cidx=[c==k for c in df.columns]
             df.loc[list(l),cidx]=v 
+
+def idx_lookup(old_idx,drop_idx=[]):
+    """idx_lookup builds a numpy lookup array that maps old global indices onto
+    new sequential (1-based) global indices after the indices in drop_idx are removed;
+    any old index that is dropped or was never present maps to -1
+
+    :param old_idx: old global indices, in the order they appear in the table being reindexed
+    :type old_idx: array-like of int
+    :param drop_idx: global indices to delete, defaults to []
+    :type drop_idx: array-like of int, optional
+    :return: keep mask over old_idx and the lookup array (old index is the array index)
+    :rtype: tuple(numpy.ndarray,numpy.ndarray)
+    """
+    old_idx=np.asarray(old_idx,dtype=int)
+    keep=~np.isin(old_idx,np.asarray(drop_idx,dtype=int))
+    size=(old_idx.max()+1) if len(old_idx)>0 else 1
+    lookup=np.full(size,-1,dtype=int)
+    lookup[old_idx[keep]]=np.arange(1,keep.sum()+1)
+    return keep,lookup
+
+def lookup_as_dict(lookup):
+    """lookup_as_dict converts a lookup array from idx_lookup into an old-to-new index dictionary
+
+    :param lookup: lookup array
+    :type lookup: numpy.ndarray
+    :return: old-index-to-new-index mapper
+    :rtype: dict
+    """
+    old=np.nonzero(lookup>0)[0]
+    return dict(zip(old.tolist(),lookup[old].tolist()))
+
+def drop_rows_with_idx(df:pd.DataFrame,cols,drop_idx):
+    """drop_rows_with_idx removes every row of df in which any column named in cols
+    holds an index in drop_idx
+
+    :param df: a pandas dataframe
+    :type df: pd.DataFrame
+    :param cols: names of atom-index columns
+    :type cols: list
+    :param drop_idx: indices to drop
+    :type drop_idx: array-like of int
+    :return: dataframe of surviving rows (reindexed from 0) and number of rows dropped
+    :rtype: tuple(pd.DataFrame,int)
+    """
+    cols=[c for c in cols if c in df]
+    if len(cols)==0 or df.shape[0]==0:
+        return df,0
+    drop_idx=np.asarray(drop_idx,dtype=int)
+    hit=np.zeros(df.shape[0],dtype=bool)
+    for c in cols:
+        hit|=np.isin(df[c].to_numpy(),drop_idx)
+    return df.loc[~hit].reset_index(drop=True),int(hit.sum())
+
+def remap_idx_columns(df:pd.DataFrame,cols,lookup,check=False):
+    """remap_idx_columns replaces old indices in columns cols of df in place using a lookup array
+
+    :param df: a pandas dataframe
+    :type df: pd.DataFrame
+    :param cols: names of atom-index columns
+    :type cols: list
+    :param lookup: lookup array from idx_lookup
+    :type lookup: numpy.ndarray
+    :param check: if True, verify that every index being remapped survives, defaults to False
+    :type check: bool, optional
+    """
+    for c in cols:
+        if not c in df: continue
+        old=df[c].to_numpy(dtype=int)
+        if check:
+            assert old.size==0 or (old.max()<len(lookup) and old.min()>=0),f'Error: {c} index out of lookup range'
+            assert not np.any(lookup[old]<0),f'Error: surviving atom {c} old idx not in mapper'
+        df[c]=lookup[old]
+
+def canonical_pair_dedup(df:pd.DataFrame,cols=['ai','aj']):
+    """canonical_pair_dedup drops rows that describe the same unordered index pair
+
+    :param df: a pandas dataframe
+    :type df: pd.DataFrame
+    :param cols: the two index columns, defaults to ['ai','aj']
+    :type cols: list, optional
+    :return: deduplicated dataframe and number of rows dropped
+    :rtype: tuple(pd.DataFrame,int)
+    """
+    if df.shape[0]==0:
+        return df,0
+    a=df[cols[0]].to_numpy()
+    b=df[cols[1]].to_numpy()
+    key=pd.DataFrame({'lo':np.minimum(a,b),'hi':np.maximum(a,b)})
+    dups=key.duplicated().to_numpy()
+    return df.loc[~dups].reset_index(drop=True),int(dups.sum())
+
+def match_rows(df:pd.DataFrame,keys:pd.DataFrame,cols):
+    """match_rows finds, for each row of keys, the label of the first row of df whose values in columns cols match
+
+    :param df: dataframe to search
+    :type df: pd.DataFrame
+    :param keys: dataframe of query values; must have columns cols
+    :type keys: pd.DataFrame
+    :param cols: names of columns to match on
+    :type cols: list
+    :return: row labels of df aligned with the rows of keys; -1 where there is no match
+    :rtype: numpy.ndarray
+    """
+    target=df[cols].copy()
+    target['_row_']=df.index
+    target=target.drop_duplicates(subset=cols,keep='first')
+    m=keys[cols].reset_index(drop=True).merge(target,on=cols,how='left')
+    return m['_row_'].fillna(-1).to_numpy(dtype=int)
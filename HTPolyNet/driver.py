@@ -17,6 +17,7 @@ from .runtime import Runtime,logrotate
 from .command import Command
 import HTPolyNet.projectfilesystem as pfs
 import HTPolyNet.software as software
+import HTPolyNet.gmxcache as gmxcache
 from .plot import plots
 from .stringthings import my_logger
 from .inputcheck import input_check
@@ -63,6 +64,8 @@ def run(args):
     software.sw_setup()
     pfs.pfs_setup(root=os.getcwd(),topdirs=['molecules','systems','plots'],verbose=True,projdir=args.proj,reProject=args.restart,userlibrary=userlib)
     a=Runtime(cfgfile=args.config,restart=args.restart)
+    if args.no_cache:
+        gmxcache.disable()
     a.do_workflow(force_checkin=args.force_checkin,force_parameterization=args.force_parameterization)
     my_logger('HTPolyNet runtime ends',logger.info)
 
@@ -89,6 +92,8 @@ def parameterize(args):
     software.sw_setup()
     pfs.pfs_setup(root=os.getcwd(),topdirs=['molecules','systems','plots'],verbose=True,projdir=args.proj,reProject=args.restart,userlibrary=userlib)
     a=Runtime(cfgfile=args.config,restart=args.restart)
+    if args.no_cache:
+        gmxcache.disable()
     a.generate_molecules(force_checkin=args.force_checkin,force_parameterization=args.force_parameterization)
     my_logger('HTPolynet parameterization ends',logger.info)
 
@@ -205,6 +210,7 @@ def cli():
     command_parsers['run'].add_argument('-restart',default=False,action='store_true',help='restart in latest proj dir')
     command_parsers['run'].add_argument('--no-banner',default=False,action='store_true',help='turn off the banner')
     command_parsers['run'].add_argument('--force-parameterization',default=False,action='store_true',help='force GAFF parameterization of any input mol2 structures')
+    command_parsers['run'].add_argument('--no-cache',default=False,action='store_true',help='bypass the cache of grompp/mdrun results; always rerun')
     command_parsers['run'].add_argument('--force-checkin',default=False,action='store_true',help='force check-in of any generated parameter files to the system library')
     command_parsers['run'].add_argument('--loglevel',type=str,default='debug',help='Log level for messages written to diagnostic log (debug|info)')
     ######## parameterize ########
@@ -214,6 +220,7 @@ def cli():
     command_parsers['parameterize'].add_argument('-diag',type=str,default='htpolynet_runtime_diagnostics.log',help='diagnostic log file')
     command_parsers['parameterize'].add_argument('-restart',default=False,action='store_true',help='restart in latest proj dir')
     command_parsers['parameterize'].add_argument('--force-parameterization',default=False,action='store_true',help='force GAFF parameterization of any input mol2 structures')
+    command_parsers['parameterize'].add_argument('--no-cache',default=False,action='store_true',help='bypass the cache of grompp/mdrun results; always rerun')
     command_parsers['parameterize'].add_argument('--force-checkin',default=False,action='store_true',help='force check-in of any generated parameter files to the system library')
     command_parsers['parameterize'].add_argument('--no-banner',default=False,action='store_true',help='turn off the banner')
     command_parsers['parameterize'].add_argument('--loglevel',type=str,default='debug',help='Log level for messages written to diagnostic log (debug|info)')
@@ -243,6 +250,9 @@ def cli():
     command_parsers['postsim'].add_argument('-lib',type=str,default='lib',help='local user library of molecular structures and parameterizations')
     command_parsers['postsim'].add_argument('-ocfg',type=str,default='',help='original HTPolyNet config file used to generate project(s)')
     command_parsers['postsim'].add_argument('-cfg',type=str,default='',help='config file for specifying the MD simulations to perform')
+    command_parsers['postsim'].add_argument('--max-concurrent',type=int,default=1,help='maximum number of projects to simulate at once; cores are partitioned evenly among them (default 1)')
+    command_parsers['postsim'].add_argument('--ncores',type=int,default=0,help='number of cores to partition among concurrent projects (default: all available)')
+    command_parsers['postsim'].add_argument('--no-pin',default=False,action='store_true',help='do not pin the threads of concurrent mdruns to their partitions')
     command_parsers['postsim'].add_argument('--no-banner',default=False,action='store_true',help='turn off the banner')
     command_parsers['postsim'].add_argument('--loglevel',type=str,default='info',help='Log level for messages written to diagnostic log (debug|info)')
 
@@ -251,6 +261,7 @@ def cli():
     command_parsers['analyze'].add_argument('-lib',type=str,default='lib',help='local user library of molecular structures and parameterizations')
     command_parsers['analyze'].add_argument('-ocfg',type=str,default='',help='original HTPolyNet config file used to generate project(s)')
     command_parsers['analyze'].add_argument('-cfg',type=str,default='',help='config file for specifying the analyses to perform')
+    command_parsers['analyze'].add_argument('--max-concurrent',type=int,default=1,help='maximum number of projects to analyze at once (default 1)')
     command_parsers['analyze'].add_argument('--no-banner',default=False,action='store_true',help='turn off the banner')
     command_parsers['analyze'].add_argument('--loglevel',type=str,default='info',help='Log level for messages written to diagnostic log (debug|info)')
     args=parser.parse_args()
@@ -0,0 +1,168 @@
+"""
+
+.. module:: edr
+   :synopsis: reads Gromacs energy (edr) files directly, without invoking 'gmx energy'
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import logging
+import numpy as np
+import pandas as pd
+from HTPolyNet.xdr import XDRBuffer
+logger=logging.getLogger(__name__)
+
+_ENX_MAGIC_=-55555
+_FRAME_MAGIC_=-7777777
+_OLD_FORMAT_REAL_=-1e10
+# Gromacs xdr_datatype enumeration for the subblocks of an energy frame
+_SUBBLOCK_ITEMSIZE_={0:4,1:4,2:8,3:8,4:4}
+_XDR_STRING_=5
+
+class EDRFormatError(Exception):
+    pass
+
+def _read_term_names(buf):
+    """_read_term_names reads the names and units of the energy terms from the head of an edr file
+
+    :param buf: reader positioned at the start of the file
+    :type buf: XDRBuffer
+    :raises EDRFormatError: if the file is not a version 2 or later edr file
+    :return: list of names and list of units
+    :rtype: tuple(list,list)
+    """
+    magic=buf.int()
+    if magic>0:
+        raise EDRFormatError(f'Energy files written by Gromacs versions older than 4.0 are not supported')
+    if magic!=_ENX_MAGIC_:
+        raise EDRFormatError(f'Bad magic number {magic} in energy file')
+    file_version=buf.int()
+    nre=buf.int()
+    names,units=[],[]
+    for i in range(nre):
+        names.append(buf.string())
+        units.append(buf.string() if file_version>=2 else 'kJ/mol')
+    return names,units
+
+def _detect_real(buf):
+    """_detect_real determines whether reals in this edr file are single or double precision by
+    inspecting the header of the first frame
+
+    :param buf: reader positioned at the start of the first frame
+    :type buf: XDRBuffer
+    :raises EDRFormatError: if neither precision gives a valid frame header
+    :return: numpy dtype of reals
+    :rtype: str
+    """
+    for dtype in ['>f4','>f8']:
+        n=np.dtype(dtype).itemsize
+        if buf.pos+n+4>len(buf.data):
+            break
+        r=np.frombuffer(buf.data[buf.pos:buf.pos+n],dtype=dtype)[0]
+        m=np.frombuffer(buf.data[buf.pos+n:buf.pos+n+4],dtype='>i4')[0]
+        if r<_OLD_FORMAT_REAL_ and m==_FRAME_MAGIC_:
+            return dtype
+    raise EDRFormatError(f'Cannot determine precision of energy file')
+
+def _read_frame(buf,real):
+    """_read_frame reads one energy frame
+
+    :param buf: reader positioned at the start of a frame
+    :type buf: XDRBuffer
+    :param real: numpy dtype of reals
+    :type real: str
+    :return: time and array of instantaneous energies (empty if frame carries no energies)
+    :rtype: tuple(float,numpy.ndarray)
+    """
+    buf.reals(1,real)
+    if buf.int()!=_FRAME_MAGIC_:
+        raise EDRFormatError(f'Bad frame magic number at byte {buf.pos-4}')
+    file_version=buf.int()
+    t=buf.double()
+    buf.int64() # step
+    nsum=buf.int()
+    if file_version>=3:
+        buf.int64() # nsteps
+    if file_version>=5:
+        buf.double() # dt
+    nre=buf.int()
+    buf.int() # ndisre; reserved in later versions
+    nblock=buf.int()
+    blocks=[]
+    for b in range(nblock):
+        buf.int() # block id
+        nsub=buf.int()
+        blocks.append([(buf.int(),buf.int()) for i in range(nsub)])
+    buf.int() # e_size
+    buf.int() # old d_size
+    buf.int() # old nu
+    if nsum>0:
+        # each term carries (instantaneous, average, sum)
+        e=buf.reals(3*nre,real)[::3]
+    else:
+        e=buf.reals(nre,real)
+    for subs in blocks:
+        for typ,nr in subs:
+            if typ==_XDR_STRING_:
+                for i in range(nr):
+                    buf.int()
+                    buf.string()
+            else:
+                buf.skip(nr*_SUBBLOCK_ITEMSIZE_[typ])
+    return t,e
+
+def edr_term_names(filename):
+    """edr_term_names returns the names of the energy terms stored in an edr file,
+    formatted as they appear in the 'gmx energy' menu
+
+    :param filename: name of edr file
+    :type filename: str
+    :return: list of term names, in file order
+    :rtype: list
+    """
+    with open(filename,'rb') as f:
+        # the header is at the front of the file; no need to read it all
+        buf=XDRBuffer(f.read(65536))
+    try:
+        names,units=_read_term_names(buf)
+    except EOFError:
+        with open(filename,'rb') as f:
+            buf=XDRBuffer(f.read())
+        names,units=_read_term_names(buf)
+    return [n.replace(' ','-') for n in names]
+
+def read_edr(filename,names=[]):
+    """read_edr reads time traces of energy terms from an edr file
+
+    :param filename: name of edr file
+    :type filename: str
+    :param names: names of terms to extract (as in the 'gmx energy' menu); if empty, all terms are extracted, defaults to []
+    :type names: list, optional
+    :raises EDRFormatError: if the file cannot be parsed
+    :return: dataframe with a 'time(ps)' column followed by one column per requested term present in the file, in file order
+    :rtype: pandas.DataFrame
+    """
+    with open(filename,'rb') as f:
+        buf=XDRBuffer(f.read())
+    try:
+        allnames,units=_read_term_names(buf)
+    except EOFError:
+        raise EDRFormatError(f'Energy file {filename} is truncated')
+    allnames=[n.replace(' ','-') for n in allnames]
+    cols=[i for i,n in enumerate(allnames) if len(names)==0 or n in names]
+    times,rows=[],[]
+    if not buf.at_end():
+        real=_detect_real(buf)
+        while not buf.at_end():
+            try:
+                t,e=_read_frame(buf,real)
+            except EOFError:
+                logger.warning(f'Energy file {filename} ends with an incomplete frame; ignored')
+                break
+            # like gmx energy, report only frames that carry energies
+            if len(e)==len(allnames):
+                times.append(t)
+                rows.append(e[cols])
+    data=pd.DataFrame(np.array(rows,dtype=float).reshape(len(rows),len(cols)),columns=[allnames[i] for i in cols])
+    data.insert(0,'time(ps)',np.array(times,dtype=float))
+    return data
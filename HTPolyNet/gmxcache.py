@@ -0,0 +1,227 @@
+"""
+
+.. module:: gmxcache
+   :synopsis: content-addressed cache of grompp/mdrun results
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+logger=logging.getLogger(__name__)
+
+cache_settings={}
+"""Settings from the 'cache' subdirective of the cfg 'gromacs' section; empty if caching is off"""
+
+_CACHE_DEFAULTS_={'directory':'','max_size_mb':1024,'trajectories':False}
+_OUTPUT_EXTENSIONS_=['gro','edr','log','tpr','trr','xtc']
+"""Extensions of grompp/mdrun outputs that are stored, if present"""
+_TRAJECTORY_EXTENSIONS_=['trr','xtc']
+"""Extensions of trajectory outputs; runs that write trajectories are cached only if the 'trajectories' setting is on"""
+_HASH_EXCLUDED_OPTIONS_=['nt','ntmpi','ntomp','ntomp_pme','pin','pinoffset','pinstride']
+"""mdrun options that affect only how fast a run goes; results for any values of these are interchangeable"""
+_INCLUDE_=re.compile(r'^\s*#include\s+["<]([^">]+)[">]')
+_gmx_versions_={}
+
+def set_cache_from_cfg(parameters:dict,default_directory:str):
+    """set_cache_from_cfg turns on the cache if the cfg 'gromacs' section has a true-valued 'cache' subdirective
+    (either True or a dict with keys 'directory' (default default_directory), 'max_size_mb' (default 1024),
+    and 'trajectories' (default False; if True, runs that write trr or xtc files are also cached))
+
+    :param parameters: cfg parameters dictionary
+    :type parameters: dict
+    :param default_directory: cache directory to use if the cfg does not name one
+    :type default_directory: str
+    """
+    cache_settings.clear()
+    spec=parameters.get('gromacs',{}).get('cache',False)
+    if not spec:
+        return
+    cache_settings.update(_CACHE_DEFAULTS_)
+    if type(spec)==dict:
+        cache_settings.update(spec)
+    cache_settings['directory']=os.path.abspath(cache_settings['directory'] or default_directory)
+    os.makedirs(cache_settings['directory'],exist_ok=True)
+    logger.debug(f'grompp/mdrun cache in {cache_settings["directory"]}')
+
+def disable():
+    """disable turns the cache off
+    """
+    cache_settings.clear()
+
+def enabled():
+    """enabled returns True if the cache is on
+
+    :rtype: bool
+    """
+    return len(cache_settings)>0
+
+def gmx_version(gmx):
+    """gmx_version returns the version string reported by a gmx executable (cached per executable)
+
+    :param gmx: gmx command
+    :type gmx: str
+    :return: version string, or '' if it cannot be determined
+    :rtype: str
+    """
+    if not gmx in _gmx_versions_:
+        version=''
+        try:
+            CP=subprocess.run(gmx.split()+['--version'],capture_output=True,text=True)
+            for l in CP.stdout.split('\n'):
+                if l.strip().startswith('GROMACS version:'):
+                    version=l.split(':',1)[1].strip()
+                    break
+        except OSError:
+            pass
+        _gmx_versions_[gmx]=version
+    return _gmx_versions_[gmx]
+
+def _hash_top(h,topfile,seen):
+    """_hash_top feeds a topology file, and every file it includes that can be found, into h
+
+    :param h: hash object
+    :type h: hashlib object
+    :param topfile: name of top or itp file
+    :type topfile: str
+    :param seen: files already hashed, to guard against include cycles
+    :type seen: set
+    """
+    path=os.path.abspath(topfile)
+    if path in seen:
+        return
+    seen.add(path)
+    with open(path,'rb') as f:
+        data=f.read()
+    h.update(data)
+    here=os.path.dirname(path)
+    searchdirs=[here,os.getcwd()]+[d for d in os.environ.get('GMXLIB','').split(os.pathsep) if d]
+    for l in data.decode(errors='replace').split('\n'):
+        m=_INCLUDE_.match(l)
+        if not m:
+            continue
+        name=m.group(1)
+        for d in searchdirs:
+            candidate=os.path.join(d,name)
+            if os.path.isfile(candidate):
+                _hash_top(h,candidate,seen)
+                break
+        else:
+            # force-field files from the Gromacs installation; covered by the gmx version
+            h.update(name.encode())
+
+def input_key(gro,top,mdp,mdrun,mdrun_options,gmx,maxwarn):
+    """input_key returns the cache key of a grompp/mdrun run: a hash of the gro, top (with its includes),
+    and mdp files, the gmx version, the mdrun command and its options, and maxwarn
+
+    :param gro: name of gro file
+    :type gro: str
+    :param top: name of top file
+    :type top: str
+    :param mdp: name of mdp file
+    :type mdp: str
+    :param mdrun: mdrun command
+    :type mdrun: str
+    :param mdrun_options: mdrun options
+    :type mdrun_options: dict
+    :param gmx: gmx command
+    :type gmx: str
+    :param maxwarn: grompp maxwarn
+    :type maxwarn: int
+    :return: hex digest
+    :rtype: str
+    """
+    h=hashlib.sha256()
+    for f in [gro,mdp]:
+        with open(f,'rb') as fp:
+            h.update(fp.read())
+    _hash_top(h,top,set())
+    options=' '.join([f'-{k} {v}' for k,v in sorted(mdrun_options.items()) if not k in _HASH_EXCLUDED_OPTIONS_])
+    for item in [gmx_version(gmx),mdrun,options,str(maxwarn)]:
+        h.update(b'\0'+item.encode())
+    return h.hexdigest()
+
+def _entry(key):
+    return os.path.join(cache_settings['directory'],key)
+
+def restore(key,out):
+    """restore copies the cached outputs of a run to {out}.{ext} in the current directory, first removing
+    any outputs of an earlier run with the same basename, so that none is left beside the restored ones
+
+    :param key: cache key
+    :type key: str
+    :param out: output file basename (mdrun -deffnm)
+    :type out: str
+    :return: True if key was in the cache
+    :rtype: bool
+    """
+    entry=_entry(key)
+    if not os.path.isdir(entry):
+        return False
+    for f in [f'{out}.{ext}' for ext in _OUTPUT_EXTENSIONS_]+[f'{out}-mdrun.out']:
+        if os.path.exists(f):
+            os.remove(f)
+    for ext in _OUTPUT_EXTENSIONS_:
+        src=os.path.join(entry,f'result.{ext}')
+        if os.path.exists(src):
+            shutil.copyfile(src,f'{out}.{ext}')
+    # mark as most recently used
+    os.utime(entry)
+    logger.debug(f'{out}: grompp/mdrun results restored from cache {key[:12]}')
+    return True
+
+def store(key,out):
+    """store copies the outputs {out}.{ext} of a completed run into the cache, then evicts least recently used
+    entries until the cache is within its size limit; a run that wrote a trajectory is not stored unless the
+    'trajectories' setting is on
+
+    :param key: cache key
+    :type key: str
+    :param out: output file basename (mdrun -deffnm)
+    :type out: str
+    """
+    entry=_entry(key)
+    if os.path.isdir(entry):
+        return
+    if not cache_settings['trajectories'] and any([os.path.exists(f'{out}.{ext}') for ext in _TRAJECTORY_EXTENSIONS_]):
+        logger.debug(f'{out}: run wrote a trajectory; not cached')
+        return
+    # build under a temporary name, so that a concurrent reader never sees a partial entry
+    tmp=f'{entry}.{os.getpid()}.tmp'
+    os.makedirs(tmp,exist_ok=True)
+    for ext in _OUTPUT_EXTENSIONS_:
+        if os.path.exists(f'{out}.{ext}'):
+            shutil.copyfile(f'{out}.{ext}',os.path.join(tmp,f'result.{ext}'))
+    try:
+        os.rename(tmp,entry)
+    except OSError:
+        # another process stored the same result first
+        shutil.rmtree(tmp,ignore_errors=True)
+    evict()
+
+def _size(entry):
+    try:
+        return sum([os.path.getsize(os.path.join(entry,f)) for f in os.listdir(entry)])
+    except FileNotFoundError:
+        # evicted by another process
+        return 0
+
+def evict():
+    """evict removes least recently used entries until the cache is within its size limit
+    """
+    d=cache_settings['directory']
+    entries=[os.path.join(d,e) for e in os.listdir(d) if not e.endswith('.tmp')]
+    entries=[e for e in entries if os.path.isdir(e)]
+    sizes={e:_size(e) for e in entries}
+    total=sum(sizes.values())
+    limit=cache_settings['max_size_mb']*1024*1024
+    for e in sorted(entries,key=lambda e:os.path.getmtime(e) if os.path.exists(e) else 0):
+        if total<=limit:
+            break
+        shutil.rmtree(e,ignore_errors=True)
+        total-=sizes[e]
+        logger.debug(f'evicted {os.path.basename(e)[:12]} from grompp/mdrun cache')
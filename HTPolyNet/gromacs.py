@@ -12,7 +12,12 @@ import pandas as pd
 import numpy as np
 from itertools import product
 from collections import namedtuple
-from HTPolyNet.command import Command
+from HTPolyNet.command import Command, run_concurrently
+from HTPolyNet.edr import read_edr, edr_term_names
+from HTPolyNet.trajectory import read_frames, count_frames
+from HTPolyNet.coordinates import Coordinates
+import HTPolyNet.gmxcache as gmxcache
+import HTPolyNet.mdruntuner as mdruntuner
 import HTPolyNet.software as sw
 logger=logging.getLogger(__name__)
 
@@ -34,7 +39,7 @@ def insert_molecules(composition,boxSize,outName,inputs_dir='.',**kwargs):
         boxSize=float(boxSize)
     if type(boxSize)==float:
         boxSize=[boxSize]*3
-    box=' '.join([f'{x:.8f}' for x in boxSize])
+    box=[f'{x:.8f}' for x in boxSize]
     scale=kwargs.get('scale',0.4) # our default vdw radius scaling
     for name,num in composition.items():  # composition determines order
         ci=os.path.join(inputs_dir,f'{name}.gro')
@@ -64,7 +69,28 @@ def insert_molecules(composition,boxSize,outName,inputs_dir='.',**kwargs):
                 raise Exception('need bigger box')
 
 def grompp_and_mdrun(gro='',top='',out='',mdp='',boxSize=[],single_molecule=False,**kwargs):
-    """grompp_and_mdrun launcher for grompp and mdrun
+    """grompp_and_mdrun launcher for grompp and mdrun; synchronous wrapper around grompp_and_mdrun_async
+
+    :param gro: input gro file, defaults to ''
+    :type gro: str, optional
+    :param top: input top file, defaults to ''
+    :type top: str, optional
+    :param out: output file basename, defaults to ''
+    :type out: str, optional
+    :param mdp: input mdp file, defaults to ''
+    :type mdp: str, optional
+    :param boxSize: explicit box size, defaults to []
+    :type boxSize: list, optional
+    :param single_molecule: if true, a single-molecule system is simulated, defaults to False
+    :type single_molecule: bool, optional
+    """
+    run_concurrently(grompp_and_mdrun_async(gro=gro,top=top,out=out,mdp=mdp,boxSize=boxSize,single_molecule=single_molecule,**kwargs))
+
+async def grompp_and_mdrun_async(gro='',top='',out='',mdp='',boxSize=[],single_molecule=False,**kwargs):
+    """grompp_and_mdrun_async launcher for grompp and mdrun; independent runs may be awaited
+    concurrently.  Output of mdrun is streamed to the file {out}-mdrun.out.  If the result cache is
+    on and holds a run with identical inputs, its outputs are restored instead; pass use_cache=False
+    to bypass it.
 
     :param gro: input gro file, defaults to ''
     :type gro: str, optional
@@ -80,10 +106,12 @@ def grompp_and_mdrun(gro='',top='',out='',mdp='',boxSize=[],single_molecule=Fals
     :type single_molecule: bool, optional
     """
     logger.debug(kwargs)
+    use_cache=kwargs.get('use_cache',True) and gmxcache.enabled()
     quiet=kwargs.get('quiet',True)
     ignore_codes=kwargs.get('ignore_codes',[-11])
     maxwarn=kwargs.get('maxwarn',4)
-    mdrun_options=kwargs.get('mdrun_options',{})
+    # a copy, so that options added here (e.g., tuned thread counts) do not leak into the caller's dict
+    mdrun_options=dict(kwargs.get('mdrun_options',{}))
     for option in ['rdd','dds','dlb','npme','nt','ntpmi','ntomp','ntomp_pme','nb','tunepme','pme','pmefft','bonded','update']:
         if option in kwargs and not option in mdrun_options:
             mdrun_options[option]=kwargs[option]
@@ -96,25 +124,51 @@ def grompp_and_mdrun(gro='',top='',out='',mdp='',boxSize=[],single_molecule=Fals
     if len(boxSize)>0:
         logger.debug(f'Resizing to {boxSize}')
         c=Command(f'{sw.gmx} {sw.gmx_options} editconf',f=f'{gro}.gro',o=gro,
-                     box=' '.join([f'{x:.8f}' for x in boxSize]))
-        c.run(quiet=quiet)
+                     box=[f'{x:.8f}' for x in boxSize])
+        await c.run_async(quiet=quiet)
+    mdrun=sw.mdrun_single_molecule if single_molecule else sw.mdrun
+    if use_cache:
+        cache_key=gmxcache.input_key(f'{gro}.gro',f'{top}.top',f'{mdp}.mdp',mdrun,mdrun_options,sw.gmx,maxwarn)
+        if gmxcache.restore(cache_key,out):
+            return
     # nsteps=kwargs.get('nsteps',-2)
     c=Command(f'{sw.gmx} {sw.gmx_options} grompp',f=f'{mdp}.mdp',c=f'{gro}.gro',p=f'{top}.top',o=f'{out}.tpr',maxwarn=maxwarn)
-    c.run(quiet=quiet)
-    if single_molecule:
-        c=Command(f'{sw.mdrun_single_molecule}',deffnm=out,**mdrun_options)
-    else:
-        c=Command(f'{sw.mdrun}',deffnm=out,**mdrun_options)
-    c.run(quiet=quiet,ignore_codes=ignore_codes)
+    await c.run_async(quiet=quiet)
+    if not single_molecule and mdruntuner.enabled():
+        ensemble=_tunable_ensemble(f'{mdp}.mdp')
+        if ensemble and not 'ntomp' in mdrun_options and not any([t in ['-nt','-ntmpi','-ntomp'] for t in sw.mdrun.split()]):
+            budget=mdruntuner.budget_from(mdrun_options)
+            key=mdruntuner.system_key(f'{gro}.gro',ensemble,budget)
+            mdrun_options.update(await mdruntuner.tuned_options(sw.mdrun,out,key,budget))
+    c=Command(mdrun,deffnm=out,**mdrun_options)
+    if os.path.exists(f'{out}-mdrun.out'):
+        os.remove(f'{out}-mdrun.out')
+    await c.run_async(quiet=quiet,ignore_codes=ignore_codes,log=f'{out}-mdrun.out')
     if os.path.exists(f'{out}.gro'):
-        pass
-        # logger.info(f'grompp_and_mdrun completed.  Check {gro}.gro.')
+        if use_cache:
+            gmxcache.store(cache_key,out)
     else:
         logger.error(f'{sw.mdrun} ended prematurely; {out}.gro not found.')
         raise Exception(f'{sw.mdrun} ended prematurely; {out}.gro not found.')
 
+def _tunable_ensemble(mdp):
+    """_tunable_ensemble returns 'nvt' or 'npt' for a dynamics mdp file, or '' for any other
+    (e.g., minimization), whose runs are too short to be worth tuning
+
+    :param mdp: name of mdp file
+    :type mdp: str
+    :return: ensemble label
+    :rtype: str
+    """
+    integrator=mdp_get(mdp,'integrator').split(';')[0].strip()
+    if not integrator in ['md','md-vv','md-vv-avek','sd','bd']:
+        return ''
+    pcoupl=mdp_get(mdp,'pcoupl').split(';')[0].strip().lower()
+    return 'nvt' if pcoupl in ['no','not found!'] else 'npt'
+
 def get_energy_menu(edr,**kwargs):
-    """get_energy_menu gets the menu provided by 'gmx energy' when applied to a particular edr file
+    """get_energy_menu gets the menu 'gmx energy' would present for a particular edr file;
+    the term names are read directly from the edr file header
 
     :param edr: name of edr file
     :type edr: str
@@ -122,27 +176,10 @@ def get_energy_menu(edr,**kwargs):
     :rtype: dict
     """
     assert os.path.exists(edr+'.edr'),f'Error: {edr} not found'
-    with open('_menugetter_','w') as f:
-        f.write('\n')
-    c=Command(f'{sw.gmx} {sw.gmx_options} energy -f {edr}.edr -o {edr}-out.xvg -xvg none < _menugetter_ > _menu_ 2>&1')
-    c.run(ignore_codes=[1,2])
-    with open('_menu_','r') as f:
-        lines=f.read().split('\n')
-    topline=lines.index('End your selection with an empty line or a zero.')
-    botline=topline
-    while len(lines[botline])>0:
-        botline+=1
-    menulines=lines[topline+2:botline]
-    m=''.join(menulines)
-    n=' '.join(m.split()).split()
-    num,label=n[::2],n[1::2]
-    menu={l:n for l,n in zip(label,num)}
-    os.remove('_menu_')
-    os.remove('_menugetter_')
-    return menu
+    return {l:str(n) for n,l in enumerate(edr_term_names(f'{edr}.edr'),1)}
 
 def gmx_energy_trace(edr,names=[],report_averages=False,keep_files=False,**kwargs):
-    """Generate traces of data in edr file
+    """Generate traces of data in edr file; the edr file is read directly, without invoking 'gmx energy'
 
     :param edr: name of edr file
     :type edr: str
@@ -150,7 +187,7 @@ def gmx_energy_trace(edr,names=[],report_averages=False,keep_files=False,**kwarg
     :type names: list
     :param report_averages: flag to indicate if averages of all data are to be computed here, default False
     :type report_averages: bool, optional
-    :param keep_files: flag indicating caller would like to keep the raw input and output files for gmx energy, default False
+    :param keep_files: flag indicating caller would like the term selection and the traces written to the files 'gmx energy' would have used, default False
     :type keep_files: bool
     :return: dataframe of traces
     :rtype: pandas DataFrame
@@ -163,19 +200,13 @@ def gmx_energy_trace(edr,names=[],report_averages=False,keep_files=False,**kwarg
         logger.debug(f'None of {names} in menu {menu}')
         return pd.DataFrame()
     logger.debug(f'report_averages? {report_averages} {names}')
-    namvals=[]
-    with open(f'{edr}-gmx.in','w') as f:
-        for i in names:
-            if i in menu:
+    data=read_edr(f'{edr}.edr',names)
+    if keep_files:
+        with open(f'{edr}-gmx.in','w') as f:
+            for i in data.columns[1:]:
                 f.write(f'{menu[i]}\n')
-                namvals.append((i,int(menu[i])))
-        f.write('\n')
-    namvals.sort(key=lambda x: x[1])
-    c=Command(f'{sw.gmx} {sw.gmx_options} energy -f {edr}.edr -o {edr}-out.xvg -xvg none < {edr}-gmx.in')
-    c.run()
-    colnames=[x[0] for x in namvals]
-    colnames.insert(0,'time(ps)')
-    data=pd.read_csv(f'{edr}-out.xvg',sep='\s+',header=None,names=colnames)
+            f.write('\n')
+        data.to_csv(f'{edr}-out.xvg',sep=' ',header=False,index=False,float_format='%.6f')
     data.iloc[:,0]+=xshift
     ndata=data.shape[0]
     if report_averages:
@@ -184,9 +215,6 @@ def gmx_energy_trace(edr,names=[],report_averages=False,keep_files=False,**kwarg
             data[f'Rolling-10-average-{i}']=data[i].rolling(window=ndata//10).mean()
             for ln in data.iloc[-1][[i,f'Running-average-{i}',f'Rolling-10-average-{i}']].to_string(float_format='{:.2f}'.format).split('\n'):
                 logger.info(f'{ln}')
-    if not keep_files:
-        os.remove(f'{edr}-out.xvg')
-        os.remove(f'{edr}-gmx.in')
     return data       
 
 # make a bunch of 3-character filename prefixes so parallel invocations don't collide
@@ -294,20 +322,16 @@ def mdp_modify(mdp_filename,opt_dict,new_filename=None,add_if_missing=True):
         # logger.debug(f'wrote {mdp_filename}.')
 
 def gmx_traj_info(trr):
+    """gmx_traj_info counts the frames in a trr or xtc trajectory file, reading the file directly rather than via 'gmx check'
+
+    :param trr: name of trajectory file
+    :type trr: str
+    :return: number of frames and time spanned by them
+    :rtype: namedtuple
+    """
     Result=namedtuple('gmx_check','nframes time')
-    c=Command(f'{sw.gmx} {sw.gmx_options} check -f {trr}')
-    out,err=c.run()
-    out+=err
-    for l in out.split('\n'):
-        tok=l.split()
-        if len(tok)==0:
-            continue
-        if tok[0]=='Step':
-            # print(tok)
-            nframes=int(tok[1])
-            ts_ps=float(tok[2])
-            break
-    result=Result(nframes,(nframes-1)*ts_ps)
+    nframes,t0,t1=count_frames(trr)
+    result=Result(nframes,t1-t0)
     return result
 
 def gmx_command(name,options={},console_in=''):
@@ -323,11 +347,42 @@ def gmx_command(name,options={},console_in=''):
     return out
 
 def gro_from_trr(pfx,nzero=2,b=0,outpfx=''):
+    """gro_from_trr writes one gro file per frame of trajectory {pfx}.trr at or after time b, numbered from 0, as 'gmx trjconv -sep' would;
+    atom and residue names are taken from {pfx}.gro and the frames are read directly from the trajectory
+
+    :param pfx: basename of the trajectory and of the gro file that supplies atom names
+    :type pfx: str
+    :param nzero: number of digits in frame number suffix, defaults to 2
+    :type nzero: int, optional
+    :param b: time (ps) of first frame to write, defaults to 0
+    :type b: float, optional
+    :param outpfx: basename of output gro files, defaults to pfx
+    :type outpfx: str, optional
+    :return: list of basenames of gro files written
+    :rtype: list
+    """
     if not outpfx:
         outpfx=pfx
-    with open('tmp.in','w') as f:
-        f.write('0\n')
-    c=Command(f'{sw.gmx} {sw.gmx_options} trjconv -f {pfx}.trr -s {pfx}.tpr -o {outpfx}.gro -sep -nzero {nzero} -b {b} < tmp.in')
-    out,err=c.run()
-    os.remove('tmp.in')
-    out+=err
\ No newline at end of file
+    template=Coordinates.read_gro(f'{pfx}.gro',wrap_coords=False)
+    template.A=template.A[[x for x in Coordinates.gro_attributes if x in template.A.columns and not x.startswith('vel')]].copy()
+    title=template.name.strip()
+    written=[]
+    for fr in read_frames(f'{pfx}.trr'):
+        # trjconv compares times with a small tolerance
+        if fr.time<b-1.e-5*max(1.0,abs(b)):
+            continue
+        assert fr.x.shape[0]==template.A.shape[0],f'Error: {pfx}.trr has {fr.x.shape[0]} atoms but {pfx}.gro has {template.A.shape[0]}'
+        C=Coordinates()
+        C.A=template.A.copy()
+        C.N=C.A.shape[0]
+        C.A[['posX','posY','posZ']]=fr.x
+        if fr.v is not None:
+            C.A[['velX','velY','velZ']]=fr.v
+        if fr.box is not None:
+            C.box=fr.box
+        C.name=f'Generated by trjconv : {title} t= {fr.time:9.5f} step= {fr.step}'
+        fn=f'{outpfx}{len(written):0{nzero}d}'
+        C.write_gro(f'{fn}.gro')
+        written.append(fn)
+    logger.debug(f'Wrote {len(written)} frames from {pfx}.trr')
+    return written
@@ -0,0 +1,171 @@
+"""
+
+.. module:: mdruntuner
+   :synopsis: chooses mdrun thread counts by timing brief trial runs, caching the choice per system size
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import glob
+import json
+import logging
+import os
+import subprocess
+import numpy as np
+from HTPolyNet.command import Command
+from HTPolyNet.scheduler import available_cores
+logger=logging.getLogger(__name__)
+
+tuner_settings={}
+"""Settings from the 'tune_mdrun' subdirective of the cfg 'gromacs' section; empty if tuning is off"""
+_cache_={}
+_cache_file_=''
+
+_TUNER_DEFAULTS_={'trial_steps':400,'ncores':0,'candidates':[]}
+
+def set_tuner_from_cfg(parameters:dict,cache_file:str):
+    """set_tuner_from_cfg turns on mdrun tuning if the cfg 'gromacs' section has a true-valued 'tune_mdrun'
+    subdirective (either True or a dict of settings), and loads any choices already cached in cache_file
+
+    :param parameters: cfg parameters dictionary
+    :type parameters: dict
+    :param cache_file: name of json file in which tuned choices are kept
+    :type cache_file: str
+    """
+    global _cache_file_
+    tuner_settings.clear()
+    _cache_.clear()
+    spec=parameters.get('gromacs',{}).get('tune_mdrun',False)
+    if not spec:
+        return
+    tuner_settings.update(_TUNER_DEFAULTS_)
+    if type(spec)==dict:
+        tuner_settings.update(spec)
+    _cache_file_=cache_file
+    if os.path.exists(cache_file):
+        with open(cache_file,'r') as f:
+            _cache_.update(json.load(f))
+        logger.debug(f'{len(_cache_)} tuned mdrun choices read from {cache_file}')
+
+def enabled():
+    """enabled returns True if mdrun tuning is on
+
+    :rtype: bool
+    """
+    return len(tuner_settings)>0
+
+def system_key(grofile,ensemble,budget):
+    """system_key returns the cache key for a system: its ensemble, its atom count rounded up to a
+    power of two, its number density rounded to a power of two (so that a densifying system moves
+    to a new key), and the thread budget
+
+    :param grofile: name of gro file
+    :type grofile: str
+    :param ensemble: ensemble label, e.g., 'npt'
+    :type ensemble: str
+    :param budget: total number of threads available to mdrun
+    :type budget: int
+    :return: key
+    :rtype: str
+    """
+    with open(grofile,'rb') as f:
+        f.readline()
+        natoms=int(f.readline())
+        size=os.fstat(f.fileno()).st_size
+        f.seek(max(0,size-256))
+        boxline=f.read().splitlines()[-1]
+    L=[float(x) for x in boxline.split()[:3]]
+    rho=natoms/np.prod(L)
+    return f'{ensemble}-{1<<(natoms-1).bit_length()}-{int(np.round(np.log2(rho)))}-{budget}'
+
+def candidates(budget):
+    """candidates returns the thread settings to try: the whole budget and its half and quarter
+    (small systems do not scale), each split into every power-of-two number of OpenMP threads
+    per rank that divides it
+
+    :param budget: total number of threads available to mdrun
+    :type budget: int
+    :return: list of {'nt':nt,'ntomp':ntomp} dicts
+    :rtype: list
+    """
+    if tuner_settings.get('candidates',[]):
+        return [{'nt':nt,'ntomp':ntomp} for nt,ntomp in tuner_settings['candidates']]
+    result=[]
+    for nt in sorted(set([max(1,budget//d) for d in [1,2,4]]),reverse=True):
+        ntomp=1
+        while ntomp<=nt:
+            if nt%ntomp==0:
+                result.append({'nt':nt,'ntomp':ntomp})
+            ntomp*=2
+    return result
+
+def parse_performance(logfile):
+    """parse_performance extracts the ns/day figure from an mdrun log
+
+    :param logfile: name of mdrun log file
+    :type logfile: str
+    :return: ns/day, or None if the log has no performance line
+    :rtype: float
+    """
+    if not os.path.exists(logfile):
+        return None
+    with open(logfile,'r') as f:
+        for l in f:
+            if l.startswith('Performance:'):
+                return float(l.split()[1])
+    return None
+
+async def tuned_options(mdrun,tpr,key,budget):
+    """tuned_options returns the fastest thread settings for the system in tpr, running brief
+    trial mdruns over the candidates the first time key is seen and reusing the cached choice after
+
+    :param mdrun: mdrun command
+    :type mdrun: str
+    :param tpr: basename of tpr file
+    :type tpr: str
+    :param key: cache key of the system, from system_key
+    :type key: str
+    :param budget: total number of threads available to mdrun
+    :type budget: int
+    :return: mdrun options ({} if no trial succeeded)
+    :rtype: dict
+    """
+    if key in _cache_:
+        return {'nt':_cache_[key]['nt'],'ntomp':_cache_[key]['ntomp']}
+    trial=f'{tpr}-tune'
+    nsteps=tuner_settings['trial_steps']
+    results=[]
+    for cand in candidates(budget):
+        c=Command(mdrun,s=f'{tpr}.tpr',deffnm=trial,nsteps=nsteps,resethway='',noconfout='',**cand)
+        try:
+            await c.run_async(log=f'{trial}.out')
+            perf=parse_performance(f'{trial}.log')
+        except subprocess.SubprocessError:
+            # e.g., too many ranks for the domain decomposition of a small system
+            perf=None
+        for f in glob.glob(f'{trial}.*'):
+            os.remove(f)
+        logger.debug(f'mdrun trial {cand}: {perf} ns/day')
+        if perf is not None:
+            results.append((perf,cand))
+    if not results:
+        logger.warning(f'No mdrun trial for {tpr} succeeded; thread settings left to mdrun')
+        return {}
+    perf,best=max(results,key=lambda x:x[0])
+    logger.info(f'mdrun tuning ({key}): -nt {best["nt"]} -ntomp {best["ntomp"]} at {perf:.3f} ns/day')
+    _cache_[key]=dict(best,ns_per_day=perf)
+    if _cache_file_:
+        with open(_cache_file_,'w') as f:
+            json.dump(_cache_,f,indent=2)
+    return dict(best)
+
+def budget_from(mdrun_options):
+    """budget_from returns the thread budget: the -nt already assigned (e.g., by the scheduler),
+    else the 'ncores' tuner setting, else all available cores
+
+    :param mdrun_options: mdrun options
+    :type mdrun_options: dict
+    :return: number of threads
+    :rtype: int
+    """
+    return int(mdrun_options.get('nt',0)) or tuner_settings.get('ncores',0) or available_cores()
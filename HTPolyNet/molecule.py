@@ -23,6 +23,7 @@ from HTPolyNet.gromacs import mdp_modify,gro_from_trr
 from HTPolyNet.command import Command
 from HTPolyNet.reaction import Reaction, ReactionList, reaction_stage, generate_product_name, reactant_resid_to_presid
 from HTPolyNet.chain import ChainManager
+import HTPolyNet.checks as checks
 
 logger=logging.getLogger(__name__)
 
@@ -134,6 +135,8 @@ class Molecule:
         self.conformers=[] # just a list of gro file basenames
         self.zrecs=[]
         self.is_reactant=False
+        self.interaction_slices={} # cached get_angles_dihedrals selections keyed on template bond
+        self.mapper_cache={} # cached template sides of idx_mappers keyed on instance bond names and mapped atoms
 
     @classmethod
     def New(cls,mol_name,generator:Reaction,molrec={}):
@@ -578,9 +581,13 @@ class Molecule:
             intraresidue=in_product_resids[0]==in_product_resids[1]
             self.bond_templates.append(BondTemplate(atom_names,in_product_resnames,intraresidue,order,bystander_resnames,bystander_atomnames,oneaway_resnames,oneaway_atomnames))
 
-    def idx_mappers(self,otherTC:TopoCoord,other_bond,bystanders,oneaways,uniq_atom_idx:set):
+    def idx_mappers(self,otherTC:TopoCoord,other_bond,bystanders,oneaways,uniq_atom_idx:set,inst_lookup=None):
         """idx_mappers computes the mapping dictionary from molecule template index to instance index in the other TopoCoord
 
+        The template side of the mapping (which template atoms, by residue and atom name, must be mapped) 
+        depends only on the template bond and the atoms to be mapped, so it is computed once and cached; 
+        each call then only gathers instance indices by (resNum, atomName).
+
         :param otherTC: the other TopoCoord
         :type otherTC: TopoCoord
         :param other_bond: 2 atom indices of the bond in the other TopoCoord
@@ -591,6 +598,8 @@ class Molecule:
         :type oneaways: list (2)
         :param uniq_atom_idx: set of unique atoms in template that must be mapped to instance
         :type uniq_atom_idx: set
+        :param inst_lookup: dictionary of instance globalIdx keyed on (resNum, atomName); built from otherTC if not provided, defaults to None
+        :type inst_lookup: dict, optional
         :raises Exception: if there is a buggy double-counting of one or more indexes
         :return: two-way dictionaries of index mappers instance<->template
         :rtype: tuple of two dictionaries
@@ -598,68 +607,82 @@ class Molecule:
         assert len(other_bond)==2
         assert len(bystanders)==2
         assert len(oneaways)==2
-        ut=uniq_atom_idx.copy()
         logger.debug(f'Template name {self.name}')
         i_idx,j_idx=other_bond
         i_resName,i_resNum,i_atomName=otherTC.get_gro_attribute_by_attributes(['resName','resNum','atomName'],{'globalIdx':i_idx})
         j_resName,j_resNum,j_atomName=otherTC.get_gro_attribute_by_attributes(['resName','resNum','atomName'],{'globalIdx':j_idx})
         logger.debug(f'i_idx {i_idx} i_resName {i_resName} i_resNum {i_resNum} i_atomName {i_atomName}')
         logger.debug(f'j_idx {j_idx} j_resName {j_resName} j_resNum {j_resNum} j_atomName {j_atomName}')
-        # identify the template bond represented by the other_bond parameter
-        ij=[]
-        for RB,BT in zip(self.reaction_bonds,self.bond_templates):
-            temp_resids=RB.resids
-            temp_iname,temp_jname=BT.names
-            temp_iresname,temp_jresname=BT.resnames
-            temp_bystander_resids=RB.bystander_resids
-            temp_oneaway_resids=RB.oneaway_resids
-            # logger.debug(f'temp_iresname {temp_iresname} temp_iname {temp_iname}')
-            # logger.debug(f'temp_jresname {temp_jresname} temp_jname {temp_jname}')
-            if (i_atomName,i_resName)==(temp_iname,temp_iresname):
-                ij=[0,1]
-                break # found it -- stop looking
-            elif (i_atomName,i_resName)==(temp_jname,temp_jresname):
-                ij=[1,0]
-                break
+        key=(i_resName,i_atomName,j_resName,j_atomName,frozenset(uniq_atom_idx))
+        if not key in self.mapper_cache:
+            self.mapper_cache[key]=self._template_mapper_blocks(i_resName,i_atomName,uniq_atom_idx)
+        ij,blocks=self.mapper_cache[key]
         assert len(ij)==2,f'Mappers using template {self.name} unable to map from instance bond {i_resName}-{i_resNum}-{i_atomName}---{j_resName}-{j_resNum}-{j_atomName}'
         inst_resids=[i_resNum,j_resNum]
         inst_resids=[inst_resids[ij[x]] for x in [0,1]]
         inst_bystander_resids=[bystanders[ij[x]] for x in [0,1]]
         inst_oneaway_resids=[oneaways[ij[x]] for x in [0,1]]
-        assert all([len(inst_bystander_resids[x])==len(temp_bystander_resids[x]) for x in [0,1]]),f'Error: bystander count mismatch'
-           # use dataframe merges to create globalIdx maps
-        instdf=otherTC.Coordinates.A
-        tempdf=self.TopoCoord.Coordinates.A
+        assert all([len(inst_bystander_resids[x])==blocks['nbystanders'][x] for x in [0,1]]),f'Error: bystander count mismatch'
+        if inst_lookup is None:
+            instdf=otherTC.Coordinates.A
+            inst_lookup=dict(zip(zip(instdf['resNum'],instdf['atomName']),instdf['globalIdx']))
         inst2temp={}
         temp2inst={}
-        # logger.debug(f'inst resids from {[i_resNum,j_resNum,*inst_bystanders]}') 
-        # logger.debug(f'temp resids from {[temp_iresid,temp_jresid,*temp_bystanders]}')
-        for inst,temp in zip([*inst_resids,*inst_bystander_resids[0],*inst_bystander_resids[1],*inst_oneaway_resids],
-                             [*temp_resids,*temp_bystander_resids[0],*temp_bystander_resids[1],*temp_oneaway_resids]):
+        for inst,(temp,temp_idx,temp_names) in zip([*inst_resids,*inst_bystander_resids[0],*inst_bystander_resids[1],*inst_oneaway_resids],blocks['residues']):
             if inst and temp:  # None's in the bystander lists and oneaways lists should be ignored
                 logger.debug(f'map inst resid {inst} to template resid {temp}')
-                idf=instdf[instdf['resNum']==inst][['globalIdx','atomName']].copy()
-                # logger.debug(f'idf res {inst}:\n{idf.to_string()}')
-                tdf=tempdf[tempdf['resNum']==temp][['globalIdx','atomName']].copy()
-                # logger.debug(f'tdf res {temp}:\n{tdf.to_string()}')
-                tdf=tdf.merge(idf,on='atomName',how='inner',suffixes=('_template','_instance'))
-                # logger.debug(f'merged\n{tdf.to_string()}')
-                for i,r in tdf.iterrows():
-                    temp_idx=r['globalIdx_template']
-                    inst_idx=r['globalIdx_instance']
-                    # logger.debug(f't {temp_idx} <-> i {inst_idx}')
-                    # only map template atoms that are identified in the passed in set
-                    if temp_idx in ut:
-                        ut.remove(temp_idx)
-                        temp2inst[temp_idx]=inst_idx
-                        inst2temp[inst_idx]=temp_idx
-                    if temp_idx in temp2inst and temp2inst[temp_idx]!=inst_idx:
-                        raise Exception(f'Error: temp_idx {temp_idx} already claimed in temp2inst; bug')
+                for t,n in zip(temp_idx,temp_names):
+                    i=inst_lookup.get((inst,n),None)
+                    if i is None: continue
+                    if t in temp2inst:
+                        if temp2inst[t]!=i:
+                            raise Exception(f'Error: temp_idx {t} already claimed in temp2inst; bug')
+                        continue
+                    temp2inst[t]=i
+                    inst2temp[i]=t
         assert len(inst2temp)==len(temp2inst),f'Error: could not establish two-way dict of atom globalIdx'
         return (inst2temp,temp2inst)
 
+    def _template_mapper_blocks(self,i_resName,i_atomName,uniq_atom_idx):
+        """_template_mapper_blocks identifies the template bond that matches an instance bond whose first atom 
+        has names i_resName/i_atomName, and lists, for each template residue to be mapped, the template atoms 
+        in uniq_atom_idx and their names
+
+        :param i_resName: residue name of first atom in instance bond
+        :type i_resName: str
+        :param i_atomName: atom name of first atom in instance bond
+        :type i_atomName: str
+        :param uniq_atom_idx: set of unique atoms in template that must be mapped to instance
+        :type uniq_atom_idx: set
+        :return: order of the instance bond atoms relative to the template bond, and dict of bystander counts and per-residue blocks
+        :rtype: tuple(list,dict)
+        """
+        ij=[]
+        for RB,BT in zip(self.reaction_bonds,self.bond_templates):
+            temp_iname,temp_jname=BT.names
+            temp_iresname,temp_jresname=BT.resnames
+            if (i_atomName,i_resName)==(temp_iname,temp_iresname):
+                ij=[0,1]
+                break # found it -- stop looking
+            elif (i_atomName,i_resName)==(temp_jname,temp_jresname):
+                ij=[1,0]
+                break
+        if len(ij)!=2:
+            return ij,{}
+        tempdf=self.TopoCoord.Coordinates.A
+        tempdf=tempdf[tempdf['globalIdx'].isin(uniq_atom_idx)]
+        blocks={'nbystanders':[len(RB.bystander_resids[x]) for x in [0,1]],'residues':[]}
+        for temp in [*RB.resids,*RB.bystander_resids[0],*RB.bystander_resids[1],*RB.oneaway_resids]:
+            if temp:
+                tdf=tempdf[tempdf['resNum']==temp]
+                blocks['residues'].append((temp,tdf['globalIdx'].to_list(),tdf['atomName'].to_list()))
+            else:
+                blocks['residues'].append((temp,[],[]))
+        return ij,blocks
+
     def get_angles_dihedrals(self,bond):
-        """get_angles_dihedrals returns copies of selections from the Topology interaction-type dataframes that contain the two atoms indicated in the bond
+        """get_angles_dihedrals returns copies of selections from the Topology interaction-type dataframes that contain the two atoms indicated in the bond;
+        selections are computed once per template bond and cached
 
         :param bond: 2-element list-like container of ints
         :type bond: list-like container
@@ -668,37 +691,48 @@ class Molecule:
         :rtype: tuple
         """
         ai,aj=bond
+        key=(min(ai,aj),max(ai,aj))
+        D=self.TopoCoord.Topology.D
+        tables=tuple([D[k] for k in ['angles','dihedrals','pairs']])
+        cached=self.interaction_slices.get(key,None)
+        if cached is None or any([x is not y for x,y in zip(cached[0],tables)]) or cached[1]!=tuple([len(x) for x in tables]):
+            cached=(tables,tuple([len(x) for x in tables]),self._interaction_slices(ai,aj))
+            self.interaction_slices[key]=cached
+        ad,td,paird=cached[2]
+        return ad.copy(),td.copy(),paird.copy()
+
+    def _interaction_slices(self,ai,aj):
+        """_interaction_slices computes the angles, dihedrals, and 1-4 pairs in the template that contain bond ai-aj
+
+        :param ai: template index of one atom in the bond
+        :type ai: int
+        :param aj: template index of the other atom in the bond
+        :type aj: int
+        :raises Exception: dies if a NaN is found in any selection
+        :return: tuple of the three dataframe selections
+        :rtype: tuple
+        """
+        def has_bond(d,c1,c2):
+            a,b=d[c1].to_numpy(),d[c2].to_numpy()
+            return ((a==ai)&(b==aj))|((a==aj)&(b==ai))
         d=self.TopoCoord.Topology.D['angles']
-        ad=d[((d.ai==ai)&(d.aj==aj))|
-             ((d.ai==aj)&(d.aj==ai))|
-             ((d.aj==ai)&(d.ak==aj))|
-             ((d.aj==aj)&(d.ak==ai))].copy()
+        ad=d[has_bond(d,'ai','aj')|has_bond(d,'aj','ak')].reset_index(drop=True)
         d=self.TopoCoord.Topology.D['dihedrals']
-        td=d[((d.ai==ai)&(d.aj==aj))|
-             ((d.ai==aj)&(d.aj==ai))|
-             ((d.aj==ai)&(d.ak==aj))|
-             ((d.aj==aj)&(d.ak==ai))|
-             ((d.ak==ai)&(d.al==aj))|
-             ((d.ak==aj)&(d.al==ai))].copy()
-        check=True
-        for a in ['ai','aj','ak','al']:
-            check=check and td[a].isnull().values.any()
-        if check:
-            logger.error('NAN in molecule/dihedrals')
-            raise Exception
-
+        td=d[has_bond(d,'ai','aj')|has_bond(d,'aj','ak')|has_bond(d,'ak','al')].reset_index(drop=True)
+        if checks.active('cheap'):
+            if td[['ai','aj','ak','al']].isnull().to_numpy().any():
+                logger.error('NAN in molecule/dihedrals')
+                raise Exception('NAN in molecule/dihedrals')
+        # all 1-4 pairs matching the end atoms of each dihedral, in dihedral order
         d=self.TopoCoord.Topology.D['pairs']
-        paird=pd.DataFrame()
-        for ai,al in zip(td.ai,td.al):
-            tpair=d[((d.ai==ai)&(d.aj==al))|
-                    ((d.ai==al)&(d.aj==ai))].copy()
-            paird=pd.concat((paird,tpair),ignore_index=True)
-        check=True
-        for a in ['ai','aj']:
-            check=check and paird[a].isnull().values.any()
-        if check:
-            logger.error('NAN in molecule/pairs')
-            raise Exception
+        ends=pd.DataFrame({'lo':np.minimum(td.ai,td.al),'hi':np.maximum(td.ai,td.al),'_dih_':np.arange(td.shape[0])})
+        pk=pd.DataFrame({'lo':np.minimum(d.ai,d.aj),'hi':np.maximum(d.ai,d.aj),'_pair_':np.arange(d.shape[0])})
+        m=ends.merge(pk,on=['lo','hi'],how='inner').sort_values(by=['_dih_','_pair_'],kind='stable')
+        paird=d.iloc[m['_pair_'].to_numpy()].reset_index(drop=True)
+        if checks.active('cheap'):
+            if paird[['ai','aj']].isnull().to_numpy().any():
+                logger.error('NAN in molecule/pairs')
+                raise Exception('NAN in molecule/pairs')
         return ad,td,paird
 
     def get_resname(self,internal_resid):
@@ -1074,7 +1108,7 @@ class Molecule:
                 TC.vacuum_simulate(outname=f'{compfile}',nsamples=cd['count'],params=params)
                 gro_from_trr(compfile,nzero=nd,outpfx=pfx,b=begin_at)
             # os.remove(f'{gro}-confs.gro')
-            fmt=r'{A}{B:0'+str(nd)+r'd}'  # the trjconv command in gro_from_trr must generate these files
+            fmt=r'{A}{B:0'+str(nd)+r'd}'  # gro_from_trr must generate these files
             cfnl=[fmt.format(A=pfx,B=x) for x in range(self.nconformers)]
             for mname in cfnl:
                 assert os.path.exists(f'{mname}.gro'),f'Error: Conformer coordinates file {mname}.gro not found'
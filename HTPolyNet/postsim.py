@@ -18,6 +18,7 @@ from HTPolyNet.gromacs import mdp_get, mdp_modify, gmx_energy_trace
 import HTPolyNet.software as software
 from HTPolyNet.configuration import Configuration
 from HTPolyNet.plot import scatter
+from HTPolyNet.scheduler import run_projects, run_stages, with_slot_options
 
 logger=logging.getLogger(__name__)
 
@@ -62,8 +63,9 @@ class PostSimMD:
         """
         p=self.params
         logger.info(f'do {p}')
-        # if a gromacs dict is passed in, assume this overrides the one read in from the file
-        if gromacs_dict:
+        # if a gromacs dict is passed in, assume this overrides the one read in from the file;
+        # one holding only mdrun_options (e.g., a scheduler slot's -nt/-pin) does not
+        if set(gromacs_dict)-set(['mdrun_options']):
             software.set_gmx_preferences(gromacs_dict)
         else:
             software.set_gmx_preferences(p['gromacs'])
@@ -420,8 +422,34 @@ class PostsimConfiguration:
             logger.info(f'passing in {p[simtype]}')
             self.stagelist.append(self.default_classes[simtype](p[simtype]))
 
+def _postsim_project(d,mdrun_options,cfg,ogromacs,lib,root):
+    """_postsim_project runs all postsim stages of one project in order
+
+    :param d: project directory
+    :type d: str
+    :param mdrun_options: mdrun options for this project's core partition; merged into those of ogromacs
+    :type mdrun_options: dict
+    :param cfg: postsim configuration
+    :type cfg: PostsimConfiguration
+    :param ogromacs: gromacs directives from the original config file
+    :type ogromacs: dict
+    :param lib: user library
+    :type lib: str
+    :param root: directory containing the project directories
+    :type root: str
+    :return: stage timings
+    :rtype: list(JobTiming)
+    """
+    pfs.pfs_setup(root=root,topdirs=['molecules','systems','plots','postsim'],verbose=True,projdir=d,reProject=False,userlibrary=lib)
+    pfs.go_to('postsim')
+    try:
+        return run_stages(d,[(stage.params['subdir'],stage) for stage in cfg.stagelist],lambda stage:stage.do(mdp_pfx='local',**with_slot_options(ogromacs,mdrun_options)))
+    finally:
+        pfs.go_root()
+
 def postsim(args):
-    """postsim handles the postsim subcommand for managing post-cure production MD simulations
+    """postsim handles the postsim subcommand for managing post-cure production MD simulations;
+    projects are independent, so up to args.max_concurrent of them run at once
 
     :param args: command-line arguments
     :type args: argparse.Namespace
@@ -438,10 +466,4 @@ def postsim(args):
     logger.info(f'Project director{ess}: {args.proj}')
     software.sw_setup()
     logger.debug(f'ogromacs {ogromacs}')
-    for d in args.proj:
-        pfs.pfs_setup(root=os.getcwd(),topdirs=['molecules','systems','plots','postsim'],verbose=True,projdir=d,reProject=False,userlibrary=args.lib)
-        pfs.go_to('postsim')
-        for stage in cfg.stagelist:
-            stage.do(mdp_pfx='local',**ogromacs)
-        pfs.go_root()
-
+    run_projects(_postsim_project,args.proj,args=(cfg,ogromacs,args.lib,os.getcwd()),max_concurrent=args.max_concurrent,ncores=args.ncores,pin=not args.no_pin)
@@ -41,7 +41,6 @@
 # periodic image!
 #
 import numpy as np
-from collections import UserList
 from functools import singledispatchmethod
 import networkx as nx
 from copy import deepcopy
@@ -60,6 +59,65 @@ def lawofcos(a,b):
     """
     return np.dot(a,b)/np.sqrt(np.dot(a,a)*np.dot(b,b))
 
+def canonical_ring_key(idx):
+    """canonical_ring_key returns the rotation- and reflection-normalized form of a ring's index list;
+    two lists describe the same ring if and only if their canonical keys are equal
+
+    :param idx: list of atom indices in ring order
+    :type idx: list
+    :return: index tuple starting at the minimum index and proceeding toward its smaller neighbor
+    :rtype: tuple
+    """
+    n=len(idx)
+    if n==0: return tuple()
+    i=idx.index(min(idx))
+    fwd=idx[i:]+idx[:i]
+    if n>2 and fwd[-1]<fwd[1]:
+        fwd=[fwd[0]]+fwd[1:][::-1]
+    return tuple(fwd)
+
+def rings_through_bond(bondlist,ai,aj,max_size=8):
+    """rings_through_bond finds all chordless rings of up to max_size atoms that contain the bond ai-aj,
+    searching only the bounded neighborhood of ai in the bondlist
+
+    :param bondlist: bondlist that already contains the bond ai-aj
+    :type bondlist: Bondlist
+    :param ai: global index of first atom in bond
+    :type ai: int
+    :param aj: global index of second atom in bond
+    :type aj: int
+    :param max_size: maximum number of atoms in a ring, defaults to 8
+    :type max_size: int, optional
+    :return: list of rings as lists of atom indices
+    :rtype: list
+    """
+    # every atom of a ring of at most max_size atoms that contains ai is within max_size//2 bonds of ai
+    radius=max_size//2
+    seen={ai}
+    shell=[ai]
+    for _ in range(radius):
+        nxt=[]
+        for a in shell:
+            for b in bondlist.partners_of(a):
+                if not b in seen:
+                    seen.add(b)
+                    nxt.append(b)
+        shell=nxt
+    if not aj in seen: return []
+    H=nx.Graph()
+    H.add_nodes_from(seen)
+    for a in seen:
+        H.add_edges_from([(a,b) for b in bondlist.partners_of(a) if b in seen])
+    if not H.has_edge(ai,aj): return []
+    H.remove_edge(ai,aj)
+    rings=[]
+    for path in nx.all_simple_paths(H,ai,aj,cutoff=max_size-1):
+        if len(path)<3: continue
+        # chordless if the only edges among ring atoms are the ring bonds themselves (the ai-aj bond was removed from H)
+        if H.subgraph(path).number_of_edges()==len(path)-1:
+            rings.append([int(x) for x in path])
+    return rings
+
 class Segment:
     """ a segment object owns a list of Points P with two elements representing segment endpoints, and a vector that points from the first point to the second, V
     """
@@ -95,11 +153,15 @@ class Ring:
         parent list.  The final five elements are the reverse of the parent list
         and all treadmilled version of that reversed list.
 
+        Each ring carries its canonical key (see canonical_ring_key), so equality tests and
+        RingList lookups do not need to generate these variants.
+
         :param P: list of ints
         :type P: list
         """
         self.idx=idx.copy()
         assert(all([type(x)==int for x in self.idx]))
+        self.key=canonical_ring_key(self.idx)
 
     def copy(self):
         newring=deepcopy(self)
@@ -165,21 +227,24 @@ class Ring:
             yield self.idx[i:]+self.idx[:i]
 
     def __eq__(self,other):
-        check1=any([self.idx==other.idx] + [self.idx==x for x in other.treadmill()])
-        check2=any([self.idx==other.idx[::-1]]+[self.idx==x[::-1] for x in other.treadmill()])
-        # logger.debug(f'checking ring eq: {str(self)}=={str(other)}? {check1} and {check2}')
-        return check1 or check2
+        if not isinstance(other,Ring): return NotImplemented
+        return self.key==other.key
+
+    def __hash__(self):
+        return hash(self.key)
     
     def __str__(self):
         return '-'.join([str(x) for x in self.idx])
 
     def shift(self,shift):
         self.idx=[x+shift for x in self.idx]
+        self.key=canonical_ring_key(self.idx)
         return self
 
     def remap(self,mapper):
         new_idx=[mapper[x] for x in self.idx]
         self.idx=new_idx
+        self.key=canonical_ring_key(self.idx)
 
     def unwrap(self,P,unwrapf=None,pbc=[1,1,1]):
         r=self.copy()
@@ -234,20 +299,112 @@ class Ring:
             return is_inside,PP
         return False,np.ones(3)*np.nan
 
-class RingList(UserList):
+class RingList:
+    """ A collection of unique rings stored in a dictionary keyed by each ring's canonical key, 
+    so that membership tests and deduplication do not require pairwise ring comparisons.
+    An ordered list of keys (order) is kept alongside, so that iteration and indexing follow insertion order.
+    Supports the list operations of the former UserList-based RingList; any operation that would
+    introduce a duplicate ring skips it.
+    """
     @singledispatchmethod
     def __init__(self,input_obj):
-        self.data=input_obj
+        self.data={}
+        self.order=[]
+        self.extend(input_obj)
     @__init__.register(nx.Graph)
     def _from_graph(self,G):
-        L=[]
+        self.data={}
+        self.order=[]
         for ll in nx.chordless_cycles(G):
-            L.append(Ring(ll))
-        super().__init__(L)
+            self.append(Ring(ll))
+
+    def __iter__(self):
+        return (self.data[k] for k in self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self,i):
+        if isinstance(i,slice):
+            return RingList([self.data[k] for k in self.order[i]])
+        return self.data[self.order[i]]
+
+    def __delitem__(self,i):
+        keys=self.order[i] if isinstance(i,slice) else [self.order[i]]
+        for k in keys:
+            del self.data[k]
+        del self.order[i]
+
+    def __contains__(self,item):
+        key=item.key if isinstance(item,Ring) else canonical_ring_key(list(item))
+        return key in self.data
+
+    def __eq__(self,other):
+        if not isinstance(other,RingList):
+            other=RingList(list(other))
+        return self.order==other.order
+
+    def __add__(self,other):
+        result=RingList(list(self))
+        result.extend(other)
+        return result
+
+    def __iadd__(self,other):
+        self.extend(other)
+        return self
+
+    def append(self,item):
+        """append adds ring item if it is not already present
+
+        :param item: a ring
+        :type item: Ring
+        :return: True if ring was added
+        :rtype: bool
+        """
+        if item.key in self.data:
+            return False
+        self.data[item.key]=item
+        self.order.append(item.key)
+        return True
+
+    def extend(self,other):
+        for item in other:
+            self.append(item)
+
+    def index(self,item):
+        key=item.key if isinstance(item,Ring) else canonical_ring_key(list(item))
+        return self.order.index(key)
+
+    def count(self,item):
+        return int(item in self)
+
+    def remove(self,item):
+        """remove removes ring item
+
+        :param item: a ring
+        :type item: Ring
+        :raises ValueError: if item is not in the list
+        """
+        del self[self.index(item)]
+
+    def pop(self,i=-1):
+        item=self[i]
+        del self[i]
+        return item
+
+    def clear(self):
+        self.data={}
+        self.order=[]
+
+    def _rekey(self):
+        rings=list(self)
+        self.clear()
+        self.extend(rings)
 
     def shift(self,shift):
         for item in self:
             item.shift(shift)
+        self._rekey()
         return self
     
     def all_atoms(self):
@@ -262,14 +419,26 @@ class RingList(UserList):
     
     def filter(self,idxlist):
         retL=RingList([])
+        idxset=set(idxlist)
         for item in self:
-            if any([x in idxlist for x in item.idx]):
+            if any([x in idxset for x in item.idx]):
                 retL.append(item)
         return retL
 
     def remap(self,mapper):
         for item in self:
             item.remap(mapper)
+        self._rekey()
+
+    def merge(self,other):
+        """merge adds rings from other that are not already in this list
+
+        :param other: rings to merge in
+        :type other: list
+        :return: number of rings added
+        :rtype: int
+        """
+        return sum([int(self.append(r)) for r in other])
 
     def __str__(self):
         return ';'.join([str(x) for x in self])
\ No newline at end of file
@@ -13,10 +13,15 @@ import numpy as np
 import random
 from copy import deepcopy
 from HTPolyNet.configuration import Configuration
-from HTPolyNet.topology import select_topology_type_option
-from HTPolyNet.topocoord import TopoCoord
+from HTPolyNet.topology import select_topology_type_option, type_registry, type_conflicts
+from HTPolyNet.topocoord import TopoCoord, build_template_index
+from HTPolyNet.coordinates import set_grx_format_from_cfg
 import HTPolyNet.projectfilesystem as pfs
 import HTPolyNet.software as software
+import HTPolyNet.checks as checks
+import HTPolyNet.command as command
+import HTPolyNet.gmxcache as gmxcache
+import HTPolyNet.mdruntuner as mdruntuner
 from HTPolyNet.gromacs import insert_molecules, mdp_modify, mdp_get
 import HTPolyNet.checkpoint as cp
 from HTPolyNet.plot import trace
@@ -152,11 +157,17 @@ class Runtime:
                     if not kk in self.cfg.parameters[k]:
                         self.cfg.parameters[k][kk]=vv
         software.set_gmx_preferences(self.cfg.parameters)
+        checks.set_check_level_from_cfg(self.cfg.parameters)
+        set_grx_format_from_cfg(self.cfg.parameters)
+        command.set_timeout_policy(self.cfg.parameters)
+        mdruntuner.set_tuner_from_cfg(self.cfg.parameters,os.path.join(pfs.proj(),'mdrun-tuning.json'))
+        gmxcache.set_cache_from_cfg(self.cfg.parameters,os.path.join(pfs.proj(),'gmx-cache'))
         self.TopoCoord=TopoCoord(system_name='htpolynet')
         self.cfg.parameters['restart']=restart
         if self.cfg.parameters['restart']:
             logger.info(f'Restarting in {pfs.proj()}')
         self.molecules:MoleculeDict={}
+        self.template_index={}
         cure_dict=self.cfg.parameters.get('CURE',{})
         if cure_dict:
             logger.debug('Setting up cure controller')
@@ -243,6 +254,7 @@ class Runtime:
                 logger.debug(f'Template {M.name}:')
                 for b in M.bond_templates:
                     logger.debug(f'   {str(b)}')
+        self.template_index=build_template_index(self.molecules)
 
         for k,v in self.cfg.parameters.get('constituents',{}).items():
             relaxdict=v.get('relax',{})
@@ -332,14 +344,15 @@ class Runtime:
         logger.info(f'Attempting to form {cc.state.desired_nxlinkbonds} bonds')
         while not cure_finished:
             pfs.go_to(f'systems/iter-{cc.state.iter}')
-            cc.do_iter(TC,RL,MD,gromacs_dict=gromacs_dict)
+            cc.do_iter(TC,RL,MD,gromacs_dict=gromacs_dict,template_index=self.template_index)
             cure_finished=cc.is_cured()
             if not cure_finished:
                 cure_finished=cc.next_iter()
         ''' perform capping if necessary '''
         my_logger(f'Capping begins',logger.info)
         pfs.go_to(f'systems/capping')
-        cc.do_capping(TC,RL,MD,gromacs_dict=gromacs_dict)
+        cc.do_capping(TC,RL,MD,gromacs_dict=gromacs_dict,template_index=self.template_index)
+        checks.report()
         my_logger('Connect-Update-Relax-Equilibrate (CURE) ends',logger.info)
 
     @cp.enableCheckpoint
@@ -451,36 +464,15 @@ class Runtime:
         :type selection_rule: str, optional
         """
         logger.debug(f'Consistency check of {typename} func {funcidx} on all {len(self.molecules)} molecules requested')
-        mnames=list(self.molecules.keys())
-        types_duplicated=[]
-        for i in range(len(mnames)):
-            logger.debug(f'{mnames[i]}...')
-            for j in range(i+1,len(mnames)):
-                mol1topo=self.molecules[mnames[i]].TopoCoord.Topology
-                mol2topo=self.molecules[mnames[j]].TopoCoord.Topology
-                this_duptypes=mol1topo.report_duplicate_types(mol2topo,typename=typename,funcidx=funcidx)
-                logger.debug(f'...{mnames[j]} {len(this_duptypes)}')
-                for d in this_duptypes:
-                    if not d in types_duplicated:
-                        types_duplicated.append(d)
-        logger.debug(f'Duplicated {typename}: {types_duplicated}')
-        options={}
-        for t in types_duplicated:
-            logger.debug(f'Duplicate {t}:')
-            options[t]=[]
-            for i in range(len(mnames)):
-                moltopo=self.molecules[mnames[i]].TopoCoord.Topology
-                this_type=moltopo.report_type(t,typename='dihedraltypes',funcidx=4)
-                if len(this_type)>0 and not this_type in options[t]:
-                    options[t].append(this_type)
-                logger.debug(f'{mnames[i]} reports {this_type}')
-            logger.debug(f'Conflicting options for this type: {options[t]}')
-            selected_type=select_topology_type_option(options[t],typename,rule=selection_rule)
+        topologies={mname:M.TopoCoord.Topology for mname,M in self.molecules.items()}
+        registry=type_registry(topologies,typename=typename,funcidx=funcidx)
+        conflicts=type_conflicts(registry,typename=typename)
+        logger.debug(f'{len(conflicts)} of {registry.shape[0]} registered {typename} have conflicting parameters')
+        for t,options in conflicts.items():
+            logger.debug(f'Conflicting options for {typename} {t}: {options}')
+            selected_type=select_topology_type_option(options,typename,rule=selection_rule)
             logger.debug(f'Under selection rule "{selection_rule}", preferred type is {selected_type}')
-            for i in range(len(mnames)):
-                logger.debug(f'resetting {mnames[i]}')
-                TC=self.molecules[mnames[i]].TopoCoord
-                moltopo=TC.Topology
+            for moltopo in topologies.values():
                 moltopo.reset_type(typename,t,selected_type)
 
     def _initialize_topology(self,inpfnm='init'):
@@ -500,6 +492,7 @@ class Runtime:
         ''' for each monomer named in the cfg, either parameterize it or fetch its parameterization '''
         TC=self.TopoCoord
         already_merged=[]
+        blocks=[]
         for item in self.cfg.initial_composition:
             M=self.molecules[item['molecule']]
             N=item['count']
@@ -508,12 +501,15 @@ class Runtime:
             logger.debug(f'Merging {N} copies of {M.name}\'s topology into global topology')
             t.adjust_charges(atoms=t.D['atoms']['nr'].to_list(),desired_charge=0.0,overcharge_threshhold=0.1,msg='')
             t.rep_ex(N)
-            TC.Topology.merge(t)
+            blocks.append(t)
             already_merged.append(M.name)
+        # all replicated blocks go in with one concatenation per directive
+        TC.Topology.merge_ex(blocks)
         for othermol,M in self.molecules.items():
             if not othermol in already_merged:
                 logger.debug(f'Merging types from {othermol}\'s topology into global topology')
-                TC.Topology.merge_types(M.TopoCoord.Topology)
+                blocks.append(M.TopoCoord.Topology)
+        TC.Topology.merge_types(blocks)
         logger.info(f'Topology "{inpfnm}.top" in {pfs.cwd()}')
         TC.write_top(f'{inpfnm}.top')
         TC.write_tpx(f'{inpfnm}.tpx')
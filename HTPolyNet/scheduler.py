@@ -0,0 +1,162 @@
+"""
+
+.. module:: scheduler
+   :synopsis: runs independent per-project job chains concurrently on partitioned cores
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import logging
+import multiprocessing as mp
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+logger=logging.getLogger(__name__)
+
+JobTiming=namedtuple('JobTiming','project stage seconds status')
+"""Wall time of one stage of one project; status is 'ok' or a failure message"""
+
+_slot_={}
+"""mdrun options (-nt, -pin, -pinoffset) claimed by this worker process"""
+
+def available_cores():
+    """available_cores returns the number of cores this process may run on
+
+    :return: number of cores
+    :rtype: int
+    """
+    if hasattr(os,'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def core_slots(nslots,ncores=0,pin=True):
+    """core_slots partitions the cores into equal, disjoint slots, one per concurrent job
+
+    :param nslots: number of slots
+    :type nslots: int
+    :param ncores: number of cores to partition, defaults to 0 (all available)
+    :type ncores: int, optional
+    :param pin: if True, each slot pins its threads to its own cores, defaults to True
+    :type pin: bool, optional
+    :return: list of mdrun option dictionaries, one per slot
+    :rtype: list
+    """
+    ncores=ncores or available_cores()
+    nt=max(1,ncores//nslots)
+    slots=[]
+    for i in range(nslots):
+        slot={'nt':nt}
+        if pin:
+            slot.update({'pin':'on','pinoffset':i*nt,'pinstride':1})
+        slots.append(slot)
+    return slots
+
+def with_slot_options(gromacs_dict,mdrun_options):
+    """with_slot_options returns a copy of a gromacs directives dictionary whose mdrun_options also hold a
+    slot's mdrun options; the slot's options take precedence, and gromacs_dict is not modified
+
+    :param gromacs_dict: gromacs directives (e.g., the 'gromacs' section of a cfg file)
+    :type gromacs_dict: dict
+    :param mdrun_options: mdrun options of the slot (e.g., from core_slots); may be empty
+    :type mdrun_options: dict
+    :return: gromacs directives for a job running in the slot
+    :rtype: dict
+    """
+    merged=dict(gromacs_dict)
+    if mdrun_options:
+        merged['mdrun_options']=dict(gromacs_dict.get('mdrun_options',{}),**mdrun_options)
+    return merged
+
+def _claim_slot(slots):
+    """_claim_slot is the worker-process initializer; each worker keeps one slot for its lifetime
+
+    :param slots: queue of unclaimed slots
+    :type slots: multiprocessing.Queue
+    """
+    _slot_.update(slots.get())
+
+def _run_in_slot(worker,project,args):
+    return worker(project,dict(_slot_),*args)
+
+def run_stages(project,stages,run_stage):
+    """run_stages runs the stages of one project in order, timing each; a failed stage ends the
+    project's chain, since later stages may depend on its outputs
+
+    :param project: project name, used only for reporting
+    :type project: str
+    :param stages: list of (label,stage) pairs
+    :type stages: list
+    :param run_stage: function that runs one stage
+    :type run_stage: callable
+    :return: timings of the stages that were attempted
+    :rtype: list(JobTiming)
+    """
+    timings=[]
+    for label,stage in stages:
+        t0=time.time()
+        try:
+            run_stage(stage)
+        except Exception as m:
+            logger.error(f'{project}: {label} failed: {m}')
+            timings.append(JobTiming(project,label,time.time()-t0,f'failed: {m}'))
+            break
+        timings.append(JobTiming(project,label,time.time()-t0,'ok'))
+        logger.info(f'{project}: {label} finished in {timings[-1].seconds:.1f} s')
+    return timings
+
+def run_projects(worker,projects,args=(),max_concurrent=1,ncores=0,pin=True):
+    """run_projects runs worker once per project, up to max_concurrent at a time, each in its own
+    process (projects change the working directory, so they cannot share one) and on its own
+    partition of the cores.  worker is called as worker(project,mdrun_options,*args), where
+    mdrun_options holds the slot's -nt/-pin/-pinoffset settings ({} when running one at a time),
+    and returns a list of JobTiming.
+
+    :param worker: module-level function that runs all stages of one project
+    :type worker: callable
+    :param projects: project directory names
+    :type projects: list
+    :param args: further arguments to worker, defaults to ()
+    :type args: tuple, optional
+    :param max_concurrent: maximum number of projects to run at once, defaults to 1
+    :type max_concurrent: int, optional
+    :param ncores: number of cores to partition among concurrent projects, defaults to 0 (all available)
+    :type ncores: int, optional
+    :param pin: if True, pin each project's threads to its partition, defaults to True
+    :type pin: bool, optional
+    :raises Exception: if any stage of any project failed
+    :return: timings of all stages of all projects
+    :rtype: list(JobTiming)
+    """
+    ncores=ncores or available_cores()
+    nslots=min(max_concurrent,len(projects),ncores)
+    timings=[]
+    t0=time.time()
+    if nslots<=1:
+        for d in projects:
+            timings.extend(worker(d,{},*args))
+    else:
+        slots=core_slots(nslots,ncores,pin)
+        logger.info(f'Running {len(projects)} projects, {nslots} at a time, {slots[0]["nt"]} threads each')
+        # fork, so that workers inherit the logging configuration and software preferences
+        ctx=mp.get_context('fork')
+        q=ctx.Queue()
+        for s in slots:
+            q.put(s)
+        with ProcessPoolExecutor(max_workers=nslots,mp_context=ctx,initializer=_claim_slot,initargs=(q,)) as pool:
+            futures={pool.submit(_run_in_slot,worker,d,args):d for d in projects}
+            for f in as_completed(futures):
+                d=futures[f]
+                try:
+                    timings.extend(f.result())
+                except Exception as m:
+                    logger.error(f'{d}: {m}')
+                    timings.append(JobTiming(d,'',0.0,f'failed: {m}'))
+    timings.sort(key=lambda jt:projects.index(jt.project))
+    logger.info(f'Wall times (total {time.time()-t0:.1f} s):')
+    for jt in timings:
+        logger.info(f'  {jt.project:>20s} {jt.stage:>30s} {jt.seconds:10.1f} s  {jt.status}')
+    failed=[jt for jt in timings if jt.status!='ok']
+    if failed:
+        raise Exception(f'Failed: '+', '.join([f'{jt.project} {jt.stage}' for jt in failed]))
+    return timings
@@ -15,16 +15,33 @@ import os
 import shutil
 from copy import deepcopy
 import networkx as nx
-from HTPolyNet.coordinates import Coordinates, GRX_ATTRIBUTES, GRX_GLOBALLY_UNIQUE, GRX_UNSET_DEFAULTS
+from HTPolyNet.coordinates import Coordinates, GRX_ATTRIBUTES, GRX_GLOBALLY_UNIQUE, GRX_UNSET_DEFAULTS, minimum_image
 from HTPolyNet.topology import Topology
 from HTPolyNet.bondtemplate import BondTemplate,ReactionBond
 from HTPolyNet.matrix4 import Matrix4
 from HTPolyNet.gromacs import grompp_and_mdrun,mdp_get, mdp_modify, gmx_energy_trace
 import HTPolyNet.projectfilesystem as pfs
 from HTPolyNet.chain import ChainManager
+import HTPolyNet.checks as checks
+from HTPolyNet.dataframetools import canonical_pair_dedup
 
 logger=logging.getLogger(__name__)
 
+def _nan_check(df,cols,msg=''):
+    """_nan_check raises an exception if any of the columns cols in dataframe df contain a NaN
+
+    :param df: dataframe to check
+    :type df: pandas.DataFrame
+    :param cols: column names to check
+    :type cols: list
+    :param msg: name of the interaction being checked, defaults to ''
+    :type msg: str, optional
+    :raises Exception: if a NaN is found
+    """
+    if df[cols].isnull().to_numpy().any():
+        logger.error(f'NAN in {msg}\n{df.to_string()}')
+        raise Exception(f'NAN in {msg}')
+
 class BTRC(Enum):
     """Bond test return codes: bond tests are applied to those bond-candidates that are within search radius of each other
 
@@ -87,7 +104,7 @@ class TopoCoord:
         X=cls(topfilename=top,grofilename=gro)
         return X
 
-    def make_bonds(self,pairs,explicit_sacH={}):
+    def make_bonds(self,pairs,explicit_sacH={},max_ring_size=0):
         """Adds new bonds to the global topology
 
         :param pairs: list of pairs of atom global indices indicating each new bond
@@ -97,12 +114,16 @@ class TopoCoord:
             optimize mutual orientation and placement of the two reactant molecules, defaults
             to []
         :type skip_H: list, optional
+        :param max_ring_size: if positive, rings of up to this many atoms formed by the new bonds are added to the ring list, defaults to 0
+        :type max_ring_size: int, optional
         :return: list of indexes of atoms that must now be deleted (sacrifical H's)
         :rtype: list
         """
         idx_to_ignore=self.Coordinates.find_sacrificial_H(pairs,self.Topology,explicit_sacH=explicit_sacH)
         logger.debug(f'idx_to_ignore {idx_to_ignore}')
         self.Topology.add_bonds(pairs)
+        if max_ring_size>0:
+            self.Topology.update_rings(pairs,max_ring_size=max_ring_size)
         logger.debug(f'Prior to injesting bonds, chainmanager reports {len(self.ChainManager.chains)} chains')
         self.ChainManager.injest_bonds(pairs)
         logger.debug(f'After injesting bonds, chainmanager reports {len(self.ChainManager.chains)} chains')
@@ -159,36 +180,33 @@ class TopoCoord:
         anH=sum([int(x.upper().startswith('H')) for x in aneighnames])
         return anH
 
-    def map_from_templates(self,bdf,moldict,overcharge_threshhold=0.1):
+    def map_from_templates(self,bdf,moldict,template_index=None,overcharge_threshhold=0.1):
         """Updates angles, pairs, dihedrals, atom types, and charges, based on product
-            templates associated with each bond in 'bdf'
+            templates associated with each bond in 'bdf'.  Bonds are grouped by the template
+            bond they map to, so each template's interactions are translated for all of its
+            bonds at once and each system interaction table is concatenated only once.
 
         :param bdf: dataframe, columns 'ai', 'aj', 'reactantName'
         :type bdf: pandas.DataFrame
         :param moldict: dictionary of template Molecules keyed by name
         :type moldict: dict
-        :raises Exception: nan found in any attribute of any new system angle
-        :raises Exception: nan found in any attribute of any new system dihedral
-        :raises Exception: nan found in any attribute of any new system pair
-            that came along with a dihedral
-        :raises Exception: nan found in ai attribute of any template pair
-        :raises Exception: nan found in aj attribute of any template pair
-        :raises Exception: nan found in any system pair
+        :param template_index: bond template index from build_template_index, defaults to None (linear search of moldict)
+        :type template_index: dict, optional
+        :raises Exception: if any template atom in a mapped interaction has no system counterpart
+        :raises Exception: nan found in any system angle, dihedral, or pair (full checks only)
         """
         atdf=self.Topology.D['atoms']
-        # ij=self.Topology.D['bondtypes'].set_index(['i','j'])
-        #mb=self.D['mol2_bonds']
-        # bmi=self.Topology.D['bonds'].set_index(['ai','aj']).sort_index().index
         grodf=self.Coordinates.A
         grodf['old_reactantName']=grodf['reactantName'].copy()
         logger.debug(f'Mapping {bdf.shape[0]} bonds.')
         premapping_total_charge=self.Topology.total_charge()
         logger.debug(f'Must compensate for an overcharge of {premapping_total_charge:.4f}')
-        mapped_inst_atoms=[]
-        for b in bdf.itertuples():
+        # instance atom lookup used by all index mappers
+        inst_lookup=dict(zip(zip(grodf['resNum'],grodf['atomName']),grodf['globalIdx']))
+        # groups of bonds keyed on (template name, template bond)
+        groups={}
+        for n,b in enumerate(bdf.itertuples()):
             logger.debug(f'Mapping bond {b}')
-            # for ln in b.to_string().split('\n'):
-            #     logger.debug(f'  -> {ln}')
             bb=[b.ai,b.aj]
             order=b.order
             names=[self.get_gro_attribute_by_attributes('atomName',{'globalIdx':x}) for x in bb]
@@ -215,249 +233,192 @@ class TopoCoord:
             RB=ReactionBond(bb,resids,order,bystander_resids,bystander_atomidx,oneaway_resids,oneaway_atomidx)
             logger.debug(f'apparent bond template {str(BT)}')
             logger.debug(f'apparent bond instance {str(RB)}')
-            T,rb,reverse_bond=find_template(BT,moldict)
+            T,rb,reverse_bond=find_template(BT,moldict,template_index=template_index)
             if reverse_bond: RB.reverse()
             temp_i_idx,temp_j_idx=rb.idx
-            d=T.TopoCoord.Topology.D['bonds']
-            # copy all bond records matching these two bonds; should be only one!!
-            d=d[((d.ai==temp_i_idx)&(d.aj==temp_j_idx))|
-                ((d.ai==temp_j_idx)&(d.aj==temp_i_idx))].copy()
-            assert d.shape[0]==1,f'Using {T.name} is sent inst-bond {i_idx}-{j_idx} which is claimed to map to {temp_i_idx}-{temp_j_idx}, but no such unique bond is found:\n{T.TopoCoord.Topology.D["bonds"].to_string()}'
-            ''' check passed '''
-            temp_angles,temp_dihedrals,temp_pairs=T.get_angles_dihedrals((temp_i_idx,temp_j_idx))
-            logger.debug(f'Mapping {temp_angles.shape[0]} angles, {temp_dihedrals.shape[0]} dihedrals, and {temp_pairs.shape[0]} pairs from template {T.name}')
-            # determine the set of unique atoms in template that must be mapped to instance -- it is all
-            # atoms involved in these bonded interactions
-            uniq_temp_idx=set()
-            for df in [temp_angles,temp_dihedrals,temp_pairs]:
-                for label in ['ai','aj','ak','al']:
-                    if label in df:
-                        uniq_temp_idx=uniq_temp_idx.union(set(df[label].to_list()))
-            logger.debug(f'Template atom indexes that must be mapped: {uniq_temp_idx}')
+            gkey=(T.name,min(temp_i_idx,temp_j_idx),max(temp_i_idx,temp_j_idx))
+            if not gkey in groups:
+                d=T.TopoCoord.Topology.D['bonds']
+                # copy all bond records matching these two bonds; should be only one!!
+                d=d[((d.ai==temp_i_idx)&(d.aj==temp_j_idx))|
+                    ((d.ai==temp_j_idx)&(d.aj==temp_i_idx))].copy()
+                assert d.shape[0]==1,f'Using {T.name} is sent inst-bond {bb[0]}-{bb[1]} which is claimed to map to {temp_i_idx}-{temp_j_idx}, but no such unique bond is found:\n{T.TopoCoord.Topology.D["bonds"].to_string()}'
+                temp_angles,temp_dihedrals,temp_pairs=T.get_angles_dihedrals((temp_i_idx,temp_j_idx))
+                logger.debug(f'Mapping {temp_angles.shape[0]} angles, {temp_dihedrals.shape[0]} dihedrals, and {temp_pairs.shape[0]} pairs from template {T.name}')
+                # determine the set of unique atoms in template that must be mapped to instance -- it is all
+                # atoms involved in these bonded interactions
+                uniq_temp_idx=set()
+                for df in [temp_angles,temp_dihedrals,temp_pairs]:
+                    for label in ['ai','aj','ak','al']:
+                        if label in df:
+                            uniq_temp_idx=uniq_temp_idx.union(set(df[label].to_list()))
+                logger.debug(f'Template atom indexes that must be mapped: {uniq_temp_idx}')
+                groups[gkey]={'T':T,'angles':temp_angles,'dihedrals':temp_dihedrals,'pairs':temp_pairs,'uniq':uniq_temp_idx,'ordinals':[],'maps':[]}
+            g=groups[gkey]
             # get the bidirectional instance<->template mapping dictionaries
-            inst2temp,temp2inst=T.idx_mappers(self,RB.idx,RB.bystander_resids,RB.oneaway_resids,uniq_temp_idx)
-            # some hard checks on compatibility of the dicts
-            assert len(inst2temp)==len(temp2inst)
-            check=True
-            for k,v in inst2temp.items():
-                check = check and (k == temp2inst[v])
-            for k,v in temp2inst.items():
-                check = check and (k == inst2temp[v])
-            assert check,f'Error: bidirectional dicts are incompatible; bug\n{inst2temp}\b{temp2inst}'
-            # logger.debug(f'inst2temp {inst2temp}')
-            # logger.debug(f'temp2inst {temp2inst}')
+            inst2temp,temp2inst=T.idx_mappers(self,RB.idx,RB.bystander_resids,RB.oneaway_resids,g['uniq'],inst_lookup=inst_lookup)
+            if checks.active('full'):
+                # some hard checks on compatibility of the dicts
+                with checks.timed('map_from_templates.mappers'):
+                    assert len(inst2temp)==len(temp2inst)
+                    check=all([k==temp2inst[v] for k,v in inst2temp.items()]) and all([k==inst2temp[v] for k,v in temp2inst.items()])
+                    assert check,f'Error: bidirectional dicts are incompatible; bug\n{inst2temp}\n{temp2inst}'
             i_idx,j_idx=bb
             _temp_i_idx,_temp_j_idx=inst2temp[i_idx],inst2temp[j_idx]
             assert temp_i_idx==_temp_i_idx,f'mapping mismatch -- bug'
             assert temp_j_idx==_temp_j_idx,f'mapping mismatch -- bug'
+            g['ordinals'].append(n)
+            g['maps'].append(temp2inst)
+
+        # translate each group's template interactions and atom attributes for all its bonds at once
+        new_interactions={'angles':[],'dihedrals':[],'pairs':[]}
+        atom_updates=[]
+        for (tname,ti,tj),g in groups.items():
+            T=g['T']
+            ordinals=np.array(g['ordinals'],dtype=int)
+            U=np.array(sorted(g['uniq']),dtype=int)
+            # row b, column u holds the system index of template atom U[u] for the b'th bond in this group
+            M=np.array([[m.get(x,-1) for x in U] for m in g['maps']],dtype=int).reshape(len(ordinals),len(U))
+            unmapped=(M<0).any(axis=0)
+            if unmapped.any():
+                logger.error(f'Template {tname} atoms {U[unmapped]} cannot be mapped to the system')
+                raise Exception(f'Template {tname} atoms {U[unmapped]} cannot be mapped to the system')
+            logger.debug(f'Template {tname} bond {ti}-{tj}: mapping {len(ordinals)} bonds')
+            for k,cols in [('angles',['ai','aj','ak']),('dihedrals',['ai','aj','ak','al']),('pairs',['ai','aj'])]:
+                tdf=g[k]
+                nint=tdf.shape[0]
+                if nint==0: continue
+                inst=tdf.iloc[np.tile(np.arange(nint),len(ordinals))].reset_index(drop=True)
+                for c in cols:
+                    inst[c]=M[:,np.searchsorted(U,tdf[c].to_numpy(dtype=int))].ravel()
+                inst['_bond_']=np.repeat(ordinals,nint)
+                new_interactions[k].append(inst)
+            tat=T.TopoCoord.Topology.D['atoms'].set_index('nr').loc[U]
+            atom_updates.append(pd.DataFrame({
+                '_bond_':np.repeat(ordinals,len(U)),
+                'nr':M.ravel(),
+                'type':np.tile(tat['type'].to_numpy(),len(ordinals)),
+                'charge':np.tile(tat['charge'].to_numpy(),len(ordinals))}))
+
+        # new interactions are appended in bond order, as if each bond were mapped in turn
+        for k,dfs in new_interactions.items():
+            if len(dfs)==0: continue
+            d=pd.concat(dfs,ignore_index=True).sort_values(by='_bond_',kind='stable').drop(columns='_bond_')
+            self.Topology.D[k]=pd.concat((self.Topology.D[k],d),ignore_index=True)
+        if checks.active('full'):
+            # recheck the whole system tables for nans
+            with checks.timed('map_from_templates.nan'):
+                for k,cols in [('angles',['ai','aj','ak']),('dihedrals',['ai','aj','ak','al']),('pairs',['ai','aj'])]:
+                    _nan_check(self.Topology.D[k],cols,f'system {k}')
 
-            need_new_bond_parameters=False
-            total_dcharge=0.0
-            temp_atdf=T.TopoCoord.Topology.D['atoms']
-            for temp_atom,inst_atom in temp2inst.items():
-                assert inst_atom in atdf['nr'].values,f'Error: mapped atom {inst_atom} not found in [ atoms ]'
-                inst_type,inst_charge,inst_name,inst_resn,inst_rnam=atdf[atdf['nr']==inst_atom][['type','charge','atom','resnr','residue']].values[0]
-                temp_type,temp_charge,temp_name,temp_resn,temp_rnam=temp_atdf[temp_atdf['nr']==temp_atom][['type','charge','atom','resnr','residue']].values[0]
-                # logger.debug(f'temp {temp_atom} {temp_name} {temp_rnam} {temp_resn} {temp_type} {temp_charge}')
-                # logger.debug(f'inst {inst_atom} {inst_name} {inst_rnam} {inst_resn} {inst_type} {inst_charge}')
-                if inst_type!=temp_type:
-                    logger.debug(f'changing type of inst atom {inst_atom} ({inst_resn} {inst_rnam} {inst_name}) from {inst_type} to {temp_type}')
-                    atdf.loc[atdf['nr']==inst_atom,'type']=temp_type
-                    if inst_atom==b.ai or inst_atom==b.aj:
-                        # changed type of one or both of the bond atoms
-                        need_new_bond_parameters=True
-                if inst_charge!=temp_charge:
-                    logger.debug(f'charge {inst_atom} ({inst_resn} {inst_rnam} {inst_name}) from {inst_charge} to {temp_charge}')
-                    atdf.loc[atdf['nr']==inst_atom,'charge']=temp_charge
-                    dcharge=temp_charge-inst_charge
-                    total_dcharge+=dcharge
-            mapped_inst_atoms.extend(list(temp2inst.values()))
-            if need_new_bond_parameters:
-                self.Topology.reset_override_from_type('bonds','bondtypes',inst_idx=(b.ai,b.aj))
-
-            # get all angle, dihedrals, and pairs from template that result from the existence of the specified bond
-            # temp_angles,temp_dihedrals,temp_pairs=T.get_angles_dihedrals((temp_i_idx,temp_j_idx))
-            # logger.debug(f'Mapping {temp_angles.shape[0]} angles, {temp_dihedrals.shape[0]} dihedrals, and {temp_pairs.shape[0]} pairs from template {T.name}')
-            # map from template atom indicies to system atom indicies in angles
-            # logger.debug(f'Template angles:')
-            # for ln in temp_angles.to_string().split('\n'):
-            #     logger.debug(ln)
-            inst_angles=temp_angles.copy()
-            inst_angles.ai=temp_angles.ai.map(temp2inst)
-            inst_angles.aj=temp_angles.aj.map(temp2inst)
-            inst_angles.ak=temp_angles.ak.map(temp2inst)
-            # logger.debug(f'Mapped instance angles:')
-            # for ln in inst_angles.to_string().split('\n'):
-            #     logger.debug(ln)
-            # add new angles to the system topology
-            d=self.Topology.D['angles']
-            self.Topology.D['angles']=pd.concat((d,inst_angles),ignore_index=True)                            
-            # hard check for any nan's in any atom index attribute in any angle
-            d=self.Topology.D['angles']
-            check=True
-            for a in ['ai','aj','ak']:
-                check=check and d[a].isnull().values.any()
-            if check:
-                logger.error('NAN in angles')
-                raise Exception
-
-            # logger.debug(f'Template dihedrals:')
-            # for ln in temp_dihedrals.to_string().split('\n'):
-            #     logger.debug(ln)
-            # map from template atom indicies to system atom indicies in dihedrals
-            inst_dihedrals=temp_dihedrals.copy()
-            inst_dihedrals.ai=temp_dihedrals.ai.map(temp2inst)
-            inst_dihedrals.aj=temp_dihedrals.aj.map(temp2inst)
-            inst_dihedrals.ak=temp_dihedrals.ak.map(temp2inst)
-            inst_dihedrals.al=temp_dihedrals.al.map(temp2inst)
-            # logger.debug(f'Mapped instance dihedrals:')
-            # for ln in inst_dihedrals.to_string().split('\n'):
-            #     logger.debug(ln)
-            d=inst_dihedrals
-            check=False
-            for a in ['ai','aj','ak','al']:
-                check=check or d[a].isnull().values.any()
-            if check:
-                logger.error(f'a {a} NAN in dihedrals\n{inst_dihedrals.to_string()}')
-                raise Exception
-            # add new dihedrals to global topology
-            d=self.Topology.D['dihedrals']
-            self.Topology.D['dihedrals']=pd.concat((d,inst_dihedrals),ignore_index=True)
-            # hard check for no nans
-            d=self.Topology.D['dihedrals']
-            check=True
-            for a in ['ai','aj','ak','al']:
-                check=check and d[a].isnull().values.any()
-            if check:
-                logger.error('NAN in dihedrals')
-                raise Exception
-            d=self.Topology.D['pairs']
-            check=True
-            for a in ['ai','aj']:
-                check=check and d[a].isnull().values.any()
-            if check:
-                logger.error('NAN in pairs premapping')
-                raise Exception
-
-            # double-hard check to make sure pairs can be mapped
-            k=np.array(list(temp2inst.keys()))
-            v=np.array(list(temp2inst.values()))
-            if any(np.isnan(k)):
-                logger.error('null in temp2inst keys')
-            if any(np.isnan(v)):
-                logger.error('null in temp2inst values')
-            # logger.debug(f'temp_pairs:\n{temp_pairs.to_string()}')
-            isin=[not x in temp2inst for x in temp_pairs.ai]
-            if any(isin):
-                for ii,jj in enumerate(isin):
-                    if jj:
-                        logger.error(f'atom ai {temp_pairs.ai.iloc[ii]} not in temp2inst')
-            isin=[not x in temp2inst for x in temp_pairs.aj]
-            if any(isin):
-                for ii,jj in enumerate(isin):
-                    if jj:
-                        logger.error(f'atom aj {temp_pairs.aj.iloc[ii]} not in temp2inst')
-
-            # map all ai attributes of all template pairs to global ai
-            temp_pairs.ai=temp_pairs.ai.map(temp2inst)
-            # check AGAIN for nans (I am afraid of nans)
-            if temp_pairs.ai.isnull().values.any():
-                logger.error('NAN in pairs ai')
-                raise Exception
-            # map all aj attributes of all template pairs to global ai
-            temp_pairs.aj=temp_pairs.aj.map(temp2inst)
-            # check YET AGAIN for nans (eek!)
-            if temp_pairs.aj.isnull().values.any():
-                logger.error('NAN in pairs aj')
-                raise Exception
-            # add these pairs to the topology
-            # logger.debug(f'Concatenating this pairs to global pairs')
-            # for ln in temp_pairs.to_string().split('\n'):
-            #     logger.debug(ln)
-            self.Topology.D['pairs']=pd.concat((d,temp_pairs),ignore_index=True)
-            d=self.Topology.D['pairs']
-            # check AGAIN for nans
-            check=True
-            for a in ['ai','aj']:
-                check=check and d[a].isnull().values.any()
-            if check:
-                logger.error('NAN in pairs post mapping')
-                raise Exception
-            # return temp_pairs
+        mapped_inst_atoms=[]
+        if len(atom_updates)>0:
+            # an atom mapped by more than one bond takes its attributes from the last one
+            au=pd.concat(atom_updates,ignore_index=True).sort_values(by='_bond_',kind='stable').drop_duplicates(subset='nr',keep='last')
+            rows=pd.Index(atdf['nr']).get_indexer(au['nr'])
+            assert (rows>=0).all(),f'Error: mapped atoms {au["nr"][rows<0].to_list()} not found in [ atoms ]'
+            new_types=au['type'].to_numpy()
+            new_charges=au['charge'].to_numpy()
+            retyped=atdf['type'].to_numpy()[rows]!=new_types
+            recharged=atdf['charge'].to_numpy()[rows]!=new_charges
+            logger.debug(f'Mapping changes types of {retyped.sum()} and charges of {recharged.sum()} atoms')
+            atdf.iloc[rows,atdf.columns.get_loc('type')]=new_types
+            atdf.iloc[rows,atdf.columns.get_loc('charge')]=new_charges
+            mapped_inst_atoms=au['nr'].to_list()
+            # bonds with a retyped atom need parameters for the new types
+            retyped_idx=set(au['nr'][retyped].to_list())
+            for b in bdf.itertuples():
+                if b.ai in retyped_idx or b.aj in retyped_idx:
+                    self.Topology.reset_override_from_type('bonds','bondtypes',inst_idx=(b.ai,b.aj))
         mapped_inst_atoms=list(set(mapped_inst_atoms))
         logger.debug(f'System overcharge after mapping: {self.Topology.total_charge():.4f}')
         self.adjust_charges(atoms=mapped_inst_atoms,overcharge_threshhold=overcharge_threshhold,msg=f'overcharge magnitude exceeds {overcharge_threshhold}')
 
-    def enumerate_1_4_pairs(self,at_idx):
-        """enumerate_1_4_pairs enumerate all 1-4 pair interactions resulting from new bonds in at_idx
+    def enumerate_1_4_pairs(self,at_idx=None):
+        """enumerate_1_4_pairs enumerate all 1-4 pair interactions resulting from new bonds in at_idx, or,
+        if at_idx is not given, all 1-4 pairs implied by the system's dihedrals.  Pairs whose atoms are also
+        1-2 or 1-3 neighbors (e.g., in three- and four-membered rings) are excluded.
 
-        :param at_idx: list of 2-tuples, each containing global indices of atoms that bond to each other
-        :type at_idx: list
-        :return: dataframe of all pairs
+        :param at_idx: list of tuples whose first two elements are global indices of atoms that bond to each other, defaults to None
+        :type at_idx: list, optional
+        :return: dataframe of all pairs; for new bonds, also the source of each pair ('c': across the new bond, 'l' or 'r': the new bond is terminal, enumerated only if both of its atoms have other neighbors) and the new bond 'bi'-'bj'
         :rtype: pandas.DataFrame
         """
-        pdf=self.Topology.D['pairs']
-        # each of these bonds results in 1-4 pair interactions
+        if at_idx is None:
+            return self._dihedral_1_4_pairs()
         bl=self.Topology.bondlist
-        pai=[]
-        paj=[]
-        pri=[]
-        prj=[]
-        prsource=[]
-        for p in at_idx:
-            # determine all nj--nk pairs from j-k bond, where nj are neighbors of j not including k, and nk are neighbors of k not including j
-            # and all nnj--k pairs from all nj-j bonds, where nnj are next-nearest neighbors of j excluding j
-            # and all j--nnk pairs from all k-nk bonds, where nnk are next-nearest neighbors of k excluding k
-            j,k=p
-            nj=bl.partners_of(j)
-            nj.remove(k)
-            nnj=[]
-            for nn in nj:
-                t=bl.partners_of(nn)
-                t.remove(j)
-                nnj.append(t)
-            nk=bl.partners_of(k)
-            nk.remove(j)
-            nnk=[]
-            for nn in nk:
-                t=bl.partners_of(nn)
-                t.remove(k)
-                nnk.append(t)
-            logger.debug(f'{j} {nj} {k} {nk}')
-            logger.debug(f'{nnj} {nnk}')
-            for pp in product(nj,nk):
-                jj,kk=pp
-                pai.append(jj)
-                paj.append(kk)
-                pri.append(j)
-                prj.append(k)
-                prsource.append('c')
-                for nn in nnj:
-                    for ii in nn:
-                        pai.append(ii)
-                        paj.append(k)
-                        pri.append(j)
-                        prj.append(k)
-                        prsource.append('l')
-                for nn in nnk:
-                    for ll in nn:
-                        pai.append(j)
-                        paj.append(ll)
-                        pri.append(j)
-                        prj.append(k)
-                        prsource.append('r')
-
-        pi_df=pd.DataFrame({'ai':pai,'aj':paj,'source':prsource,'bi':pri,'bj':prj})
-        pi_df.drop_duplicates(inplace=True,ignore_index=True)
+        J=np.array([int(p[0]) for p in at_idx],dtype=int)
+        K=np.array([int(p[1]) for p in at_idx],dtype=int)
+        # nj are neighbors of j not including k, and nk are neighbors of k not including j
+        bj,nj=bl.partners_of_many(J,positions=True)
+        keep=nj!=K[bj]
+        bj,nj=bj[keep],nj[keep]
+        bk,nk=bl.partners_of_many(K,positions=True)
+        keep=nk!=J[bk]
+        bk,nk=bk[keep],nk[keep]
+        # nj--nk pairs across each j-k bond
+        c=pd.DataFrame({'b':bj,'ai':nj}).merge(pd.DataFrame({'b':bk,'aj':nk}),on='b',how='inner')
+        c['source']='c'
+        # pairs through a terminal new bond are enumerated only for bonds with neighbors on both sides
+        both=np.isin(np.arange(len(J)),bj)&np.isin(np.arange(len(K)),bk)
+        # nnj--k pairs, where nnj are neighbors of nj excluding j
+        p,nnj=bl.partners_of_many(nj,positions=True)
+        keep=(nnj!=J[bj[p]])&both[bj[p]]
+        l=pd.DataFrame({'b':bj[p][keep],'ai':nnj[keep],'aj':K[bj[p][keep]],'source':'l'})
+        # j--nnk pairs, where nnk are neighbors of nk excluding k
+        p,nnk=bl.partners_of_many(nk,positions=True)
+        keep=(nnk!=K[bk[p]])&both[bk[p]]
+        r=pd.DataFrame({'b':bk[p][keep],'ai':J[bk[p][keep]],'aj':nnk[keep],'source':'r'})
+        pi_df=pd.concat((c,l,r),ignore_index=True).sort_values(by='b',kind='stable')
+        pi_df['bi']=J[pi_df['b'].to_numpy()]
+        pi_df['bj']=K[pi_df['b'].to_numpy()]
+        pi_df=pi_df[['ai','aj','source','bi','bj']].reset_index(drop=True)
+        # exclude pairs that are also 1-2 or 1-3, querying the bondlist index only for the atoms in pairs
+        if pi_df.shape[0]>0:
+            a=pi_df['ai'].to_numpy(dtype=int)
+            b=pi_df['aj'].to_numpy(dtype=int)
+            pa,na=bl.partners_of_many(a,positions=True)
+            pb,nb=bl.partners_of_many(b,positions=True)
+            bonded=np.zeros(len(a),dtype=bool)
+            bonded[pa[na==b[pa]]]=True
+            M=int(max(na.max() if len(na)>0 else 0,nb.max() if len(nb)>0 else 0))+1
+            ka=pa*M+na
+            common=np.zeros(len(a),dtype=bool)
+            common[pa[np.isin(ka,pb*M+nb)]]=True
+            pi_df=pi_df[(a!=b)&~bonded&~common]
+        pi_df=pi_df.drop_duplicates(ignore_index=True)
         return pi_df
 
-    def update_topology_and_coordinates(self,bdf,template_dict={},write_mapper_to=None,**kwargs):
+    def _dihedral_1_4_pairs(self):
+        """_dihedral_1_4_pairs returns the unique 1-4 pairs formed by the end atoms of all dihedrals,
+        excluding any that are bonded or the end atoms of an angle
+
+        :return: dataframe of pairs, columns 'ai' and 'aj', with ai<aj
+        :rtype: pandas.DataFrame
+        """
+        D=self.Topology.D
+        d=D['dihedrals']
+        lo=np.minimum(d['ai'].to_numpy(dtype=int),d['al'].to_numpy(dtype=int))
+        hi=np.maximum(d['ai'].to_numpy(dtype=int),d['al'].to_numpy(dtype=int))
+        M=int(max(hi.max() if len(hi)>0 else 0,D['atoms']['nr'].max() if 'atoms' in D else 0))+1
+        key=np.unique(lo*M+hi)
+        key=key[key//M!=key%M]
+        for directive,a,b in [('bonds','ai','aj'),('angles','ai','ak')]:
+            if directive in D and D[directive].shape[0]>0:
+                x=D[directive][a].to_numpy(dtype=int)
+                y=D[directive][b].to_numpy(dtype=int)
+                key=key[~np.isin(key,np.minimum(x,y)*M+np.maximum(x,y))]
+        return pd.DataFrame({'ai':key//M,'aj':key%M})
+
+    def update_topology_and_coordinates(self,bdf,template_dict={},template_index=None,write_mapper_to=None,**kwargs):
         """update_topology_and_coordinates updates global topology and necessary atom attributes in the configuration to reflect formation of all bonds listed in `keepbonds`
 
         :param bdf: bonds dataframe, columns 'ai', 'aj', 'reactantName'
         :type bdf: pandas.DataFrame
         :param template_dict: dictionary of molecule templates keyed on molecule name
         :type template_dict: dict
+        :param template_index: bond template index from build_template_index, defaults to None
+        :type template_index: dict, optional
         :return: 3-tuple: new topology file name, new coordinate file name, list of bonds with atom indices updated to reflect any atom deletions
         :rtype: 3-tuple
         
@@ -465,6 +426,7 @@ class TopoCoord:
         explicit_sacH=kwargs.get('explicit_sacH',{})
         template_source=kwargs.get('template_source','internal')
         overcharge_threshhold=kwargs.get('overcharge_threshhold',0.1)
+        max_ring_size=kwargs.get('max_ring_size',0)
         logger.debug(f'begins.')
         if bdf.shape[0]>0:
             assert bdf['ai'].dtype==int
@@ -472,7 +434,7 @@ class TopoCoord:
             # pull out just the atom index pairs (first element of each tuple)
             at_idx=[(int(x.ai),int(x.aj),x.order) for x in bdf.itertuples()]
             logger.debug(f'Making {len(at_idx)} bonds.')
-            idx_to_delete=self.make_bonds(at_idx,explicit_sacH=explicit_sacH)
+            idx_to_delete=self.make_bonds(at_idx,explicit_sacH=explicit_sacH,max_ring_size=max_ring_size)
             logger.debug(f'Deleting {len(idx_to_delete)} atoms.')
             idx_mapper=self.delete_atoms(idx_to_delete) # will result in full reindexing
             # logger.debug(f'null check')
@@ -490,7 +452,7 @@ class TopoCoord:
                     self.increment_gro_attribute_by_attributes('nreactions',{'globalIdx':idx})
             if template_source=='internal':
                 logger.debug(f'calling map_from_templates')
-                self.map_from_templates(ri_bdf,template_dict,overcharge_threshhold=overcharge_threshhold)
+                self.map_from_templates(ri_bdf,template_dict,template_index=template_index,overcharge_threshhold=overcharge_threshhold)
             logger.debug(f'1-4 pair update')
             pi_df=self.enumerate_1_4_pairs(at_idx)
             self.Topology.null_check(msg='update_topology_and_coordinates')
@@ -1918,38 +1880,28 @@ class TopoCoord:
             return []
         return [ci,cj]
 
+    @checks.timed_check('TopoCoord.check_your_topology')
     def check_your_topology(self):
-        """check_your_topology checks topology for duplicate 1-4 pair interactions and deletes them
+        """check_your_topology checks topology for duplicate 1-4 pair interactions, deletes them, and
+        writes the checked topology to checked.top; only done under the 'full' check level
         """
+        if not checks.active('full'):
+            return
         T=self.Topology
         C=self.Coordinates
-        aT={}
         pdf=T.D['pairs']
-        aT['dx']=[]
-        aT['dy']=[]
-        aT['dz']=[]
-        checked=[]
-        drops=[]
-        for i,r in pdf.iterrows():
-            ai,aj=min([r.ai,r.aj]),max([r.ai,r.aj])
-            assert ai!=aj
-            if not (ai,aj) in checked: 
-                checked.append((ai,aj))
-            else:
-                # print(f'repeated pair {ai} {aj}')
-                drops.append(i)
-            ri=self.get_R(ai)
-            rj=self.get_R(aj)
-            D=C.mic(ri-rj,pbc=[1,1,1])
-            aT['dx'],aT['dy'],aT['dz']=D
-        print(f'{len(drops)} duplicate pairs detected')
-        T.D['pairs']=pdf.drop(drops)
-        pdf['dx']=aT['dx']
-        pdf['dy']=aT['dy']
-        pdf['dz']=aT['dz']
-        print(pdf.sort_values(by='dx').head(3).to_string())
-        print(pdf.sort_values(by='dy').head(3).to_string())
-        print(pdf.sort_values(by='dz').head(3).to_string())
+        assert not (pdf['ai']==pdf['aj']).any(),f'Error: self-pair in [ pairs ]'
+        pdf,ndrops=canonical_pair_dedup(pdf)
+        logger.debug(f'{ndrops} duplicate pairs detected')
+        T.D['pairs']=pdf
+        pdf=pdf.copy()
+        pos=C.A.set_index('globalIdx')[['posX','posY','posZ']]
+        D=pos.loc[pdf['ai']].to_numpy()-pos.loc[pdf['aj']].to_numpy()
+        D=minimum_image(D,C.box)
+        pdf['dx'],pdf['dy'],pdf['dz']=D[:,0],D[:,1],D[:,2]
+        logger.debug(pdf.sort_values(by='dx').head(3).to_string())
+        logger.debug(pdf.sort_values(by='dy').head(3).to_string())
+        logger.debug(pdf.sort_values(by='dz').head(3).to_string())
         self.write_top('checked.top')
 
     def flip_stereocenters(self,idxlist):
@@ -2077,43 +2029,84 @@ class TopoCoord:
                     logger.debug(f'Cannot flip at stereocenter {idx}.')
 
 
-def find_template(BT:BondTemplate,moldict):
+def _template_signature(moldict):
+    return tuple((name,id(T),len(T.bond_templates)) for name,T in moldict.items())
+
+def build_template_index(moldict):
+    """build_template_index builds the dictionary that maps each orientation-normalized bond template key
+    to its template molecule and bond index, for passing to find_template
+
+    Entries follow the search order of the linear scan: the first molecule in moldict with a matching template 
+    wins, and within a molecule an exact match is preferred to a reversed one.  The index also records a
+    signature of moldict (its molecule names and identities and their numbers of bond templates) so that
+    find_template can tell when the index no longer describes moldict.
+
+    :param moldict: dictionary of available molecules
+    :type moldict: MoleculeDict
+    :return: dictionary with keys 'signature' and 'index', the latter keyed on (template key, query-is-flipped flag)
+    :rtype: dict
+    """
+    index={}
+    for template_name,T in moldict.items():
+        found={}
+        for b_idx,bt in enumerate(T.bond_templates):
+            key,flipped=bt.key()
+            for qflipped in [False,True]:
+                reverse_bond=flipped!=qflipped
+                k=(key,qflipped)
+                if not k in found or (found[k][2] and not reverse_bond):
+                    found[k]=(T,b_idx,reverse_bond)
+        for k,v in found.items():
+            if not k in index:
+                index[k]=v
+    logger.debug(f'Indexed {len(index)//2} unique bond templates')
+    return {'signature':_template_signature(moldict),'index':index}
+
+def find_template(BT:BondTemplate,moldict,template_index=None):
     """find_template searches the dictionary of available molecules to identify a bond template that matches the passed-in template, returning the corresponding template molecule and reaction-bond
 
+    If a template_index from build_template_index is passed, the lookup uses it, first rebuilding it
+    in place if moldict has changed since it was built; otherwise the molecules are searched in order.
+
     :param BT: bond template to search for
     :type BT: BondTemplate
     :param moldict: dictionary of available molecule
     :type moldict: MoleculeDict
+    :param template_index: index of the bond templates in moldict, defaults to None
+    :type template_index: dict, optional
     :raises Exception: if no matching template is found
     :return: template Molecule object, corresponding ReactionBond object from that template, and a boolean flag indicating whether or not the match required a symmetric-reversal of the template
     :rtype: tuple(Molecule,ReactionBond,bool)
     """
+    if template_index!=None:
+        if template_index.get('signature',None)!=_template_signature(moldict):
+            logger.debug(f'Molecule dictionary has changed; rebuilding bond template index')
+            template_index.update(build_template_index(moldict))
+        key,flipped=BT.key()
+        hit=template_index['index'].get((key,flipped),None)
+        if hit==None:
+            logger.error(f'No template is found for {str(BT)}')
+            raise Exception('you have a bond for which I cannot find a template')
+        use_T,b_idx,reverse_bond=hit
+        logger.debug(f'Using template {use_T.name} and bond index {b_idx}')
+        return use_T,use_T.reaction_bonds[b_idx],reverse_bond
     use_T=None
-    b_idx=-1
-    reverse_bond=False
     for template_name,T in moldict.items():
-        # if BT in T.bond_templates:
-        #     use_T=T
-        #     break
-        use_T=None
+        use_b_idx=-1
+        reverse_bond=False
         for b_idx in range(len(T.bond_templates)):
             bt=T.bond_templates[b_idx]
-            # logger.debug(f'comparing to {T.name} {str(bt)}')
             if bt==BT:
-                # logger.debug(f'TRUE')
-                use_T=T
+                use_T,use_b_idx,reverse_bond=T,b_idx,False
                 break
-            if bt.is_reverse_of(BT):
-                # logger.debug(f'TRUE, but...')
-                use_T=T
-                reverse_bond=True
-                # logger.debug(f'reversed bond instance {str(RB)}')
+            if use_T==None and bt.is_reverse_of(BT):
+                use_T,use_b_idx,reverse_bond=T,b_idx,True
         if use_T!=None:
             break
     else:
         logger.error(f'No template is found for {str(BT)}')
         raise Exception('you have a bond for which I cannot find a template')
-    logger.debug(f'Using template {use_T.name} and bond index {b_idx}')
-    rb=use_T.reaction_bonds[b_idx]
+    logger.debug(f'Using template {use_T.name} and bond index {use_b_idx}')
+    rb=use_T.reaction_bonds[use_b_idx]
     return use_T,rb,reverse_bond
 
@@ -17,7 +17,9 @@ from scipy.constants import physical_constants
 from networkx.readwrite import json_graph
 from itertools import product
 from HTPolyNet.bondlist import Bondlist
-from HTPolyNet.ring import Ring, RingList
+from HTPolyNet.dataframetools import idx_lookup, lookup_as_dict, drop_rows_with_idx, remap_idx_columns, canonical_pair_dedup, match_rows
+from HTPolyNet.ring import Ring, RingList, rings_through_bond
+import HTPolyNet.checks as checks
 
 logger=logging.getLogger(__name__)
 
@@ -63,8 +65,32 @@ def df_typeorder(df,typs):
     :param typs: list of type-attribute names; typically ['i','j',...]
     :type typs: list
     """
-    for i in df.index:
-        df.loc[i,typs]=typeorder(tuple(df.loc[i,typs]))
+    c=df_canonical_types(df,typs)
+    for t in typs:
+        df[t]=c[t]
+
+def df_canonical_types(df,typs):
+    """df_canonical_types vectorized version of typeorder; returns a new dataframe whose columns
+    typs hold the canonically ordered atom types (or atom indices) of each row of df
+
+    :param df: dataframe with type (or atom index) columns
+    :type df: pandas.DataFrame
+    :param typs: list of 2, 3, or 4 column names; typically ['i','j',...] or ['ai','aj',...]
+    :type typs: list
+    :return: dataframe with columns typs, same index as df
+    :rtype: pandas.DataFrame
+    """
+    a=[df[t].to_numpy() for t in typs]
+    n=len(typs)
+    if n==2:
+        flip=a[0]>a[1]
+    elif n==3:
+        flip=a[0]>a[2]
+    elif n==4:
+        flip=(a[1]>a[2])|((a[1]==a[2])&(a[0]>a[3]))
+    else:
+        return df[typs].copy()
+    return pd.DataFrame({t:np.where(flip,a[n-1-k],a[k]) for k,t in enumerate(typs)},index=df.index)
 
 _GromacsIntegers_=('nr','atnum','resnr','ai','aj','ak','al','#mols','nrexcl','funct','func','nbfunc','comb-rule')
 _GromacsFloats_=('charge','mass','chargeB','massB',*tuple([f'c{i}' for i in range(5)]),
@@ -78,6 +104,7 @@ def typedata(h,s):
 
 _GromacsExtensiveDirectives_=['atoms','pairs','bonds','angles','dihedrals']
 _NonGromacsExtensiveDirectives_=['mol2_bonds']
+_GromacsTypeDirectives_=['atomtypes','bondtypes','angletypes','dihedraltypes']
 _GromacsTopologyDirectiveOrder_=['defaults','atomtypes','bondtypes','angletypes','dihedraltypes','moleculetype','atoms','pairs','bonds','angles','dihedrals','system','molecules']
 _GromacsTopologyDirectiveHeaders_={
     'atoms':['nr', 'type', 'resnr', 'residue', 'atom', 'cgnr', 'charge', 'mass','typeB', 'chargeB', 'massB'],
@@ -144,6 +171,55 @@ def select_topology_type_option(options,typename='dihedraltypes',rule='stiffest'
         return sorted_options[0]
     return []
 
+def type_registry(topologies,typename='dihedraltypes',funcidx=4):
+    """type_registry builds a single registry of the [ typename ] entries of function type funcidx
+    from a collection of topologies, keyed on canonical type tuple.  For each topology, only the
+    first entry for a given type tuple is registered (the same entry Topology.report_type returns).
+
+    :param topologies: dictionary of Topology instances keyed by name (e.g., molecule name)
+    :type topologies: dict
+    :param typename: name of type directive, defaults to 'dihedraltypes'
+    :type typename: str, optional
+    :param funcidx: function type of interaction, defaults to 4
+    :type funcidx: int, optional
+    :return: registry dataframe with canonical type columns, parameter columns, and a 'source' column naming the topology
+    :rtype: pandas.DataFrame
+    """
+    hashables=_GromacsTopologyHashables_[typename]
+    frames=[]
+    for name,T in topologies.items():
+        if not typename in T.D: continue
+        df=T.D[typename]
+        df=df[df['func']==funcidx]
+        if df.shape[0]==0: continue
+        c=pd.concat((df_canonical_types(df,hashables),df.drop(columns=hashables)),axis=1)
+        c=c.drop_duplicates(subset=hashables,keep='first')
+        c['source']=name
+        frames.append(c)
+    if len(frames)==0:
+        return pd.DataFrame(columns=_GromacsTopologyDirectiveHeaders_[typename]+['source'])
+    return pd.concat(frames,ignore_index=True)
+
+def type_conflicts(registry,typename='dihedraltypes'):
+    """type_conflicts identifies all type tuples in a type registry that are registered with more than one distinct set of parameters
+
+    :param registry: registry dataframe generated by type_registry
+    :type registry: pandas.DataFrame
+    :param typename: name of type directive, defaults to 'dihedraltypes'
+    :type typename: str, optional
+    :return: dictionary keyed on conflicting canonical type tuples; values are lists of the distinct parameter lists
+    :rtype: dict
+    """
+    hashables=_GromacsTopologyHashables_[typename]
+    headers=[h for h in _GromacsTopologyDirectiveHeaders_[typename] if not h in hashables]
+    distinct=registry.drop_duplicates(subset=hashables+headers)
+    nopts=distinct.groupby(hashables,sort=False)[headers[0]].transform('size')
+    conflicts={}
+    for r in distinct[nopts.to_numpy()>1].itertuples(index=False):
+        rd=r._asdict()
+        conflicts.setdefault(tuple(rd[h] for h in hashables),[]).append([rd[h] for h in headers])
+    return conflicts
+
 class Topology:
     """ Class for handling gromacs top data
     """
@@ -163,7 +239,10 @@ class Topology:
         self.D['system']=pd.DataFrame({'name':[system_name]})
         ''' bondlist: a class that owns a dictionary keyed on atom global index with values that are lists of global atom indices bound to the key '''
         self.bondlist=Bondlist()
-        self.residue_network=nx.Graph()
+        self.residue_network=nx.DiGraph()
+        self.resid_clusters={}
+        self._type_indices={}
+        self._type_versions={}
         self.rings=RingList([])
         self.empty=True
 
@@ -284,6 +363,103 @@ class Topology:
                 for x,y in zip(bmi,mbmi):
                     logger.debug(f'{x} {y} {x==y}')
 
+    def type_index(self,typename):
+        """type_index returns a hash index over the [ typename ] dataframe keyed on canonically-ordered
+        type tuples (see typeorder).  The index is cached and rebuilt whenever the dataframe is replaced
+        or its version is bumped; Topology methods that edit a type dataframe in place bump its version
+        themselves, and any other code that does so must call invalidate_type_index.
+
+        :param typename: name of type directive ('atomtypes','bondtypes','angletypes','dihedraltypes')
+        :type typename: str
+        :return: dictionary keyed on canonical type tuples with values that are lists of row labels
+        :rtype: dict
+        """
+        return self._type_table(typename)[0]
+
+    def _type_table(self,typename):
+        if not typename in self.D:
+            return {},pd.DataFrame()
+        df=self.D[typename]
+        version=self._type_versions.get(typename,0)
+        cached=self._type_indices.get(typename,None)
+        if cached is not None and cached[0] is df and cached[1]==version and cached[2]==len(df):
+            return cached[3],cached[4]
+        hashables=_GromacsTopologyHashables_[typename]
+        c=df_canonical_types(df,hashables)
+        idx={}
+        for row,key in zip(df.index,zip(*[c[h].to_list() for h in hashables])):
+            idx.setdefault(key,[]).append(row)
+        ctab=pd.concat((c,df.drop(columns=hashables)),axis=1)
+        ctab=ctab[~c.duplicated(keep='first')]
+        self._type_indices[typename]=(df,version,len(df),idx,ctab)
+        return idx,ctab
+
+    def invalidate_type_index(self,typename=None):
+        """invalidate_type_index bumps the version of a type directive and discards its cached hash index,
+        so that it is rebuilt on next use; must be called after any in-place edit of self.D[typename]
+
+        :param typename: name of type directive, defaults to None (all type directives)
+        :type typename: str, optional
+        """
+        for t in (_GromacsTypeDirectives_ if typename is None else [typename]):
+            self._type_versions[t]=self._type_versions.get(t,0)+1
+            self._type_indices.pop(t,None)
+
+    def rebuild_type_indices(self):
+        """rebuild_type_indices rebuilds the hash indices of all type directives
+        """
+        self.invalidate_type_index()
+        for t in _GromacsTypeDirectives_:
+            self._type_table(t)
+
+    def atom_types_of(self,idx):
+        """atom_types_of returns the atom types of the atoms with global indices idx
+
+        :param idx: atom global indices
+        :type idx: array-like of int
+        :return: atom types
+        :rtype: numpy.ndarray
+        """
+        adf=self.D['atoms']
+        nr=adf['nr'].to_numpy(dtype=int)
+        lookup=np.empty(nr.max()+1,dtype=object)
+        lookup[nr]=adf['type'].to_numpy()
+        return lookup[np.asarray(idx,dtype=int)]
+
+    def type_parameters(self,typename,types):
+        """type_parameters looks up type parameters for every row of types with a single join
+        against the canonical type table
+
+        :param typename: name of type directive ('bondtypes','angletypes','dihedraltypes')
+        :type typename: str
+        :param types: dataframe whose columns are the type hashables of typename (e.g., 'i','j'), in any order within each row
+        :type types: pandas.DataFrame
+        :return: dataframe with canonical type columns and all type parameters, one row per row of types; parameters are NaN where no type is found.  For dihedraltypes, only the first matching type is reported.
+        :rtype: pandas.DataFrame
+        """
+        hashables=_GromacsTopologyHashables_[typename]
+        q=df_canonical_types(types,hashables).reset_index(drop=True)
+        idx,ctab=self._type_table(typename)
+        if ctab.empty:
+            return q
+        return q.merge(ctab,on=hashables,how='left')
+
+    def interaction_type_parameters(self,interactionname,inst):
+        """interaction_type_parameters looks up the type parameters of each interaction in dataframe inst
+
+        :param interactionname: name of interaction directive ('bonds','angles','dihedrals')
+        :type interactionname: str
+        :param inst: dataframe with atom-index columns of the interaction (e.g., 'ai','aj')
+        :type inst: pandas.DataFrame
+        :return: see type_parameters
+        :rtype: pandas.DataFrame
+        """
+        typename=interactionname[:-1]+'types'
+        ins_hashables=_GromacsTopologyHashables_[interactionname]
+        typ_hashables=_GromacsTopologyHashables_[typename]
+        types=pd.DataFrame({t:self.atom_types_of(inst[i]) for i,t in zip(ins_hashables,typ_hashables)})
+        return self.type_parameters(typename,types)
+
     def shiftatomsidx(self,idxshift,directive,rows=[],idxlabels=[]):
         """shiftatomsidx shifts all atoms indexes in topology directive dataframe
 
@@ -309,6 +485,25 @@ class Topology:
         for c in nx.chordless_cycles(g):
             self.rings.append(Ring(c))
 
+    def update_rings(self,pairs,max_ring_size=8):
+        """update_rings adds to the ring list any new rings of up to max_ring_size atoms formed by the new bonds in pairs;
+        only the neighborhood of each new bond is searched, so the full detect_rings is needed only at initialization
+
+        :param pairs: list of tuples whose first two elements are global indices of newly bonded atoms; these bonds must already be in the topology
+        :type pairs: list
+        :param max_ring_size: maximum number of atoms in a ring, defaults to 8
+        :type max_ring_size: int, optional
+        :return: number of new rings
+        :rtype: int
+        """
+        found=[]
+        for p in pairs:
+            found.extend([Ring(x) for x in rings_through_bond(self.bondlist,int(p[0]),int(p[1]),max_size=max_ring_size)])
+        nadded=self.rings.merge(found)
+        if nadded>0:
+            logger.debug(f'{nadded} new rings formed')
+        return nadded
+
     def read_tpx(self,filename):
         assert os.path.exists(filename), f'Error: {filename} not found.'
         with open(filename,'r') as f:
@@ -339,37 +534,28 @@ class Topology:
         :raises Exception: Dies if self is missing an atoms dataframe
         """
         if count>0:
-            counts={k:0 for k in _GromacsExtensiveDirectives_}
-            counts.update({k:0 for k in _NonGromacsExtensiveDirectives_})
-            for t in _GromacsExtensiveDirectives_:
-                if t in self.D:
-                    counts[t]=len(self.D[t])
-                for t in _NonGromacsExtensiveDirectives_:
-                    if t in self.D:
-                        counts[t]=len(self.D[t])
-            try:
-                idxshift=counts['atoms']
-            except:
+            if not 'atoms' in self.D:
                 raise Exception(f'Error: expected an "atoms" dataframe')
+            idxshift=len(self.D['atoms'])
+            copy_shift=np.arange(count)*idxshift
             for t in _GromacsExtensiveDirectives_:
                 if t in self.D:
-                    self.D[t]=pd.concat([self.D[t]]*count,ignore_index=True)
+                    d=self.D[t]
+                    n=len(d)
+                    d=d.iloc[np.tile(np.arange(n),count)].reset_index(drop=True)
+                    shifts=np.repeat(copy_shift,n)
+                    for c in _GromacsTopologyHashables_[t]:
+                        d[c]=d[c].to_numpy()+shifts
+                    if t=='atoms':
+                        d['resnr']=d['resnr'].to_numpy()+np.repeat(np.arange(count),n)
+                    self.D[t]=d
             new_rings=RingList([])
             for c in range(1,count):
-                self.shiftatomsidx(idxshift*c,'atoms',rows=[(c*counts['atoms']),((c+1)*counts['atoms'])],idxlabels=['nr'])
-                self.shiftatomsidx(c,'atoms',rows=[(c*counts['atoms']),((c+1)*counts['atoms'])],idxlabels=['resnr'])
-                self.shiftatomsidx(idxshift*c,'bonds',rows=[(c*counts['bonds']),((c+1)*counts['bonds'])],idxlabels=['ai','aj'])
-                self.shiftatomsidx(idxshift*c,'mol2_bonds',rows=[(c*counts['mol2_bonds']),((c+1)*counts['mol2_bonds'])],idxlabels=['ai','aj'])
-                self.shiftatomsidx(idxshift*c,'pairs',rows=[(c*counts['pairs']),((c+1)*counts['pairs'])],idxlabels=['ai','aj'])
-                self.shiftatomsidx(idxshift*c,'angles',rows=[(c*counts['angles']),((c+1)*counts['angles'])],idxlabels=['ai','aj','ak'])
-                self.shiftatomsidx(idxshift*c,'dihedrals',rows=[(c*counts['dihedrals']),((c+1)*counts['dihedrals'])],idxlabels=['ai','aj','ak','al'])
-                new_ringblock=RingList([])
-                for r in self.rings:
-                    new_ringblock.append(r.copy().shift(idxshift*c))
-                new_rings.extend(new_ringblock)
+                new_rings.extend([Ring([x+int(copy_shift[c]) for x in r.idx]) for r in self.rings])
             self.rings.extend(new_rings)
             if 'bonds' in self.D:
                 self.bondlist=Bondlist.fromDataFrame(self.D['bonds'])
+            self.reset_residue_network()
 
     @classmethod
     def from_ex(cls,other):
@@ -416,6 +602,8 @@ class Topology:
                 else:
                     self.D[k].to_csv(filename,sep=' ',mode='a',index=False,header=True,doublequote=False)
                 self.D[k].replace(pd.NA,_PAD_,inplace=True)
+                if k in _GromacsTypeDirectives_:
+                    self.invalidate_type_index(k)
                 with open(filename,'a') as f:
                     f.write('\n')
         with open(filename,'a') as f:
@@ -428,15 +616,18 @@ class Topology:
         :type msg: str, optional
         :raises Exception: exits if a NaN is found
         """
-        check = True
-        for k in _GromacsTopologyDirectiveOrder_:
-            if k in self.D:
-                if k in _GromacsTopologyHashables_:
-                    for a in _GromacsTopologyHashables_[k]:
-                        check=any(self.D[k][a].isnull())
-                        if check:
-                            logger.debug(f'{msg} null in {k} {a}\n{self.D[k].to_string()}')
-                            raise Exception('NaN error')
+        if not checks.active('cheap'): return
+        with checks.timed('Topology.null_check'):
+            for k in _GromacsTopologyDirectiveOrder_:
+                if k in self.D and k in _GromacsTopologyHashables_:
+                    cols=[a for a in _GromacsTopologyHashables_[k] if a in self.D[k].columns]
+                    if not self.D[k][cols].isnull().to_numpy().any(): continue
+                    bad=[a for a in cols if self.D[k][a].isnull().any()]
+                    if checks.active('full'):
+                        logger.debug(f'{msg} null in {k} {bad}\n{self.D[k].to_string()}')
+                    else:
+                        logger.debug(f'{msg} null in {k} {bad}')
+                    raise Exception('NaN error')
 
     def total_charge(self):
         """Compute and return total system charge
@@ -544,63 +735,15 @@ class Topology:
         :type pairs: list, optional
         :raises Exception: dies if an existing bond is in the list of pairs
         """
-        # logger.debug('begins')
-        at=self.D['atoms']
-        ij=self.D['bondtypes'].set_index(['i','j'])
-        #mb=self.D['mol2_bonds']
-        bmi=self.D['bonds'].set_index(['ai','aj']).sort_index().index
-        pmi=self.D['pairs'].set_index(['ai','aj']).sort_index().index
+        bmi=set(zip(self.D['bonds']['ai'].to_list(),self.D['bonds']['aj'].to_list()))
         newbonds=[]
         for b in pairs:
-            # logger.debug(f'{b}')
-            # assert type(b[0])==int
             bondtuple=(int(b[0]),int(b[1]))
             order=int(b[2])
             ai,aj=idxorder(bondtuple)
-            assert type(ai)==int
-            assert type(aj)==int
-            '''
-            if this bond is not in the topology, then add it
-            '''
             if not (ai,aj) in bmi:
                 newbonds.append((ai,aj))
-                # logger.debug(f'asking types of {ai} and {aj}; at.shape {at.shape}')
-                it=at.iloc[ai-1].type
-                jt=at.iloc[aj-1].type
-                idx=typeorder((it,jt))
-                if idx in ij.index:
-                    bt=ij.loc[idx,'func']  # why don't i need need values[0]
-                    kb=ij.loc[idx,'kb']
-                    b0=ij.loc[idx,'b0']
-                else:
-                    logger.debug(f'no bondtype {idx} found; using placeholder parameters')
-                    bt=1
-                    b0=0.15
-                    kb=999999
-                    # raise Exception(f'no bondtype {idx} found.')
-                '''
-                add a new bond!
-                '''
-                h=_GromacsTopologyDirectiveHeaders_['bonds']
-                data=[ai,aj,bt,b0,kb]  # this new bond will have override parameters
-                assert len(h)==len(data), 'Error: not enough data for new bond?'
-                bonddict={k:[v] for k,v in zip(h,data)}
-                bdtoadd=pd.DataFrame(bonddict)
-                self.D['bonds']=pd.concat((self.D['bonds'],bdtoadd),ignore_index=True)
-                # logger.info(f'add_bond:\n{bdtoadd.to_string()}')
-                logger.debug(f'just added {bonddict}')
-                if 'mol2_bonds' in self.D:
-                    data=[len(self.D['mol2_bonds']),ai,aj,1] # assume single bond
-                    bonddict={k:[v] for k,v in zip(['bondIdx','ai','aj','order'],data)}
-                    self.D['mol2_bonds']=pd.concat((self.D['mol2_bonds'],pd.DataFrame(bonddict)),ignore_index=True)
-                # remove this pair from pairs if it's in there (it won't be)
-                if idx in pmi:
-                    logger.debug(f'Warning: new bond {ai}-{aj} was evidently in the [ pairs ]!')
-                    d=self.D['pairs']
-                    indexes_to_drop=d[(d.ai.isin(idx))&(d.aj.isin(idx))].index
-                    logger.debug(f'Dropping [ pair ]:\n{d[indexes_to_drop].to_string()}')
-                    indexes_to_keep=set(range(d.shape[0]))-set(indexes_to_drop)
-                    self.D['pairs']=d.take(list(indexes_to_keep)).reset_index(drop=True)
+                bmi.add((ai,aj))
             else:
                 ''' 
                 if it is, do nothing; it will be templated; if mol2_bonds are present (usually
@@ -611,11 +754,39 @@ class Topology:
                     mb=self.D['mol2_bonds']
                     bi=(mb['ai']==ai)&(mb['aj']==aj)
                     mb.loc[bi,'order']=order
+        if len(newbonds)>0:
+            '''
+            add the new bonds, with override parameters taken from the bondtypes
+            '''
+            nb=pd.DataFrame({'ai':[b[0] for b in newbonds],'aj':[b[1] for b in newbonds]})
+            tp=self.interaction_type_parameters('bonds',nb)
+            missing=tp['kb'].isna() if 'kb' in tp else pd.Series([True]*nb.shape[0])
+            for r in tp[missing.to_numpy()].itertuples():
+                logger.debug(f'no bondtype {(r.i,r.j)} found; using placeholder parameters')
+            h=_GromacsTopologyDirectiveHeaders_['bonds']
+            bdtoadd=pd.DataFrame({
+                h[0]:nb['ai'],h[1]:nb['aj'],
+                h[2]:np.where(missing,1,tp['func'] if 'func' in tp else 1).astype(int),
+                h[3]:np.where(missing,0.15,tp['b0'] if 'b0' in tp else 0.15),
+                h[4]:np.where(missing,999999,tp['kb'] if 'kb' in tp else 999999)})
+            self.D['bonds']=pd.concat((self.D['bonds'],bdtoadd),ignore_index=True)
+            if 'mol2_bonds' in self.D:
+                n0=len(self.D['mol2_bonds'])
+                mb=pd.DataFrame({'bondIdx':np.arange(n0,n0+nb.shape[0]),'ai':nb['ai'],'aj':nb['aj'],'order':1}) # assume single bond
+                self.D['mol2_bonds']=pd.concat((self.D['mol2_bonds'],mb),ignore_index=True)
+            # remove any new bonds from pairs if they are in there (they won't be)
+            d=self.D['pairs']
+            pk=set(newbonds)
+            inpairs=np.array([x in pk for x in zip(d['ai'].to_list(),d['aj'].to_list())],dtype=bool)
+            if inpairs.any():
+                logger.debug(f'Warning: new bond(s) were evidently in the [ pairs ]!\n{d[inpairs].to_string()}')
+                self.D['pairs']=d[~inpairs].reset_index(drop=True)
         '''
         update the bondlist
         '''
         for b in newbonds:
             self.bondlist.append(b)
+        self.add_residue_edges(newbonds)
         logger.debug(f'Added {len(newbonds)} new bonds')
 
 
@@ -631,149 +802,77 @@ class Topology:
         :return: old-index-to-new-index mapper
         :rtype: dict
         """
-        #logger.debug(f'Delete atoms: {idx}')
         paranoid_about_pairs=kwargs.get('paranoid_about_pairs',False)
-        self.null_check(msg='beginning of delete atoms')
-        # logger.debug(f'idx {idx}')
+        debug=kwargs.get('debug',checks.active('full'))
+        if debug: self.null_check(msg='beginning of delete atoms')
+        idx=np.asarray(list(idx),dtype=int)
+        if self.residue_network.number_of_nodes()>0 and 'bonds' in self.D:
+            dropped_bonds=self.D['bonds'][self.D['bonds'].ai.isin(idx)|self.D['bonds'].aj.isin(idx)]
+            if len(self.interresidue_bonds(dropped_bonds))>0:
+                self.reset_residue_network()
         d=self.D['atoms']
-        new_idx=[]
-        indexes_to_drop=d[d.nr.isin(idx)].index
-        total_missing_charge=d.loc[indexes_to_drop]['charge'].sum()
-        logger.debug(f'Deleting {d.loc[indexes_to_drop].shape[0]} [ atoms ]; charge to make up: {total_missing_charge:.4f}')#:\n{d.loc[indexes_to_drop].to_string()}')
-        indexes_to_keep=set(range(d.shape[0]))-set(indexes_to_drop)
-        self.D['atoms']=d.take(list(indexes_to_keep)).reset_index(drop=True)
+        keep,lookup=idx_lookup(d['nr'].to_numpy(),idx)
+        total_missing_charge=d.loc[~keep,'charge'].sum()
+        logger.debug(f'Deleting {(~keep).sum()} [ atoms ]; charge to make up: {total_missing_charge:.4f}')
+        self.D['atoms']=d.loc[keep].reset_index(drop=True)
         mapper={}
+        new_idx=[]
         if reindex:
-            d=self.D['atoms']
-            oldGI=d['nr'].copy()
-            d['nr']=d.index+1
-            mapper={k:v for k,v in zip(oldGI,d['nr'])}
-            # logger.debug(f'mapper {mapper}')
-            assert not any([x in mapper for x in idx]),f'Error: Some deleted atoms in mapper.'
-            k=np.array(list(mapper.keys()))
-            v=np.array(list(mapper.values()))
-            if any(np.isnan(k)):
-                logger.error('null in mapper keys')
-            if any(np.isnan(v)):
-                logger.error('null in mapper values')
-            # logger.debug(f'delete_atoms: mapper {mapper}')
+            self.D['atoms']['nr']=lookup[self.D['atoms']['nr'].to_numpy()]
+            mapper=lookup_as_dict(lookup)
+            if debug:
+                assert not np.any(lookup[idx[idx<len(lookup)]]>0),f'Error: Some deleted atoms in mapper.'
             if len(return_idx_of)>0:
-                # logger.info(f'Asking for updated global indexes of {return_idx_of}')
-                new_idx=[mapper[o] for o in return_idx_of]
-            #d['nr_shift']=d['nr']-oldGI  # probably not necessary
-        ptt=['bonds','mol2_bonds','pairs']
-        for pt in ptt:
-            if pt in self.D:
+                new_idx=lookup[np.asarray(return_idx_of,dtype=int)].tolist()
+        # pairs deleted here are deleted because either ai or aj is among
+        # the atoms to delete.  Pairs are not remapped until any pairs arising
+        # from deleted dihedrals are also removed.
+        for pt in ['bonds','mol2_bonds','pairs']:
+            if not pt in self.D: continue
+            self.D[pt],ndrop=drop_rows_with_idx(self.D[pt],['ai','aj'],idx)
+            logger.debug(f'Deleting {ndrop} [ {pt} ]')
+            if reindex:
                 d=self.D[pt]
-                # logger.debug(f'delete atom: {pt} df prior to deleting')
-                # logger.debug(d.to_string())
-                indexes_to_drop=d[(d.ai.isin(idx))|(d.aj.isin(idx))].index
-                logger.debug(f'Deleting {d.loc[indexes_to_drop].shape[0]} [ {pt} ]')
-                indexes_to_keep=set(range(d.shape[0]))-set(indexes_to_drop)
-                self.D[pt]=d.take(list(indexes_to_keep)).reset_index(drop=True)
-                if reindex:
-                    d=self.D[pt]
-                    assert not any([x in idx for x in d.ai]),f'Error: deleted atom survived in {pt} ai'
-                    assert not any([x in idx for x in d.aj]),f'Error: deleted atom survived in {pt} aj'
-                    assert all([x in mapper for x in d.ai]),f'Error: surviving {pt} atom ai old idx not in mapper'
-                    assert all([x in mapper for x in d.aj]),f'Error: surviving {pt} atom aj old idx not in mapper'
-                    #logger.debug(f'delete atom: {pt} df prior to reindexing')
-                    #logger.debug(d.to_string())
-                    # pairs deleted here were deleted because either ai or aj was among 
-                    # the atoms to delete.  We assert than any dihedral for which
-                    # the i atom is ai and l atom is aj will necessarily be deleted 
-                    # below.  The only other pairs that should be deleted would
-                    # be ones in which the dihedral j or k atom is among those to be 
-                    # deleted.  
-                    if pt!='pairs': # don't remap these yet; need to delete pairs that
-                        # might arise from dihedrals that are deleted.
-                        d.ai=d.ai.map(mapper)
-                        d.aj=d.aj.map(mapper)
-                    if pt=='bonds':
-                        # logger.debug(f'Updating bondlist using (first 10 shown)\n{d.head(10).to_string()}')
-                        self.bondlist=Bondlist.fromDataFrame(d)
-                    if pt=='mol2_bonds':
-                        nBonds=self.D[pt].shape[0]
-                        self.D[pt]['bondIdx']=list(range(1,nBonds+1))
-        d=self.D['angles']
-        # assert d.ai.dtype==int,f'pre-delete lost angle ai dtype {d.ai.dtype}'
-        # assert d.aj.dtype==int,f'pre-delete lost angle aj dtype {d.aj.dtype}'
-        # assert d.ak.dtype==int,f'pre-delete lost angle ak dtype {d.ak.dtype}'
-        # logger.debug(f'ai {d.ai.isin(idx).to_string()}')
-        # logger.debug(f'aj {d.aj.isin(idx).to_string()}')
-        # logger.debug(f'ak {d.ak.isin(idx).to_string()}')
-        indexes_to_drop=d[(d['ai'].isin(idx))|(d['aj'].isin(idx))|(d['ak'].isin(idx))].index
-        # extras=d[d['ak'].isin(idx)].index
-        logger.debug(f'Deleting {len(indexes_to_drop)} [ angles ]')
-        indexes_to_keep=set(range(d.shape[0]))-set(indexes_to_drop)
-        # logger.debug(f'drop {list(sorted(list(set(indexes_to_drop))))}')
-        # logger.debug(f'keep {indexes_to_keep}')
-        self.D['angles']=d.take(list(indexes_to_keep)).reset_index(drop=True)
-        assert d.ai.dtype==int,f'post-delete lost angle ai dtype {d.ai.dtype}'
-        assert d.aj.dtype==int,f'post-delete lost angle aj dtype {d.aj.dtype}'
-        assert d.ak.dtype==int,f'post-delete lost angle ak dtype {d.ak.dtype}'
-        self.null_check(msg='inside delete atoms before angles reindex')
+                if pt!='pairs':
+                    remap_idx_columns(d,['ai','aj'],lookup,check=debug)
+                if pt=='bonds':
+                    self.bondlist=Bondlist.fromDataFrame(d)
+                if pt=='mol2_bonds':
+                    d['bondIdx']=np.arange(1,d.shape[0]+1)
+        self.D['angles'],ndrop=drop_rows_with_idx(self.D['angles'],['ai','aj','ak'],idx)
+        logger.debug(f'Deleting {ndrop} [ angles ]')
         if reindex:
-            d=self.D['angles']
-            assert not any([x in idx for x in d.ai]),'Error: deleted atom survived in angle ai'
-            assert not any([x in idx for x in d.aj]),'Error: deleted atom survived in angle aj'
-            zombie_tags=[x in idx for x in d.ak]
-            if any(zombie_tags):
-                logger.debug(f'Zombie ak angles:\n{self.D["angles"][zombie_tags].to_string()}')
-            assert not any(zombie_tags),'Error: deleted atom survived in angle ak'
-            assert all([x in mapper for x in d.ai]),'Error: surviving angle atom ai old idx not in mapper'
-            assert all([x in mapper for x in d.aj]),'Error: surviving angle atom aj old idx not in mapper'
-            assert all([x in mapper for x in d.ak]),'Error: surviving angle atom ak old idx not in mapper'
-            d.ai=d.ai.map(mapper)
-            d.aj=d.aj.map(mapper)
-            d.ak=d.ak.map(mapper)
-        self.null_check(msg='inside delete atoms after angles reindex')
+            remap_idx_columns(self.D['angles'],['ai','aj','ak'],lookup,check=debug)
+        if debug: self.null_check(msg='inside delete atoms after angles reindex')
         d=self.D['dihedrals']
-        indexes_to_drop=d[(d.ai.isin(idx))|(d.aj.isin(idx))|(d.ak.isin(idx))|(d.al.isin(idx))].index
-        logger.debug(f'Deleting {d.loc[indexes_to_drop].shape[0]} [ dihedrals ]')
         # if the atoms we have deleted are truly just H's, then there will be no other
         # spurious pairs after all dihedrals containing deleted atoms are deleted.
         # However, we may want to still search for such pairs, so let's leave this
         # as an option:
-        if paranoid_about_pairs:
+        if paranoid_about_pairs and 'pairs' in self.D:
+            hit=np.zeros(d.shape[0],dtype=bool)
+            for c in ['ai','aj','ak','al']:
+                hit|=np.isin(d[c].to_numpy(),idx)
+            ddp=d.loc[hit]
             dp=self.D['pairs']
-            ddp=d.loc[indexes_to_drop]  # these are dihedrals marked for deletion
-            # determine pairs deriving from these dihedrals and delete them!
-            pai=ddp.ai.to_list()
-            pal=ddp.al.to_list()
-            dd=[]
-            for pi,pl in zip(pai,pal):
-                dwpi=dp[((dp.ai==pi)&(dp.aj==pl))|((dp.ai==pl)&(dp.aj==pi))].index.to_list()
-                dd.extend(dwpi)
-            ptk=set(range(dp.shape[0]))-set(dwpi)
-            if dp.loc[dwpi].shape[0]>0:
-                logger.debug(f'  -> and deleting {dp.loc[dwpi].shape[0]} [ pairs ] from those dihedrals')
+            dkey=set(zip(np.minimum(ddp.ai,ddp.al),np.maximum(ddp.ai,ddp.al)))
+            pkey=zip(np.minimum(dp.ai,dp.aj),np.maximum(dp.ai,dp.aj))
+            pdrop=np.array([k in dkey for k in pkey],dtype=bool)
+            if pdrop.sum()>0:
+                logger.debug(f'  -> and deleting {pdrop.sum()} [ pairs ] from those dihedrals')
             # Note that we expect this to be zero if we are only deleting H's, since
             # an H can never be a 'j' or 'k' in a dihedral!
-            self.D['pairs']=dp.take(list(ptk)).reset_index(drop=True)
-        indexes_to_keep=set(range(d.shape[0]))-set(indexes_to_drop)
-        self.D['dihedrals']=d.take(list(indexes_to_keep)).reset_index(drop=True)
+            self.D['pairs']=dp.loc[~pdrop].reset_index(drop=True)
+        self.D['dihedrals'],ndrop=drop_rows_with_idx(d,['ai','aj','ak','al'],idx)
+        logger.debug(f'Deleting {ndrop} [ dihedrals ]')
         if reindex:
-            d=self.D['dihedrals']
-            d.ai=d.ai.map(mapper)
-            d.aj=d.aj.map(mapper)
-            d.ak=d.ak.map(mapper)
-            d.al=d.al.map(mapper)
-            d=self.D['pairs']
-            d.ai=d.ai.map(mapper)
-            d.aj=d.aj.map(mapper)
-            tp=[]
-            pdrops=[]
-            for i,r in d.iterrows():
-                ai,aj=min([r.ai,r.aj]),max([r.ai,r.aj])
-                if not [ai,aj] in tp:
-                    tp.append([ai,aj])
-                else:
-                    pdrops.append(i)
-            logger.debug(f'Deleting {len(pdrops)} duplicate 1-4 pair descriptors -- this is likely due to a bug somewhere')
-            self.D['pairs']=d.drop(pdrops).reset_index(drop=True)
+            remap_idx_columns(self.D['dihedrals'],['ai','aj','ak','al'],lookup,check=debug)
+            if 'pairs' in self.D:
+                remap_idx_columns(self.D['pairs'],['ai','aj'],lookup,check=debug)
+                self.D['pairs'],ndup=canonical_pair_dedup(self.D['pairs'])
+                if ndup>0:
+                    logger.debug(f'Deleting {ndup} duplicate 1-4 pair descriptors -- this is likely due to a bug somewhere')
         self.null_check(msg='end of delete atoms')
-        logger.debug('finished.')
         if len(return_idx_of)>0:
             return new_idx
         return mapper
@@ -795,13 +894,15 @@ class Topology:
     def merge(self,other):
         """Merge topologies
 
-        :param other: a topology
-        :type other: Topology
+        :param other: a topology, or a list of topologies to merge in order
+        :type other: Topology or list
         """
         # logger.debug('Topology.merge begins')
         # look for duplicated types between self and other.  If any are found, delete those types from other and copy their parameters into the explicit interactions they correspond to.
         self.merge_ex(other)
         self.merge_types(other)
+        if checks.active('full'):
+            self.null_check(msg='end of merge')
         # logger.debug('Topology.merge ends')
 
     # def handle_duplicate_types(self,other,copy_directive='other_to_self',typename='',funcidx=4):
@@ -850,12 +951,9 @@ class Topology:
         headers=_GromacsTopologyDirectiveHeaders_[typename].copy()
         for i in hashables:
             headers.remove(i)
-        fi=headers.index('func')
-        for idx,r in stdf.iterrows():
-            typidx=typeorder(tuple([r[i] for i in hashables]))
-            idata=[r[i] for i in headers]
-            if typidx==typidx_q and idata[fi]==funcidx:
-                return [r[i] for i in headers]
+        for row in self.type_index(typename).get(tuple(typidx_q),[]):
+            if stdf.loc[row,'func']==funcidx:
+                return stdf.loc[row,headers].to_list()
         return []
     '''
     'bonds':        ['ai', 'aj', 'funct', 'c0', 'c1'],
@@ -869,29 +967,26 @@ class Topology:
         if not typename in self.D:
             return
         typ_hashables=_GromacsTopologyHashables_[typename]
-        stdf=self.D[typename].set_index(typ_hashables)
         sidf=self.D[interactionname]
         typ_headers=_GromacsTopologyDirectiveHeaders_[typename].copy()
         ins_hashables=_GromacsTopologyHashables_[interactionname]
         ins_headers=_GromacsTopologyDirectiveHeaders_[interactionname].copy()
-        typidx=[self.D['atoms'].iloc[x-1]['type'] for x in inst_idx]
-        typidx=typeorder(tuple(typidx))
+        typidx=tuple(self.atom_types_of(inst_idx).tolist())
+        typidx=typeorder(typidx)
         for i in typ_hashables:
             typ_headers.remove(i)
         for i in ins_hashables:
             ins_headers.remove(i)
         iidx=idxorder(tuple(inst_idx))
-        idx=-1
-        for i,r in sidf.iterrows():
-            jdx=tuple([r[a] for a in ins_hashables])
-            if iidx==jdx:
-                idx=i
-                break
-        assert idx!=-1
+        hit=np.ones(sidf.shape[0],dtype=bool)
+        for a,v in zip(ins_hashables,iidx):
+            hit&=(sidf[a].to_numpy()==v)
+        assert hit.any()
+        idx=int(np.argmax(hit))
         num_data=min([len(typ_headers),len(ins_headers)])
         typ_headers=typ_headers[:num_data]
         ins_headers=ins_headers[:num_data]
-        typrec=stdf.loc[typidx][typ_headers]
+        typrec=self.D[typename].loc[self.type_index(typename)[typidx][0],typ_headers].to_numpy()
         cols=self.D[interactionname].columns.get_indexer(ins_headers)
         logger.debug(f'Resetting override in {interactionname} for {inst_idx} from')
         for ln in self.D[interactionname].iloc[idx,cols].to_string().split('\n'):
@@ -905,54 +1000,40 @@ class Topology:
     def reset_type(self,typename,typidx_t,values):
         if not typename in self.D:
             return
-        stdf=self.D[typename]
         hashables=_GromacsTopologyHashables_[typename]
         headers=_GromacsTopologyDirectiveHeaders_[typename].copy()
         for i in hashables:
             headers.remove(i)
         cols=self.D[typename].columns.get_indexer(headers)
-        idxs=[]
-        for idx,r in stdf.iterrows():
-            typidx=typeorder(tuple([r[i] for i in hashables]))
-            if typidx==typidx_t:
-                idxs.append(idx)
+        idxs=self.type_index(typename).get(tuple(typidx_t),[])
         assert len(headers)==len(values)
         logger.debug(f'Resetting {len(idxs)} entries {headers} to {values}')
         for idx in idxs:
             self.D[typename].iloc[idx,cols]=values
             for ln in self.D[typename].iloc[idx][headers].to_string().split('\n'):
                 logger.debug(ln)
+        self.invalidate_type_index(typename)
 
     def report_duplicate_types(self,other,typename='',funcidx=4):
         if not typename in self.D or not typename in other.D:
             return
-        stdf=self.D[typename]
-        otdf=other.D[typename]
         hashables=_GromacsTopologyHashables_[typename]
         headers=_GromacsTopologyDirectiveHeaders_[typename].copy()
-        # logger.debug(f'{hashables} {headers}')
         for i in hashables:
             headers.remove(i)
-        common=[]
-        fi=headers.index('func')
+        o=pd.concat((df_canonical_types(other.D[typename],hashables),other.D[typename][headers]),axis=1)
+        s=pd.concat((df_canonical_types(self.D[typename],hashables),self.D[typename][headers]),axis=1)
+        m=o.merge(s,on=hashables,how='inner',suffixes=('_o','_s'))
+        same=np.ones(m.shape[0],dtype=bool)
+        for h in headers:
+            same&=(m[f'{h}_o'].to_numpy()==m[f'{h}_s'].to_numpy())
+        keys=list(zip(*[m[h].to_list() for h in hashables]))
+        common=set([k for k,x in zip(keys,same) if x])
+        candidates=(~same)&(m['func_o'].to_numpy()==funcidx)&(m['func_s'].to_numpy()==funcidx)
         true_duplicate_types=[]
-        for idx,r in otdf.iterrows():
-            typidx=typeorder(tuple([r[i] for i in hashables]))
-            idata=[r[i] for i in headers]
-            for jdx,q in stdf.iterrows():
-                typjdx=typeorder(tuple([q[i] for i in hashables]))
-                jdata=[q[i] for i in headers]
-                if typidx==typjdx and idata==jdata:
-                    common.append(typidx)
-        for idx,r in otdf.iterrows():
-            typidx=typeorder(tuple([r[i] for i in hashables]))
-            idata=[r[i] for i in headers]
-            for jdx,q in stdf.iterrows():
-                typjdx=typeorder(tuple([q[i] for i in hashables]))
-                jdata=[q[i] for i in headers]
-                if typidx==typjdx and idata!=jdata and not typidx in common and idata[fi]==funcidx and jdata[fi]==funcidx:
-                    # logger.debug(f'duplicate {typename} {typidx}')
-                    true_duplicate_types.append(typidx)
+        for k,x in zip(keys,candidates):
+            if x and not k in common and not k in true_duplicate_types:
+                true_duplicate_types.append(k)
         return true_duplicate_types
 
     def dup_check(self,die=True):
@@ -977,34 +1058,65 @@ class Topology:
     def merge_types(self,other):
         """Merge type-like topology dataframes from other to self
 
-        :param other: topology containing attribute D, a dictionary of dataframes
-        :type other: Topology
+        :param other: topology containing attribute D, a dictionary of dataframes, or a list of such topologies
+        :type other: Topology or list
         """
         # self.handle_duplicate_types(other,typename='dihedraltypes',funcidx=4,drop_directive='drop_from_self')
+        others=other if type(other)==list else [other]
         L=['atomtypes','bondtypes','angletypes','dihedraltypes']
         for t in L:
-            self._myconcat(other,directive=t,drop_duplicates=True)
+            frames=[x.D[t] for x in [self]+others if t in x.D]
+            if len(frames)>0:
+                self.D[t]=pd.concat(frames,ignore_index=True).drop_duplicates()
+        self.rebuild_type_indices()
 
     def merge_ex(self,other):
+        """Merge extensive topology dataframes from other to self; other's atoms are
+        appended after self's, so all of other's atom and residue indices are shifted.
+        If other is a list, all topologies in it are appended in order using a single
+        concatenation per directive.
+
+        :param other: a topology, or a list of topologies
+        :type other: Topology or list
+        """
         logger.debug(f'   extensive merging...')
         ''' merge EXTENSIVE quantities '''
+        others=other if type(other)==list else [other]
         idxshift=0 if 'atoms' not in self.D else len(self.D['atoms'])
         rdxshift=0 if 'atoms' not in self.D else self.D['atoms'].iloc[-1]['resnr']
-        if 'atoms' in other.D:
-            other.D['atoms']['resnr']+=rdxshift
-        self._myconcat(other,directive='atoms',idxlabel=['nr'],idxshift=idxshift)
-        self._myconcat(other,directive='bonds',idxlabel=['ai','aj'],idxshift=idxshift)
-        if 'bonds' in other.D:
-            self.bondlist.update(other.D['bonds'])
-        if 'mol2_bonds' in self.D and 'mol2_bonds' in other.D:
-            other.D['mol2_bonds'].bondIdx+=self.D['mol2_bonds'].shape[0]
-        self._myconcat(other,directive='mol2_bonds',idxlabel=['ai','aj'],idxshift=idxshift)
-        self._myconcat(other,directive='pairs',idxlabel=['ai','aj'],idxshift=idxshift)
-        self._myconcat(other,directive='angles',idxlabel=['ai','aj','ak'],idxshift=idxshift)
-        self._myconcat(other,directive='dihedrals',idxlabel=['ai','aj','ak','al'],idxshift=idxshift)
-        logger.debug(f'merging {len(other.rings)} rings into base list of {len(self.rings)} with idxshift {idxshift}')
-        other.rings.shift(idxshift)
-        self.rings.extend(other.rings)
+        nmol2bonds=self.D['mol2_bonds'].shape[0] if 'mol2_bonds' in self.D else None
+        frames={t:([self.D[t]] if t in self.D else []) for t in _GromacsExtensiveDirectives_+_NonGromacsExtensiveDirectives_}
+        newbonds=[]
+        for o in others:
+            if 'atoms' in o.D:
+                o.D['atoms']['resnr']+=rdxshift
+            for t in frames:
+                if not t in o.D: continue
+                for c in _GromacsTopologyHashables_.get(t,['ai','aj']):
+                    o.D[t][c]+=idxshift
+                if t=='mol2_bonds':
+                    if nmol2bonds is not None:
+                        o.D[t].bondIdx+=nmol2bonds
+                        nmol2bonds+=o.D[t].shape[0]
+                    else:
+                        nmol2bonds=o.D[t].shape[0]
+                frames[t].append(o.D[t])
+            if 'bonds' in o.D:
+                newbonds.append(o.D['bonds'])
+            logger.debug(f'merging {len(o.rings)} rings into base list of {len(self.rings)} with idxshift {idxshift}')
+            o.rings.shift(idxshift)
+            self.rings.extend(o.rings)
+            if 'atoms' in o.D and len(o.D['atoms'])>0:
+                idxshift+=len(o.D['atoms'])
+                rdxshift=o.D['atoms'].iloc[-1]['resnr']
+        for t,f in frames.items():
+            if len(f)>1:
+                self.D[t]=pd.concat(f,ignore_index=True)
+            elif len(f)==1:
+                self.D[t]=f[0]
+        if len(newbonds)>0:
+            self.bondlist.update(pd.concat(newbonds,ignore_index=True))
+        self.reset_residue_network()
 
     def get_atom_attribute(self,idx,attribute):
         """Return value of attribute of atom idx
@@ -1029,61 +1141,82 @@ class Topology:
 #        logger.debug(f'Asking get_atomtype for type of atom with index {idx}')
         return self.D['atoms'].iloc[idx-1].type
 
-    def build_interresidue_graph(self,G,ri):
-        if ri in G:
-            return
+    def interresidue_bonds(self,bonds=None):
+        """interresidue_bonds returns the residue-number pairs of all bonds that join two different residues,
+        computed in one vectorized pass over the bond endpoints
+
+        :param bonds: dataframe of bonds with columns 'ai' and 'aj'; if None, all bonds in the topology, defaults to None
+        :type bonds: pandas.DataFrame, optional
+        :return: unique (ri,rj) residue-number pairs, one row per inter-residue connection
+        :rtype: numpy.ndarray
+        """
+        if bonds is None:
+            bonds=self.D['bonds']
         adf=self.D['atoms']
-        ri_at_idx=adf[adf['resnr']==ri]['nr'].to_list()
-        residues=adf['resnr'].unique()
-        ri_partners=[]
-        for rn in residues:
-            skip=False
-            rj_at_idx=adf[adf['resnr']==rn]['nr'].to_list()
-            for i,j in product(ri_at_idx,rj_at_idx):
-                # logger.debug(f'### {i} in {self.bondlist.partners_of(j)}?')
-                if i in self.bondlist.partners_of(j):
-                    if not rn in ri_partners:
-                        ri_partners.append(rn)
-                        skip=True
-                        continue
-                if skip: continue
-        # logger.debug(f'rn partners {ri_partners}')
-        G.add_node(ri)
-        for rj in ri_partners:
-            self.build_interresidue_graph(G,rj)
+        if bonds.shape[0]==0 or adf.shape[0]==0:
+            return np.zeros((0,2),dtype=int)
+        nr=adf['nr'].to_numpy(dtype=int)
+        resnr_of=np.zeros(nr.max()+1,dtype=int)
+        resnr_of[nr]=adf['resnr'].to_numpy(dtype=int)
+        ri=resnr_of[bonds['ai'].to_numpy(dtype=int)]
+        rj=resnr_of[bonds['aj'].to_numpy(dtype=int)]
+        inter=ri!=rj
+        pairs=np.stack((np.minimum(ri[inter],rj[inter]),np.maximum(ri[inter],rj[inter])),axis=1)
+        return np.unique(pairs,axis=0)
+
+    def add_residue_edges(self,pairs):
+        """add_residue_edges inserts edges into the residue network for any new inter-residue bonds
+        in pairs and invalidates the cached local clusters of the residues they touch
+
+        :param pairs: list of (ai,aj) atom index pairs of new bonds
+        :type pairs: list
+        """
+        if self.residue_network.number_of_nodes()==0 or len(pairs)==0:
+            return
+        bdf=pd.DataFrame({'ai':[int(p[0]) for p in pairs],'aj':[int(p[1]) for p in pairs]})
+        for ri,rj in self.interresidue_bonds(bdf).tolist():
+            if not self.residue_network.has_edge(ri,rj):
+                self._invalidate_resid_clusters([ri,rj])
+                self.residue_network.add_edge(ri,rj,bondtype='cross')
+                self.residue_network.add_edge(rj,ri,bondtype='cross')
+
+    def _invalidate_resid_clusters(self,resids):
+        for r in resids:
+            for x in self.resid_clusters.pop(r,[]):
+                self.resid_clusters.pop(x,None)
+
+    def reset_residue_network(self):
+        """reset_residue_network discards the residue network and all cached local clusters; the network is rebuilt on next use
+        """
+        self.residue_network=nx.DiGraph()
+        self.resid_clusters={}
 
     def local_resid_cluster(self,ri):
-        G=nx.DiGraph()
-        # logger.debug(str(self.bondlist))
-        self.build_interresidue_graph(G,ri)
-        return [x for x in G]
+        """local_resid_cluster returns the list of residue numbers of all residues connected to residue ri
+        by a path of inter-residue bonds (including ri itself); results are memoized per residue
+
+        :param ri: residue number
+        :type ri: int
+        :return: list of residue numbers in the cluster
+        :rtype: list
+        """
+        if ri in self.resid_clusters:
+            return self.resid_clusters[ri][:]
+        if not ri in self.residue_network:
+            self.make_resid_graph()
+        cluster=sorted(nx.descendants(self.residue_network,ri)|{ri})
+        for x in cluster:
+            self.resid_clusters[x]=cluster
+        return cluster[:]
 
     def make_resid_graph(self,json_file=None):
         adf=self.D['atoms']
-        N=adf.shape[0]
-        self.residue_network=nx.DiGraph()
-        residues=adf['residue'].unique()
-        for rn in residues:
-            rs=adf[adf['residue']==rn]['resnr'].unique()
-            self.residue_network.add_nodes_from(rs,resName=rn)
-        
-        resnrs=adf['resnr'].unique()
-        for i in resnrs:
-            # atom global indexes in this resnr
-            ats=adf[adf['resnr']==i]['nr'].to_list()
-            connectors=[]
-            for a in ats:
-                an=self.bondlist.partners_of(a)
-                natsrn=adf[adf['nr'].isin(an)]['resnr'].unique()
-                if len(natsrn)>1:
-                    for n in natsrn:
-                        if n!=i:  # this is an inter-residue connection
-                            connectors.append((a,n))
-            for c in connectors:
-                a,n=c
-                bondtype="cross"
-                if not self.residue_network.has_edge(i,n):
-                    self.residue_network.add_edge(i,n,bondtype=bondtype)
+        self.reset_residue_network()
+        for rn,rs in adf.groupby('residue',sort=False)['resnr'].unique().items():
+            self.residue_network.add_nodes_from(rs.tolist(),resName=rn)
+        rr=self.interresidue_bonds()
+        self.residue_network.add_edges_from(rr.tolist(),bondtype='cross')
+        self.residue_network.add_edges_from(rr[:,::-1].tolist(),bondtype='cross')
         if json_file:
             the_data=json_graph.node_link_data(self.residue_network)
             assert type(the_data)==dict,f'Error: node_link_data returns a {type(the_data)} but should return a dict'
@@ -1118,20 +1251,9 @@ class Topology:
         """
         bdf=self.D['bonds']
         assert not(any(bdf['c0'].isna()))
-        saveme=pd.DataFrame()
-        for b in bonds.itertuples():
-            ai,aj=idxorder((b.ai,b.aj))
-            subframe=bdf[(bdf['ai']==ai)&(bdf['aj']==aj)].copy()
-            for c in bdf.columns:
-                if not c in subframe:
-                    subframe[c]=_PAD_
-            if saveme.empty:
-                saveme=subframe
-            else:
-            # logger.debug(f'copy parameters for ai {ai} aj {aj}')
-                saveme=pd.concat((saveme,subframe),ignore_index=True)
-        # logger.info(f'saved bond override params\n{saveme.to_string()}')
-        return saveme
+        keys=df_canonical_types(bonds,['ai','aj']).reset_index(drop=True)
+        saveme=keys.merge(bdf,on=['ai','aj'],how='inner')
+        return saveme[bdf.columns]
 
     def attenuate_bond_parameters(self,bondsdf,stage,max_stages,minimum_distance=0.0,init_colname='initial_distance'):
         """Alter the kb and b0 parameters for new crosslink bonds according to the values prior to 
@@ -1152,42 +1274,42 @@ class Topology:
         bdf=self.D['bonds']
         factor=(stage+1)/max_stages
         logger.debug(f'Attenuating {bondsdf.shape[0]} bond{"s" if bondsdf.shape[0]>1 else ""} in stage {stage+1}/{max_stages}')
-        jdx=list(bondsdf.columns).index(init_colname)
-        for b in bondsdf.itertuples(index=False):
-            ai,aj=idxorder((b.ai,b.aj))
-            rij=b[jdx]
-            b0,kb=self.get_bond_parameters(ai,aj)
-            if minimum_distance>0.0:
-                b0=minimum_distance
-            new_b0=rij-factor*(rij-b0)
-            new_kb=kb*factor
-            # logger.debug(f'bond attenuation target for {ai}-{aj}:\nb0 {b0:.5f} kb {kb:.2f}; using b0 {new_b0:.5f} kb {new_kb:.2f}')
-            bdf.loc[(bdf['ai']==ai)&(bdf['aj']==aj),'c0']=new_b0
-            bdf.loc[(bdf['ai']==ai)&(bdf['aj']==aj),'c1']=new_kb
+        keys=df_canonical_types(bondsdf,['ai','aj']).reset_index(drop=True)
+        rows=match_rows(bdf,keys,['ai','aj'])
+        assert np.all(rows>=0),f'Error: cannot attenuate bond(s) not in topology'
+        rij=bondsdf[init_colname].to_numpy()
+        b0,kb=self.get_bond_parameters(keys['ai'],keys['aj'])
+        if minimum_distance>0.0:
+            b0=np.full(len(b0),minimum_distance)
+        bdf.loc[rows,'c0']=rij-factor*(rij-b0)
+        bdf.loc[rows,'c1']=kb*factor
 
     def get_bond_parameters(self,ai,aj):
-        """Gets b0 and kb for bond between atoms with global indexes ai and aj
+        """Gets b0 and kb for bond between atoms with global indexes ai and aj; if ai and aj are arrays,
+           parameters for all such bonds are returned as arrays
 
         :param ai: global atom index
-        :type ai: int
+        :type ai: int or array-like of int
         :param aj: global atom index
-        :type aj: int
+        :type aj: int or array-like of int
         :return: b0, kb -- equilibrium bond length and spring constant
         :rtype: 2-tuple
         """
-        ai,aj=idxorder((ai,aj))
-        adf=self.D['atoms']
+        scalar=np.isscalar(ai)
+        keys=df_canonical_types(pd.DataFrame({'ai':np.atleast_1d(ai),'aj':np.atleast_1d(aj)}),['ai','aj'])
         bdf=self.D['bonds']
-        tdf=self.D['bondtypes']
-        b0=bdf.loc[(bdf['ai']==ai)&(bdf['aj']==aj),'c0'].values[0]
-        kb=bdf.loc[(bdf['ai']==ai)&(bdf['aj']==aj),'c1'].values[0]
-        if pd.isna(b0) or pd.isna(kb):
-            ''' no overrides for this bond, so take from types '''
-            it=adf.loc[adf['nr']==ai,'type'].values[0]
-            jt=adf.loc[adf['nr']==aj,'type'].values[0]
-            it,jt=typeorder((it,jt))
-            b0=tdf.loc[(tdf['i']==it)&(tdf['j']==jt),'b0'].values[0]
-            kb=tdf.loc[(tdf['i']==it)&(tdf['j']==jt),'kb'].values[0]
+        rows=match_rows(bdf,keys,['ai','aj'])
+        assert np.all(rows>=0),f'Error: bond(s) not in topology'
+        b0=bdf.loc[rows,'c0'].to_numpy(dtype=float)
+        kb=bdf.loc[rows,'c1'].to_numpy(dtype=float)
+        no_override=np.isnan(b0)|np.isnan(kb)
+        if no_override.any():
+            ''' no overrides for these bonds, so take from types '''
+            tp=self.interaction_type_parameters('bonds',keys[no_override])
+            b0[no_override]=tp['b0'].to_numpy(dtype=float)
+            kb[no_override]=tp['kb'].to_numpy(dtype=float)
+        if scalar:
+            return b0[0],kb[0]
         return b0,kb
 
     def restore_bond_parameters(self,df):
@@ -1197,11 +1319,10 @@ class Topology:
         :type df: pandas DataFrame
         """
         bdf=self.D['bonds']
-        for r in df.itertuples():
-            ai,aj=r.ai,r.aj
-            c0,c1=r.c0,r.c1
-            bdf.loc[(bdf['ai']==ai)&(bdf['aj']==aj),'c0']=c0
-            bdf.loc[(bdf['ai']==ai)&(bdf['aj']==aj),'c1']=c1
+        rows=match_rows(bdf,df,['ai','aj'])
+        found=rows>=0
+        bdf.loc[rows[found],'c0']=df['c0'].to_numpy()[found]
+        bdf.loc[rows[found],'c1']=df['c1'].to_numpy()[found]
 
     def attenuate_pair_parameters(self,pairsdf,stage,max_stages,draglimit_nm=0.3):
         """Alter the kb and b0 parameters for new pre-crosslink pairs according 
@@ -1222,9 +1343,10 @@ class Topology:
         ess='s' if pairsdf.shape[0]>1 else ''
         factor=(stage+1)/max_stages
         logger.debug(f'Attenuating {pairsdf.shape[0]} pair{ess} in stage {stage+1}/{max_stages}')
-        for b in pairsdf.itertuples():
-            ai,aj=idxorder((b.ai,b.aj))
-            b0=b.initial_distance
-            kb=pdf.loc[(pdf['ai']==ai)&(pdf['aj']==aj),'c1'].values[0]
-            pdf.loc[(pdf['ai']==ai)&(pdf['aj']==aj),'c0']=draglimit_nm-factor*(b0-draglimit_nm)
-            pdf.loc[(pdf['ai']==ai)&(pdf['aj']==aj),'c1']=kb*factor
+        keys=df_canonical_types(pairsdf,['ai','aj']).reset_index(drop=True)
+        rows=match_rows(pdf,keys,['ai','aj'])
+        assert np.all(rows>=0),f'Error: cannot attenuate pair(s) not in topology'
+        b0=pairsdf['initial_distance'].to_numpy()
+        kb=pdf.loc[rows,'c1'].to_numpy()
+        pdf.loc[rows,'c0']=draglimit_nm-factor*(b0-draglimit_nm)
+        pdf.loc[rows,'c1']=kb*factor
@@ -0,0 +1,282 @@
+"""
+
+.. module:: trajectory
+   :synopsis: reads frames from Gromacs trr and xtc trajectory files directly, without invoking gmx
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import logging
+import mmap
+import os
+import numpy as np
+from collections import namedtuple
+from HTPolyNet.xdr import XDRBuffer
+logger=logging.getLogger(__name__)
+
+Frame=namedtuple('Frame','step time box x v')
+"""One trajectory frame: integer step, time in ps, box vectors as rows of a 3x3 array,
+positions as an (N,3) array, and velocities as an (N,3) array or None"""
+
+_TRR_MAGIC_=1993
+_XTC_MAGIC_=1995
+_XTC_MAGIC_LARGE_=2023
+
+class TrajectoryFormatError(Exception):
+    pass
+
+def _open_buffer(filename):
+    """_open_buffer memory-maps a file for sequential XDR reading
+
+    :param filename: name of file
+    :type filename: str
+    :return: reader over the file contents
+    :rtype: XDRBuffer
+    """
+    with open(filename,'rb') as f:
+        if os.fstat(f.fileno()).st_size==0:
+            return XDRBuffer(b'')
+        return XDRBuffer(mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ))
+
+def _trr_frame(buf,read_data=True):
+    """_trr_frame reads one frame of a trr file
+
+    :param buf: reader positioned at the start of a frame
+    :type buf: XDRBuffer
+    :param read_data: if False, only the header is decoded and the data are skipped, defaults to True
+    :type read_data: bool, optional
+    :raises TrajectoryFormatError: if the frame does not begin with the trr magic number
+    :return: the frame
+    :rtype: Frame
+    """
+    magic=buf.int()
+    if magic!=_TRR_MAGIC_:
+        raise TrajectoryFormatError(f'Bad trr magic number {magic} at byte {buf.pos-4}')
+    buf.int() # length of version string including terminator
+    buf.string()
+    ir_size,e_size,box_size,vir_size,pres_size,top_size,sym_size,x_size,v_size,f_size,natoms=[buf.int() for i in range(11)]
+    for size,n in [(box_size,9),(x_size,natoms*3),(v_size,natoms*3),(f_size,natoms*3)]:
+        if size>0 and n>0:
+            real=f'>f{size//n}'
+            break
+    else:
+        raise TrajectoryFormatError(f'Cannot determine precision of trr frame')
+    step=buf.int()
+    buf.int() # nre
+    t=float(buf.reals(1,real)[0])
+    buf.reals(1,real) # lambda
+    buf.skip(ir_size+e_size)
+    box=x=v=None
+    if not read_data:
+        buf.skip(box_size+vir_size+pres_size+top_size+sym_size+x_size+v_size+f_size)
+        return Frame(step,t,box,x,v)
+    if box_size:
+        box=buf.reals(9,real).astype(float).reshape(3,3)
+    buf.skip(vir_size+pres_size+top_size+sym_size)
+    if x_size:
+        x=buf.reals(natoms*3,real).astype(float).reshape(natoms,3)
+    if v_size:
+        v=buf.reals(natoms*3,real).astype(float).reshape(natoms,3)
+    buf.skip(f_size)
+    return Frame(step,t,box,x,v)
+
+# xtc compression tables, as in the Gromacs/xdrfile reference implementation
+_MAGICINTS_=[0,0,0,0,0,0,0,0,0,8,10,12,16,20,25,32,40,50,64,
+    80,101,128,161,203,256,322,406,512,645,812,1024,1290,
+    1625,2048,2580,3250,4096,5060,6501,8192,10321,13003,
+    16384,20642,26007,32768,41285,52015,65536,82570,104031,
+    131072,165140,208063,262144,330280,416127,524287,660561,
+    832255,1048576,1321122,1664510,2097152,2642245,3329021,
+    4194304,5284491,6658042,8388607,10568983,13316085,16777216]
+_FIRSTIDX_=9
+
+class _BitReader:
+    """Most-significant-bit-first reader over an xtc compressed coordinate block
+    """
+    def __init__(self,data):
+        self.data=bytes(data)+b'\x00'*8
+        self.bit=0
+    def bits(self,n):
+        val=0
+        while n>0:
+            take=min(n,32)
+            i=self.bit>>3
+            word=int.from_bytes(self.data[i:i+5],'big')
+            val=(val<<take)|((word>>(40-(self.bit&7)-take))&((1<<take)-1))
+            self.bit+=take
+            n-=take
+        return val
+    def ints(self,nbits,sizes):
+        # the packed bytes are stored least-significant first, each read as an 8-bit (or shorter, for the last) field
+        nbytes,rem=divmod(nbits,8)
+        value=0
+        shift=0
+        for i in range(nbytes):
+            value|=self.bits(8)<<shift
+            shift+=8
+        if rem:
+            value|=self.bits(rem)<<shift
+        out=[0,0,0]
+        for k in [2,1]:
+            value,out[k]=divmod(value,sizes[k])
+        out[0]=value
+        return out
+
+def _xtc_coords(buf,natoms,large=False):
+    """_xtc_coords decodes the compressed coordinate block of one xtc frame
+
+    :param buf: reader positioned at the start of the coordinate block
+    :type buf: XDRBuffer
+    :param natoms: number of atoms
+    :type natoms: int
+    :param large: if True, the byte count of the compressed block is a 64-bit integer (magic 2023), defaults to False
+    :type large: bool, optional
+    :return: positions
+    :rtype: numpy.ndarray((natoms,3),float)
+    """
+    lsize=buf.int()
+    if lsize!=natoms:
+        raise TrajectoryFormatError(f'xtc frame atom count mismatch ({lsize} vs {natoms})')
+    if lsize<=9:
+        return buf.reals(lsize*3,'>f4').astype(float).reshape(lsize,3)
+    precision=buf.float()
+    minint=[buf.int() for i in range(3)]
+    maxint=[buf.int() for i in range(3)]
+    sizeint=[maxint[i]-minint[i]+1 for i in range(3)]
+    if any([s>0xffffff for s in sizeint]):
+        bitsizeint=[int(s).bit_length() for s in sizeint]
+        bitsize=0
+    else:
+        bitsize=(sizeint[0]*sizeint[1]*sizeint[2]).bit_length()
+    smallidx=buf.int()
+    smaller=_MAGICINTS_[max(_FIRSTIDX_,smallidx-1)]//2
+    smallnum=_MAGICINTS_[smallidx]//2
+    sizesmall=[_MAGICINTS_[smallidx]]*3
+    nbytes=buf.int64() if large else buf.int()
+    bits=_BitReader(buf.opaque(nbytes))
+    coords=np.zeros((lsize,3),dtype=np.int64)
+    i=0
+    n=0
+    # a run length persists from atom to atom; a zero flag bit means "same run as the previous atom"
+    run=0
+    while i<lsize:
+        if bitsize==0:
+            this=[bits.bits(bitsizeint[k]) for k in range(3)]
+        else:
+            this=bits.ints(bitsize,sizeint)
+        i+=1
+        this=[this[k]+minint[k] for k in range(3)]
+        prev=this
+        is_smaller=0
+        if bits.bits(1)==1:
+            run=bits.bits(5)
+            is_smaller=run%3
+            run-=is_smaller
+            is_smaller-=1
+        if run>0:
+            for k in range(0,run,3):
+                small=bits.ints(smallidx,sizesmall)
+                i+=1
+                this=[small[c]+prev[c]-smallnum for c in range(3)]
+                if k==0:
+                    # first and second atoms of a run are interchanged (water compression)
+                    this,prev=prev,this
+                    coords[n]=prev
+                    n+=1
+                else:
+                    prev=this
+                coords[n]=this
+                n+=1
+        else:
+            coords[n]=this
+            n+=1
+        smallidx+=is_smaller
+        if is_smaller<0:
+            smallnum=smaller
+            smaller=_MAGICINTS_[smallidx-1]//2 if smallidx>_FIRSTIDX_ else 0
+        elif is_smaller>0:
+            smaller=smallnum
+            smallnum=_MAGICINTS_[smallidx]//2
+        sizesmall=[_MAGICINTS_[smallidx]]*3
+    # Gromacs does this conversion in single precision
+    inv_precision=np.float32(1.0/precision)
+    return (coords.astype(np.float32)*inv_precision).astype(float)
+
+def _xtc_frame(buf,read_data=True):
+    """_xtc_frame reads one frame of an xtc file
+
+    :param buf: reader positioned at the start of a frame
+    :type buf: XDRBuffer
+    :param read_data: if False, only the header is decoded and the coordinates are skipped, defaults to True
+    :type read_data: bool, optional
+    :raises TrajectoryFormatError: if the frame does not begin with an xtc magic number
+    :return: the frame
+    :rtype: Frame
+    """
+    magic=buf.int()
+    if not magic in [_XTC_MAGIC_,_XTC_MAGIC_LARGE_]:
+        raise TrajectoryFormatError(f'Bad xtc magic number {magic} at byte {buf.pos-4}')
+    natoms=buf.int()
+    step=buf.int()
+    t=buf.float()
+    box=buf.reals(9,'>f4').astype(float).reshape(3,3)
+    if read_data:
+        x=_xtc_coords(buf,natoms,large=(magic==_XTC_MAGIC_LARGE_))
+    else:
+        x=None
+        lsize=buf.int()
+        if lsize<=9:
+            buf.skip(lsize*12)
+        else:
+            buf.skip(32) # precision, minint, maxint, smallidx
+            nbytes=buf.int64() if magic==_XTC_MAGIC_LARGE_ else buf.int()
+            buf.opaque(nbytes)
+    return Frame(step,t,box,x,None)
+
+def read_frames(filename,read_data=True):
+    """read_frames generates the frames of a trr or xtc trajectory file
+
+    :param filename: name of trajectory file; its extension selects the format
+    :type filename: str
+    :param read_data: if False, frames carry only step and time, defaults to True
+    :type read_data: bool, optional
+    :raises TrajectoryFormatError: if the file extension is not recognized
+    :yield: one Frame per trajectory frame
+    :rtype: Frame
+    """
+    ext=os.path.splitext(filename)[1]
+    if ext=='.trr':
+        reader=_trr_frame
+    elif ext=='.xtc':
+        reader=_xtc_frame
+    else:
+        raise TrajectoryFormatError(f'Cannot read trajectory file {filename}; only trr and xtc are supported')
+    buf=_open_buffer(filename)
+    try:
+        while not buf.at_end():
+            try:
+                fr=reader(buf,read_data=read_data)
+            except EOFError:
+                logger.warning(f'Trajectory file {filename} ends with an incomplete frame; ignored')
+                break
+            yield fr
+    finally:
+        if isinstance(buf.data,mmap.mmap):
+            buf.data.close()
+
+def count_frames(filename):
+    """count_frames returns the number of frames and the times of the first and last frames of a trr or xtc file
+
+    :param filename: name of trajectory file
+    :type filename: str
+    :return: number of frames, first time (ps), last time (ps)
+    :rtype: tuple(int,float,float)
+    """
+    n=0
+    t0=t1=0.0
+    for fr in read_frames(filename,read_data=False):
+        if n==0:
+            t0=fr.time
+        t1=fr.time
+        n+=1
+    return n,t0,t1
@@ -0,0 +1,45 @@
+"""
+
+.. module:: xdr
+   :synopsis: minimal reader for the XDR encoding used in Gromacs binary files (edr, trr, xtc)
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import numpy as np
+
+class XDRBuffer:
+    """Sequential big-endian reader over the bytes of an XDR-encoded file
+
+    :param data: file contents; anything supporting len() and slicing to bytes (bytes, mmap)
+    :type data: bytes
+    """
+    def __init__(self,data):
+        self.data=data
+        self.pos=0
+    def at_end(self):
+        return self.pos>=len(self.data)
+    def _take(self,n):
+        if self.pos+n>len(self.data):
+            raise EOFError
+        b=self.data[self.pos:self.pos+n]
+        self.pos+=n
+        return b
+    def int(self):
+        return int(np.frombuffer(self._take(4),dtype='>i4')[0])
+    def int64(self):
+        return int(np.frombuffer(self._take(8),dtype='>i8')[0])
+    def float(self):
+        return float(np.frombuffer(self._take(4),dtype='>f4')[0])
+    def double(self):
+        return float(np.frombuffer(self._take(8),dtype='>f8')[0])
+    def reals(self,n,dtype):
+        return np.frombuffer(self._take(n*np.dtype(dtype).itemsize),dtype=dtype)
+    def opaque(self,n):
+        b=self._take(n)
+        self._take((4-n%4)%4)
+        return b
+    def string(self):
+        return self.opaque(self.int()).decode()
+    def skip(self,n):
+        self._take(n)
@@ -0,0 +1,26 @@
+"""
+
+.. module:: stubs
+   :synopsis: stand-in executables (e.g., for gmx) used by tests of code that launches external programs
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import os
+import stat
+import sys
+
+def write_stub(path,body):
+    """write_stub writes an executable python script that runs body with the interpreter running the tests
+
+    :param path: name of the script
+    :type path: str
+    :param body: python source of the script
+    :type body: str
+    :return: absolute path of the script
+    :rtype: str
+    """
+    with open(path,'w') as f:
+        f.write(f'#!{sys.executable}\n'+body)
+    os.chmod(path,os.stat(path).st_mode|stat.S_IXUSR)
+    return os.path.abspath(path)
@@ -0,0 +1,40 @@
+"""
+
+.. module:: test_bondlist
+   :synopsis: tests bondlist
+   
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+from HTPolyNet.bondlist import Bondlist
+import pandas as pd
+import numpy as np
+
+class TestBondlist(unittest.TestCase):
+    def test_partners(self):
+        B=Bondlist.fromDataFrame(pd.DataFrame({'ai':[1,2,3,1],'aj':[2,3,4,5]}))
+        self.assertEqual(B.B,{1:[2,5],2:[1,3],3:[2,4],4:[3],5:[1]})
+        self.assertTrue(B.are_bonded(5,1))
+        self.assertFalse(B.are_bonded(1,3))
+        self.assertEqual(B.partners_of(99),[])
+        B.append([6,3])
+        self.assertEqual(B.partners_of(3),[2,4,6])
+        self.assertTrue(B.are_bonded(3,6))
+        owner,partner=B.partners_of_many([3,1])
+        self.assertEqual(owner.tolist(),[3,3,3,1,1])
+        self.assertEqual(partner.tolist(),[2,4,6,2,5])
+        self.assertEqual(B.degree([1,3,4,7]).tolist(),[2,3,1,0])
+    def test_adjacency_and_delete(self):
+        B=Bondlist.fromDataFrame(pd.DataFrame({'ai':[1,2,3],'aj':[2,3,4]}))
+        A=B.adjacency_matrix()
+        self.assertEqual(A.shape,(4,4))
+        self.assertEqual(A.nnz,6)
+        self.assertTrue((A!=A.T).nnz==0)
+        lookup=np.array([-1,1,-1,2,3])
+        B.delete_atoms([2],lookup=lookup)
+        self.assertEqual(B.B,{2:[3],3:[2]})
+        self.assertEqual(len(B),1)
+        self.assertEqual(list(B.graph().edges),[(2,3)])
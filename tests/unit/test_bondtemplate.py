@@ -0,0 +1,57 @@
+"""
+
+.. module:: test_bondtemplate
+   :synopsis: tests bond template keys and template lookup
+   
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+from types import SimpleNamespace
+from copy import deepcopy
+from HTPolyNet.bondtemplate import BondTemplate
+from HTPolyNet.topocoord import find_template, build_template_index
+
+def template(names,resnames,bystander_resnames=[[],[]]):
+    return BondTemplate(names,resnames,False,1,bystander_resnames,[[],[]],[None,None],[None,None])
+
+class TestBondTemplate(unittest.TestCase):
+    def test_key(self):
+        a=template(['C1','N1'],['EPO','AMN'],[['AMN'],[]])
+        b=deepcopy(a)
+        b.reverse()
+        ka,fa=a.key()
+        kb,fb=b.key()
+        self.assertEqual(ka,kb)
+        self.assertNotEqual(fa,fb)
+        self.assertNotEqual(template(['C1','N2'],['EPO','AMN']).key()[0],ka)
+
+    def test_find_template(self):
+        bts=[template(['C1','N1'],['EPO','AMN']),template(['C2','N1'],['EPO','AMN']),template(['C1','N1'],['EPO','AMN'],[['AMN'],[]])]
+        moldict={}
+        for i,bt in enumerate(bts):
+            moldict[f'M{i}']=SimpleNamespace(name=f'M{i}',bond_templates=[bt],reaction_bonds=[f'rb{i}'])
+        queries=[deepcopy(x) for x in bts]+[deepcopy(x) for x in bts]
+        for q in queries[3:]:
+            q.reverse()
+        scanned=[find_template(q,moldict) for q in queries]
+        index=build_template_index(moldict)
+        indexed=[find_template(q,moldict,template_index=index) for q in queries]
+        self.assertEqual([(T.name,rb,rev) for T,rb,rev in scanned],[(T.name,rb,rev) for T,rb,rev in indexed])
+        self.assertEqual([rev for T,rb,rev in indexed],[False]*3+[True]*3)
+        unknown=template(['C9','N9'],['EPO','AMN'])
+        self.assertRaises(Exception,find_template,unknown,moldict,template_index=index)
+        # a molecule added after indexing is found, because the stale index is rebuilt
+        moldict['M3']=SimpleNamespace(name='M3',bond_templates=[unknown],reaction_bonds=['rb3'])
+        T,rb,rev=find_template(unknown,moldict,template_index=index)
+        self.assertEqual((T.name,rb,rev),('M3','rb3',False))
+        # so is a template appended to an existing molecule
+        extra=template(['C8','N8'],['EPO','AMN'])
+        moldict['M0'].bond_templates.append(extra)
+        moldict['M0'].reaction_bonds.append('rb0x')
+        T,rb,rev=find_template(extra,moldict,template_index=index)
+        self.assertEqual((T.name,rb,rev),('M0','rb0x',False))
+        # an empty index is built on first use
+        index={}
+        self.assertEqual(find_template(queries[4],moldict,template_index=index)[1],'rb1')
+        self.assertIn('index',index)
@@ -0,0 +1,46 @@
+"""
+
+.. module:: test_checks
+   :synopsis: tests HTPolyNet.checks consistency-check levels and timing
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+import os
+logger=logging.getLogger(__name__)
+import pandas as pd
+import HTPolyNet.checks as checks
+from HTPolyNet.topology import Topology
+from HTPolyNet.topocoord import TopoCoord
+
+class TestChecks(unittest.TestCase):
+    def tearDown(self):
+        checks.set_check_level('cheap')
+        checks.reset_timings()
+    def test_levels(self):
+        checks.set_check_level('off')
+        self.assertFalse(checks.active('cheap'))
+        checks.set_check_level('cheap')
+        self.assertTrue(checks.active('cheap'))
+        self.assertFalse(checks.active('full'))
+        checks.set_check_level_from_cfg({'CURE':{'controls':{'check_level':'full'}}})
+        self.assertTrue(checks.active('full'))
+        self.assertRaises(Exception,checks.set_check_level,'paranoid')
+    def test_null_check(self):
+        T=Topology()
+        T.D['bonds']=pd.DataFrame({'ai':[1,2],'aj':[2,None],'funct':[1,1]})
+        checks.set_check_level('off')
+        T.null_check()
+        checks.set_check_level('cheap')
+        self.assertRaises(Exception,T.null_check)
+        self.assertEqual(checks.timings['Topology.null_check'][0],1)
+    def test_check_your_topology_full_only(self):
+        TC=TopoCoord()
+        TC.Topology.D['pairs']=pd.DataFrame({'ai':[1],'aj':[1],'funct':[1]})
+        checks.set_check_level('cheap')
+        TC.check_your_topology()
+        self.assertFalse(os.path.exists('checked.top'))
+        checks.set_check_level('full')
+        self.assertRaises(AssertionError,TC.check_your_topology)
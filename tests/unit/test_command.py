@@ -0,0 +1,97 @@
+"""
+
+.. module:: test_command
+   :synopsis: tests HTPolyNet.command asynchronous runner
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+
+import HTPolyNet.command as command
+from HTPolyNet.command import Command, run_concurrently
+from tests.unit.stubs import write_stub
+
+# stub executable: echoes stdin, prints its arguments, sleeps if asked, exits with a requested code,
+# and counts its invocations in a file next to itself
+STUB='''import os, sys, time
+here=os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(here,'count'),'a') as f:
+    f.write('x')
+args=sys.argv[1:]
+opts=dict(zip(args[::2],args[1::2]))
+if '-stdin' in opts:
+    sys.stdout.write(sys.stdin.read())
+print('args',' '.join(args))
+print('to stderr',file=sys.stderr)
+sys.stdout.flush()
+time.sleep(float(opts.get('-sleep',0)))
+sys.exit(int(opts.get('-exit',0)))
+'''
+
+class TestCommand(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.TemporaryDirectory()
+        self.stub=write_stub(os.path.join(self.tmp.name,'stubtool'),STUB)
+        command.timeout_policy.clear()
+    def tearDown(self):
+        command.timeout_policy.clear()
+        self.tmp.cleanup()
+    def count(self):
+        with open(os.path.join(self.tmp.name,'count')) as f:
+            return len(f.read())
+    def test_argv(self):
+        # an option value is one argument, unless it is a list; an empty value makes a bare flag
+        c=Command(f'{self.stub} -a 1 < in.txt > out.txt 2>&1',b='x y',box=[1.0,2.0],noconfout='',o='$HOME;x')
+        args,stdin,stdout=c.argv()
+        self.assertEqual(args,[self.stub,'-a','1','-b','x y','-box','1.0','2.0','-noconfout','-o','$HOME;x'])
+        self.assertEqual((stdin,stdout),('in.txt','out.txt'))
+        self.assertFalse(Command(f'{self.stub} < in.txt',b='x y').needs_shell())
+        for cmd in ['OMP_NUM_THREADS=2 gmx mdrun','module load gromacs; gmx mdrun','cd run && gmx mdrun',
+                    'gmx mdrun | tee log','gmx mdrun 2> err','mpirun -np $NP gmx_mpi mdrun']:
+            self.assertTrue(Command(cmd).needs_shell(),cmd)
+    def test_shell_fallback(self):
+        out,err=run_concurrently(Command(f'N=$((1+2)); {self.stub} -a $N && {self.stub}',b='x y').run_async())[0]
+        self.assertEqual(out,'args -a 3\nargs -b x y\n')
+    def test_output_and_stdin(self):
+        inp=os.path.join(self.tmp.name,'in.txt')
+        with open(inp,'w') as f:
+            f.write('hello\n')
+        out,err=run_concurrently(Command(f'{self.stub} < {inp}',stdin=1).run_async())[0]
+        self.assertEqual(out,'hello\nargs -stdin 1\n')
+        self.assertEqual(err,'to stderr\n')
+    def test_streamed_log(self):
+        log=os.path.join(self.tmp.name,'run.log')
+        run_concurrently(Command(self.stub,a=1).run_async(log=log))
+        with open(log) as f:
+            self.assertIn('args -a 1\n',f.read())
+    def test_failure(self):
+        with self.assertRaises(subprocess.SubprocessError):
+            run_concurrently(Command(self.stub,exit=3).run_async())
+        out,err=run_concurrently(Command(self.stub,exit=3).run_async(ignore_codes=[3]))[0]
+        self.assertIn('args -exit 3',out)
+    def test_timeout_retries(self):
+        command.set_timeout_policy({'gromacs':{'timeouts':{'stubtool':{'timeout':0.5,'retries':2}}}})
+        t0=time.time()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run_concurrently(Command(self.stub,sleep=30).run_async())
+        self.assertLess(time.time()-t0,10)
+        self.assertEqual(self.count(),3)
+    def test_concurrent(self):
+        t0=time.time()
+        results=run_concurrently(*[Command(self.stub,sleep=1,n=i).run_async() for i in range(4)])
+        self.assertLess(time.time()-t0,3)
+        self.assertEqual([r[0].split()[-1] for r in results],['0','1','2','3'])
+    def test_inside_running_loop(self):
+        # synchronous callers, e.g., grompp_and_mdrun, may be reached from code already running an event loop
+        async def caller():
+            return run_concurrently(Command(self.stub,n=1).run_async())
+        out,err=asyncio.run(caller())[0]
+        self.assertIn('args -n 1',out)
@@ -0,0 +1,249 @@
+"""
+
+.. module:: test_coordinates
+   :synopsis: tests coordinates
+   
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import numpy as np
+import pandas as pd
+from HTPolyNet.coordinates import Coordinates, minimum_image, wrap_positions, set_grx_format, set_grx_format_from_cfg
+import HTPolyNet.coordinates as coordinates
+from HTPolyNet.topology import Topology
+from HTPolyNet.bondlist import Bondlist
+
+def carbons_with_hydrogens():
+    # C1(H2,H3) C4(H5,H6) C7(H8,H9); H3 and H6 are closest only through the periodic boundary
+    C=Coordinates()
+    C.A=pd.DataFrame({
+        'globalIdx':np.arange(1,10),
+        'atomName':['C1','H1','H2','C2','H1','H2','C3','H1','H2'],
+        'posX':[0.2,0.3,0.05,1.8,1.7,1.95,0.2,0.3,0.1],
+        'posY':[1.0,1.1,1.0,1.0,1.1,1.0,1.3,1.35,1.2],
+        'posZ':[1.0,1.0,1.0,1.0,1.0,1.0,1.0,1.0,1.0]})
+    C.box=np.diag([2.0,2.0,2.0])
+    T=Topology()
+    T.D['atoms']=pd.DataFrame({'nr':C.A['globalIdx'],'atom':C.A['atomName']})
+    T.bondlist=Bondlist.fromDataFrame(pd.DataFrame({'ai':[1,1,4,4,7,7],'aj':[2,3,5,6,8,9]}))
+    return C,T
+
+def line_parsed_gro_atoms(filename):
+    # the line-by-line text parse that read_gro used before its atom block was decoded as a byte array
+    with open(filename,'r') as f:
+        data=[x for x in f.read().split('\n') if x!='']
+    series={k:[] for k in Coordinates.gro_attributes}
+    for i,x in enumerate(data[2:-1]):
+        series['resNum'].append(int(x[0:5].strip()))
+        series['resName'].append(x[5:10].strip())
+        series['atomName'].append(x[10:15].strip())
+        series['globalIdx'].append(i+1)
+        numbers=list(map(float,[x[20+8*i:20+8*(i+1)] for i in range(0,3)]))
+        if len(x)>44:
+            numbers.extend(list(map(float,[x[44+8*i:44+8*(i+1)] for i in range(0,3)])))
+        for k,v in zip(['posX','posY','posZ','velX','velY','velZ'],numbers):
+            series[k].append(v)
+    return pd.DataFrame({k:v for k,v in series.items() if len(v)>0})
+
+class TestCoordinates(unittest.TestCase):
+    def test_sacH(self):
+        C,T=carbons_with_hydrogens()
+        self.assertEqual(C.sacH(1,4,T),[3,6])
+        # the choice depends on distance, not on bondlist order
+        T.bondlist=Bondlist.fromDataFrame(pd.DataFrame({'ai':[1,1,4,4,7,7],'aj':[3,2,5,6,8,9]}))
+        self.assertEqual(C.sacH(1,4,T),[3,6])
+    def test_sacH_many_shared_atom(self):
+        C,T=carbons_with_hydrogens()
+        # bonds 1-4 and 4-7 share atom 4; each H is picked at most once
+        picks=C.sacH_many([(1,4),(4,7)],T)
+        self.assertEqual(picks[0],[3,6])
+        self.assertEqual(picks[1][0],5)
+        self.assertEqual(len(set(picks[0]+picks[1])),4)
+        self.assertRaises(Exception,C.sacH_many,[(1,4),(4,7),(7,4)],T)
+    def test_find_sacrificial_H(self):
+        C,T=carbons_with_hydrogens()
+        # both bonds on atom 1 would prefer H3; it may only be used once
+        idx=C.find_sacrificial_H([(1,4,1),(1,7,1)],T)
+        self.assertEqual(idx[:2],[3,6])
+        self.assertEqual(idx[2],2)
+        self.assertEqual(len(set(idx)),4)
+        idx=C.find_sacrificial_H([(1,4,1),(1,7,1)],T,explicit_sacH={0:[2,5]})
+        self.assertEqual(idx[:2],[2,5])
+        self.assertEqual(idx[2],3)
+    def test_sacH_rename(self):
+        C,T=carbons_with_hydrogens()
+        C.sacH(1,4,T,rename=True)
+        self.assertEqual(C.A['atomName'].to_list()[:6],['C1','H1','H2','C2','H1','H2'])
+        C.A.loc[1,'atomName']='H2'
+        C.A.loc[2,'atomName']='H1'
+        C.sacH(1,4,T,rename=True)
+        self.assertEqual(C.A['atomName'].to_list()[1:3],['H1','H1'])
+        self.assertEqual(T.D['atoms']['atom'].to_list()[1],'H1')
+    def test_read_gro(self):
+        C=Coordinates.read_gro('fixtures/config1.gro',wrap_coords=False)
+        self.assertEqual(C.N,3600)
+        self.assertEqual(C.A.shape[0],3600)
+        self.assertFalse('velX' in C.A)
+        self.assertEqual(C.A.loc[0,['resNum','resName','atomName','globalIdx']].to_list(),[1,'STY','C',1])
+        self.assertTrue(np.allclose(C.A.loc[1,['posX','posY','posZ']].to_numpy(dtype=float),[4.747,0.336,1.475]))
+        self.assertTrue(np.allclose(C.box,np.identity(3)*5.60708))
+    def test_read_gro_matches_line_parser(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as d:
+            for fixture,has_vel in [('config1',False),('config2',True)]:
+                ref=line_parsed_gro_atoms(f'fixtures/{fixture}.gro')
+                self.assertEqual('velX' in ref,has_vel)
+                with open(f'fixtures/{fixture}.gro','r') as f:
+                    lines=f.read().split('\n')
+                variants={'lf':'\n'.join(lines),'crlf':'\r\n'.join(lines),
+                          'trailing-space':'\n'.join([l+'   ' if 2<=i<len(lines)-2 else l for i,l in enumerate(lines)])}
+                for label,text in variants.items():
+                    fn=os.path.join(d,f'{fixture}-{label}.gro')
+                    with open(fn,'w',newline='') as f:
+                        f.write(text)
+                    C=Coordinates.read_gro(fn,wrap_coords=False)
+                    pd.testing.assert_frame_equal(C.A,ref,check_dtype=False)
+                    self.assertTrue(np.allclose(C.box,Coordinates.read_gro(f'fixtures/{fixture}.gro',wrap_coords=False).box))
+    def test_read_gro_velocities_triclinic(self):
+        import os
+        import tempfile
+        lines=['velocities','    2',
+               '    1STY      C    1   0.100   0.200   0.300  0.1000 -0.2000  0.3000',
+               '10000STY  C1234    2   1.100   1.200   1.300 -1.1000  1.2000 -1.3000',
+               '   2.00000   3.00000   4.00000   0.00000   0.00000   0.50000   0.00000   0.60000   0.70000']
+        with tempfile.TemporaryDirectory() as d:
+            fn=os.path.join(d,'v.gro')
+            with open(fn,'w') as f:
+                f.write('\n'.join(lines)+'\n')
+            C=Coordinates.read_gro(fn,wrap_coords=False)
+            for i in [2,3]:
+                mixed=lines.copy()
+                mixed[i]=mixed[i][:44]
+                with open(fn,'w') as f:
+                    f.write('\n'.join(mixed)+'\n')
+                with self.assertRaises(Exception) as cm:
+                    Coordinates.read_gro(fn,wrap_coords=False)
+                self.assertTrue('velocities' in str(cm.exception))
+        self.assertEqual(C.A['resNum'].to_list(),[1,10000])
+        self.assertEqual(C.A['atomName'].to_list(),['C','C1234'])
+        self.assertTrue(np.allclose(C.A['velY'].to_numpy(),[-0.2,1.2]))
+        self.assertTrue(np.allclose(C.box,[[2.0,0.0,0.0],[0.5,3.0,0.0],[0.6,0.7,4.0]]))
+    def test_write_gro_roundtrip(self):
+        import os
+        import tempfile
+        C=Coordinates.read_gro('fixtures/config1.gro',wrap_coords=False)
+        C.box[1][0]=0.5
+        with tempfile.TemporaryDirectory() as d:
+            fn=os.path.join(d,'w.gro')
+            C.write_gro(fn)
+            with open(fn,'r') as f:
+                lines=f.read().split('\n')
+            D=Coordinates.read_gro(fn,wrap_coords=False)
+        self.assertEqual(lines[2],'    1STY      C    1   4.796   0.261   1.367')
+        self.assertEqual(len(lines[-2].split()),9)
+        pd.testing.assert_frame_equal(C.A,D.A)
+        self.assertTrue(np.allclose(C.box,D.box))
+    def test_write_gro_chunks(self):
+        import os
+        import tempfile
+        C=Coordinates.read_gro('fixtures/config2.gro',wrap_coords=False)
+        saved=coordinates._GRO_WRITE_CHUNK_
+        with tempfile.TemporaryDirectory() as d:
+            try:
+                coordinates._GRO_WRITE_CHUNK_=7
+                C.write_gro(os.path.join(d,'w.gro'))
+            finally:
+                coordinates._GRO_WRITE_CHUNK_=saved
+            with open(os.path.join(d,'w.gro'),'r') as f:
+                written=f.read()
+            # atom and residue numbers are both wrapped to five digits
+            C.A=C.A.iloc[:2].copy()
+            C.N=2
+            C.A['resNum']=[123456,1]
+            C.A['globalIdx']=[123456,123457]
+            C.write_gro(os.path.join(d,'x.gro'))
+            with open(os.path.join(d,'x.gro'),'r') as f:
+                lines=f.read().split('\n')
+        with open('fixtures/config2.gro','r') as f:
+            self.assertEqual(written,f.read())
+        self.assertEqual([l[:5]+l[15:20] for l in lines[2:4]],['2345623456','    123457'])
+    def test_wrap_coords(self):
+        C=Coordinates()
+        C.A=pd.DataFrame({'globalIdx':[1,2,3],'posX':[-0.5,4.5,1.0],'posY':[1.0,-4.5,2.0],'posZ':[0.0,2.0,6.1]})
+        C.box=np.diag([2.0,3.0,4.0])
+        C.wrap_coords()
+        self.assertTrue(np.allclose(C.A[['posX','posY','posZ']].to_numpy(),[[1.5,1.0,0.0],[0.5,1.5,2.0],[1.0,2.0,2.1]]))
+        self.assertEqual(C.A['boxLx'].to_list(),[1,-2,0])
+        self.assertEqual(C.A['boxLy'].to_list(),[0,2,0])
+        self.assertEqual(C.A['boxLz'].to_list(),[0,0,-1])
+        R,n=wrap_positions(np.array([-0.5,1.0,8.0]),C.box)
+        self.assertTrue(np.allclose(R,[1.5,1.0,0.0]))
+        self.assertEqual(n.tolist(),[1,0,-2])
+    def test_minimum_image(self):
+        box=np.diag([2.0,3.0,4.0])
+        D=np.array([[1.5,-2.0,0.5],[-3.1,1.4,2.5]])
+        self.assertTrue(np.allclose(minimum_image(D,box),[[-0.5,1.0,0.5],[0.9,1.4,-1.5]]))
+        self.assertTrue(np.allclose(minimum_image(D[0],box,pbc=[0,1,1]),[1.5,1.0,0.5]))
+        C=Coordinates()
+        C.box=box
+        self.assertTrue(np.allclose(C.mic(D[1],[1,1,1]),[0.9,1.4,-1.5]))
+        tbox=np.array([[3.0,0.0,0.0],[1.2,2.8,0.0],[-1.1,0.9,2.5]])
+        rng=np.random.default_rng(1)
+        D=rng.uniform(-8,8,size=(200,3))
+        M=minimum_image(D,tbox)
+        shifts=np.array([[i,j,k] for i in range(-6,7) for j in range(-6,7) for k in range(-6,7)])@tbox
+        for d,m in zip(D,M):
+            c=d+shifts
+            self.assertAlmostEqual(np.sqrt((c*c).sum(axis=1).min()),np.linalg.norm(m))
+            n=np.linalg.solve(tbox.T,d-m)
+            self.assertTrue(np.allclose(n,np.round(n)))
+    def test_grx_roundtrip(self):
+        import os
+        import tempfile
+        C=Coordinates()
+        C.A=pd.DataFrame({'globalIdx':np.arange(1,5),'atomName':['C1','C2','H1','H2']})
+        C.A['z']=[1,2,0,0]
+        C.A['reactantName']=['STY','STY','DVB','UNSET']
+        C.A['charge']=[0.125,-0.25,0.0625,0.0]
+        # a missing string and a missing number survive the round trip as NaN
+        C.A['molecule_name']=['STY',np.nan,'STY','DVB']
+        C.A['sea_idx']=[0.0,np.nan,1.0,2.0]
+        attrs=['z','reactantName','charge','molecule_name','sea_idx']
+        with tempfile.TemporaryDirectory() as d:
+            for fmt in ['npz','text']:
+                fn=os.path.join(d,f'{fmt}.grx')
+                C.write_atomset_attributes(attrs,fn,fmt=fmt)
+                with open(fn,'rb') as f:
+                    self.assertEqual(f.read(2)==b'PK',fmt=='npz')
+                D=Coordinates()
+                D.A=C.A[['globalIdx','atomName']].copy()
+                self.assertEqual(D.read_atomset_attributes(fn),attrs)
+                pd.testing.assert_frame_equal(C.A,D.A)
+                self.assertEqual(D.A['molecule_name'].isna().to_list(),[False,True,False,False])
+            # files whose atoms do not line up with the coordinates are merged on globalIdx
+            D=Coordinates()
+            D.A=C.A[['globalIdx','atomName']].iloc[::-1].reset_index(drop=True)
+            D.read_atomset_attributes(os.path.join(d,'npz.grx'))
+            self.assertEqual(D.A.set_index('globalIdx').loc[3,'reactantName'],'DVB')
+            # text is the default; binary is opt-in through the cfg
+            self.assertEqual(coordinates.grx_format,'text')
+            C.write_atomset_attributes(attrs,os.path.join(d,'default.grx'))
+            with open(os.path.join(d,'default.grx'),'r') as f:
+                self.assertEqual(f.readline().split(),['globalIdx']+attrs)
+            set_grx_format_from_cfg({'CURE':{'controls':{'grx_format':'npz'}}})
+            C.write_atomset_attributes(attrs,os.path.join(d,'binary.grx'))
+            set_grx_format_from_cfg({})
+            self.assertEqual(coordinates.grx_format,'text')
+            with open(os.path.join(d,'binary.grx'),'rb') as f:
+                self.assertEqual(f.read(2),b'PK')
+            # an object column that is not all strings cannot be stored as npz, so it is written as text
+            C.A['tag']=['a',1,np.nan,'b']
+            fn=os.path.join(d,'mixed.grx')
+            C.write_atomset_attributes(['tag'],fn,fmt='npz')
+            with open(fn,'rb') as f:
+                self.assertNotEqual(f.read(2),b'PK')
+        self.assertRaises(Exception,set_grx_format,'xml')
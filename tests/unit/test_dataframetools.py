@@ -26,3 +26,17 @@ class TestDataframeTools(unittest.TestCase):
         ans=pd.Series({'a':3,'b':8,'c':13})
         res=row==ans
         self.assertTrue(res.all())
+    def test_idx_lookup(self):
+        keep,lookup=idx_lookup([1,2,3,4,5,6],[2,5])
+        self.assertEqual(keep.tolist(),[True,False,True,True,False,True])
+        self.assertEqual(lookup.tolist(),[-1,1,-1,2,3,-1,4])
+        self.assertEqual(lookup_as_dict(lookup),{1:1,3:2,4:3,6:4})
+        df=pd.DataFrame({'ai':[1,2,3,6,1],'aj':[3,4,4,1,6]})
+        df,ndrop=drop_rows_with_idx(df,['ai','aj'],[2,5])
+        self.assertEqual(ndrop,1)
+        remap_idx_columns(df,['ai','aj'],lookup,check=True)
+        self.assertEqual(df.ai.to_list(),[1,2,4,1])
+        self.assertEqual(df.aj.to_list(),[2,3,1,4])
+        df,ndup=canonical_pair_dedup(df)
+        self.assertEqual(ndup,1)
+        self.assertEqual(df.shape[0],3)
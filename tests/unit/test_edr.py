@@ -0,0 +1,34 @@
+"""
+
+.. module:: test_edr
+   :synopsis: tests HTPolyNet.edr native energy-file reader
+   
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import numpy as np
+
+from HTPolyNet.edr import read_edr, edr_term_names
+
+class TestEDR(unittest.TestCase):
+    def test_term_names(self):
+        names=edr_term_names('fixtures/items31.edr')
+        self.assertEqual(len(names),31)
+        self.assertEqual(names[:3],['Bond','Angle','Proper-Dih.'])
+        self.assertEqual(names[-1],'T-rest')
+        self.assertEqual(len(edr_term_names('fixtures/items43.edr')),43)
+    def test_read_all(self):
+        df=read_edr('fixtures/items43.edr')
+        self.assertEqual(df.shape,(201,44))
+        self.assertEqual(list(df.columns[:3]),['time(ps)','Angle','Proper-Dih.'])
+        self.assertTrue(np.allclose(df['time(ps)'].to_numpy(),np.arange(201.0)))
+    def test_read_selected(self):
+        df=read_edr('fixtures/items45.edr',['Density','Bond','Not-a-term'])
+        # columns come in file order, unknown names are ignored
+        self.assertEqual(list(df.columns),['time(ps)','Bond','Density'])
+        self.assertEqual(df.shape[0],301)
+        self.assertAlmostEqual(df['Bond'].iloc[0],227.861526,places=4)
+        self.assertTrue((df['Density']>0).all())
@@ -0,0 +1,130 @@
+"""
+
+.. module:: test_gmxcache
+   :synopsis: tests HTPolyNet.gmxcache grompp/mdrun result cache with a stub gmx
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import os
+import shutil
+import tempfile
+
+import HTPolyNet.gmxcache as gmxcache
+import HTPolyNet.software as sw
+from HTPolyNet.gromacs import grompp_and_mdrun
+from tests.unit.stubs import write_stub
+
+# stub gmx: grompp writes the tpr, mdrun writes gro/edr/log; each call is counted
+STUB='''import os, sys
+here=os.path.dirname(os.path.abspath(__file__))
+args=sys.argv[1:]
+if args==['--version']:
+    print('GROMACS version:    2099.1-stub')
+    sys.exit(0)
+with open(os.path.join(here,'count'),'a') as f:
+    f.write(args[0][0])
+opts=dict(zip(args[1::2],args[2::2]))
+if args[0]=='grompp':
+    with open(opts['-o'],'w') as f:
+        f.write('tpr\\n')
+elif args[0]=='mdrun':
+    for ext in ['gro','edr','log']:
+        with open(opts['-deffnm']+'.'+ext,'w') as f:
+            f.write(ext+' from mdrun\\n')
+'''
+
+class TestGmxCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.TemporaryDirectory()
+        self.cwd=os.getcwd()
+        os.chdir(self.tmp.name)
+        write_stub('gmx',STUB)
+        for f in ['config1.gro','config1.top','short.mdp']:
+            shutil.copy(os.path.join(self.cwd,'fixtures',f),'.')
+        with open('config1.top') as f:
+            top=f.read()
+        # make the topology include a local itp, to check that its content is part of the key
+        with open('config1.top','w') as f:
+            f.write('#include "extra.itp"\n'+top)
+        with open('extra.itp','w') as f:
+            f.write('; one\n')
+        self.saved=(sw.gmx,sw.gmx_options,sw.mdrun,sw.mdrun_single_molecule)
+        sw.gmx=os.path.abspath('gmx')
+        sw.gmx_options=''
+        sw.mdrun=f'{sw.gmx} mdrun'
+        gmxcache.set_cache_from_cfg({'gromacs':{'cache':True}},'cache')
+    def tearDown(self):
+        sw.gmx,sw.gmx_options,sw.mdrun,sw.mdrun_single_molecule=self.saved
+        gmxcache.disable()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+    def count(self):
+        with open('count') as f:
+            return f.read()
+    def key(self,**mdrun_options):
+        return gmxcache.input_key('config1.gro','config1.top','short.mdp',sw.mdrun,mdrun_options,sw.gmx,4)
+    def test_off_by_default(self):
+        gmxcache.set_cache_from_cfg({'gromacs':{}},'cache')
+        self.assertFalse(gmxcache.enabled())
+    def test_trajectories(self):
+        for ext in ['gro','xtc']:
+            with open(f'run.{ext}','w') as f:
+                f.write(ext)
+        # runs that write trajectories are left out unless asked for
+        gmxcache.store('a','run')
+        self.assertFalse(gmxcache.restore('a','run'))
+        gmxcache.set_cache_from_cfg({'gromacs':{'cache':{'trajectories':True}}},'cache')
+        gmxcache.store('a','run')
+        self.assertEqual(sorted(os.listdir(os.path.join('cache','a'))),['result.gro','result.xtc'])
+    def test_key(self):
+        k=self.key()
+        self.assertEqual(k,self.key(nt=8,pin='on',pinoffset=8))
+        self.assertNotEqual(k,self.key(dlb='no'))
+        with open('extra.itp','w') as f:
+            f.write('; two\n')
+        self.assertNotEqual(k,self.key())
+    def test_hit_and_bypass(self):
+        grompp_and_mdrun(gro='config1',top='config1',out='run',mdp='short')
+        self.assertEqual(self.count(),'gm')
+        for ext in ['gro','edr','log','tpr']:
+            os.remove(f'run.{ext}')
+        grompp_and_mdrun(gro='config1',top='config1',out='run',mdp='short')
+        # restored, not rerun
+        self.assertEqual(self.count(),'gm')
+        with open('run.gro') as f:
+            self.assertEqual(f.read(),'gro from mdrun\n')
+        self.assertTrue(os.path.exists('run.tpr'))
+        grompp_and_mdrun(gro='config1',top='config1',out='run',mdp='short',use_cache=False)
+        self.assertEqual(self.count(),'gmgm')
+        with open('extra.itp','w') as f:
+            f.write('; two\n')
+        grompp_and_mdrun(gro='config1',top='config1',out='run',mdp='short')
+        self.assertEqual(self.count(),'gmgmgm')
+    def test_lru_eviction(self):
+        gmxcache.set_cache_from_cfg({'gromacs':{'cache':{'max_size_mb':2.5/1024}}},'cache')
+        # each entry is 1 kB; the limit holds two
+        with open('run.gro','w') as f:
+            f.write('x'*1024)
+        for i,k in enumerate(['a','b']):
+            gmxcache.store(k,'run')
+            os.utime(os.path.join('cache',k),(i,i))
+        self.assertTrue(gmxcache.restore('a','run'))
+        gmxcache.store('c','run')
+        self.assertEqual(sorted(os.listdir('cache')),['a','c'])
+        self.assertFalse(gmxcache.restore('b','run'))
+    def test_restore_removes_stale_outputs(self):
+        with open('run.gro','w') as f:
+            f.write('cached')
+        gmxcache.store('a','run')
+        # outputs of some other run with the same basename
+        for f in ['run.gro','run.xtc','run.trr','run-mdrun.out']:
+            with open(f,'w') as fp:
+                fp.write('stale')
+        self.assertTrue(gmxcache.restore('a','run'))
+        self.assertEqual(sorted([f for f in os.listdir('.') if f.startswith('run')]),['run.gro'])
+        with open('run.gro') as f:
+            self.assertEqual(f.read(),'cached')
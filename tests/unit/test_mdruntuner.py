@@ -0,0 +1,142 @@
+"""
+
+.. module:: test_mdruntuner
+   :synopsis: tests HTPolyNet.mdruntuner thread-count selection with a stub gmx
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import json
+import os
+import tempfile
+
+import HTPolyNet.mdruntuner as mdruntuner
+from HTPolyNet.command import run_concurrently
+from tests.unit.stubs import write_stub
+
+# stub gmx: 'mdrun' writes a log reporting a synthetic ns/day that peaks at -nt 4 -ntomp 2;
+# 8 thread-MPI ranks "fail" as if the system were too small to decompose
+STUB='''import os, sys
+here=os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(here,'count'),'a') as f:
+    f.write('x')
+args=sys.argv[1:]
+opts=dict(zip(args[1::2],args[2::2]))
+nt,ntomp=int(opts['-nt']),int(opts['-ntomp'])
+if nt//ntomp>=8:
+    print('Fatal error: domain decomposition',file=sys.stderr)
+    sys.exit(1)
+perf=10.0-abs(nt-4)-abs(ntomp-2)
+with open(opts['-deffnm']+'.log','w') as f:
+    f.write('               Core t (s)   Wall t (s)        (%)\\n')
+    f.write('                 (ns/day)    (hour/ns)\\n')
+    f.write(f'Performance:    {perf:9.3f}    {24/perf:9.3f}\\n')
+'''
+
+# stub gmx for whole grompp/mdrun runs: grompp puts the atom count in the tpr; mdrun trials peak at
+# -nt 4 for systems of more than 1000 atoms and at -nt 2 for smaller ones; each production mdrun
+# appends its arguments to the file 'runs'
+RUN_STUB='''import os, sys
+args=sys.argv[1:]
+opts=dict(zip(args[1::2],args[2::2]))
+if args[0]=='grompp':
+    with open(opts['-c']) as f:
+        f.readline()
+        natoms=int(f.readline())
+    with open(opts['-o'],'w') as f:
+        f.write(str(natoms))
+    sys.exit(0)
+if '-nsteps' in opts:
+    with open(opts['-s']) as f:
+        natoms=int(f.read())
+    peak=4 if natoms>1000 else 2
+    perf=10.0-abs(int(opts['-nt'])-peak)-abs(int(opts['-ntomp'])-1)
+    with open(opts['-deffnm']+'.log','w') as f:
+        f.write(f'Performance:    {perf:9.3f}    {24/perf:9.3f}\\n')
+    sys.exit(0)
+with open('runs','a') as f:
+    f.write(' '.join(args[1:])+'\\n')
+with open(opts['-deffnm']+'.gro','w') as f:
+    f.write('gro\\n')
+'''
+
+class TestMdrunTuner(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.TemporaryDirectory()
+        self.cwd=os.getcwd()
+        os.chdir(self.tmp.name)
+        self.mdrun=write_stub('gmx',STUB)+' mdrun'
+        self.cache=os.path.abspath('mdrun-tuning.json')
+    def tearDown(self):
+        mdruntuner.set_tuner_from_cfg({},'')
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+    def count(self):
+        with open('count') as f:
+            return len(f.read())
+    def test_off_by_default(self):
+        mdruntuner.set_tuner_from_cfg({'gromacs':{}},self.cache)
+        self.assertFalse(mdruntuner.enabled())
+    def test_candidates(self):
+        mdruntuner.set_tuner_from_cfg({'gromacs':{'tune_mdrun':True}},self.cache)
+        self.assertEqual([(c['nt'],c['ntomp']) for c in mdruntuner.candidates(8)],
+            [(8,1),(8,2),(8,4),(8,8),(4,1),(4,2),(4,4),(2,1),(2,2)])
+        self.assertEqual(mdruntuner.candidates(1),[{'nt':1,'ntomp':1}])
+    def test_system_key(self):
+        with open('sys.gro','w') as f:
+            f.write('title\n 1000\n')
+            for i in range(1000):
+                f.write(f'{1:5d}{"X":<5s}{"C":>5s}{i%100000:5d}{0.0:8.3f}{0.0:8.3f}{0.0:8.3f}\n')
+            f.write('   2.00000   2.00000   2.00000\n')
+        # 1000 atoms -> 1024; 125 atoms/nm^3 -> 2^7
+        self.assertEqual(mdruntuner.system_key('sys.gro','npt',8),'npt-1024-7-8')
+    def test_tune_and_cache(self):
+        mdruntuner.set_tuner_from_cfg({'gromacs':{'tune_mdrun':{'trial_steps':100}}},self.cache)
+        best=run_concurrently(mdruntuner.tuned_options(self.mdrun,'sys','npt-1024-7-8',8))[0]
+        self.assertEqual(best,{'nt':4,'ntomp':2})
+        self.assertEqual(self.count(),9)
+        # trial files are cleaned up
+        self.assertFalse(os.path.exists('sys-tune.log'))
+        # reused without further trials, also after a restart re-reads the cache file
+        mdruntuner.set_tuner_from_cfg({'gromacs':{'tune_mdrun':True}},self.cache)
+        best=run_concurrently(mdruntuner.tuned_options(self.mdrun,'sys','npt-1024-7-8',8))[0]
+        self.assertEqual(best,{'nt':4,'ntomp':2})
+        self.assertEqual(self.count(),9)
+        with open(self.cache) as f:
+            self.assertEqual(json.load(f)['npt-1024-7-8']['ns_per_day'],10.0)
+    def test_parse_performance(self):
+        self.assertIsNone(mdruntuner.parse_performance('missing.log'))
+    def test_shared_options_not_modified(self):
+        import shutil
+        import HTPolyNet.gmxcache as gmxcache
+        import HTPolyNet.software as sw
+        from HTPolyNet.gromacs import grompp_and_mdrun
+        write_stub('gmx',RUN_STUB)
+        for f in ['config1.gro','config1.top','short.mdp']:
+            shutil.copy(os.path.join(self.cwd,'fixtures',f),'.')
+        with open('small.gro','w') as f:
+            f.write('title\n 100\n')
+            for i in range(100):
+                f.write(f'{1:5d}{"X":<5s}{"C":>5s}{i+1:5d}{0.0:8.3f}{0.0:8.3f}{0.0:8.3f}\n')
+            f.write('   2.00000   2.00000   2.00000\n')
+        saved=(sw.gmx,sw.gmx_options,sw.mdrun)
+        sw.gmx=os.path.abspath('gmx')
+        sw.gmx_options=''
+        sw.mdrun=f'{sw.gmx} mdrun'
+        gmxcache.disable()
+        mdruntuner.set_tuner_from_cfg({'gromacs':{'tune_mdrun':{'ncores':4,'trial_steps':10}}},self.cache)
+        # as passed from the cfg 'gromacs' section to every run
+        gromacs_dict={'mdrun_options':{'dlb':'yes'}}
+        try:
+            grompp_and_mdrun(gro='config1',top='config1',out='big',mdp='short',**gromacs_dict)
+            grompp_and_mdrun(gro='small',top='config1',out='small',mdp='short',**gromacs_dict)
+        finally:
+            sw.gmx,sw.gmx_options,sw.mdrun=saved
+        self.assertEqual(gromacs_dict,{'mdrun_options':{'dlb':'yes'}})
+        with open('runs') as f:
+            runs=[dict(zip(l.split()[::2],l.split()[1::2])) for l in f]
+        # each system gets its own tuned thread count
+        self.assertEqual([(r['-deffnm'],r['-nt'],r['-dlb']) for r in runs],[('big','4','yes'),('small','2','yes')])
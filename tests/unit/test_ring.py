@@ -14,6 +14,7 @@ import networkx as nx
 import pandas as pd
 import numpy as np
 from HTPolyNet.matrix4 import Matrix4
+from HTPolyNet.bondlist import Bondlist
 
 def regular_polygon(nsides,a):
     dangle=2*np.pi/nsides
@@ -66,6 +67,37 @@ class TestRings(unittest.TestCase):
         self.assertTrue(Ring([5,4,3,2,1]) in L)
         self.assertTrue(Ring([8,7,6,5,4]) in L)
 
+    def test_canonical_ring_key(self):
+        r=[101,201,301,401,501,601]
+        k=canonical_ring_key(r)
+        self.assertEqual(k,(101,201,301,401,501,601))
+        self.assertTrue(all([canonical_ring_key(x)==k for x in Ring(r).treadmill()]))
+        self.assertTrue(all([canonical_ring_key(x[::-1])==k for x in Ring(r).treadmill()]))
+        self.assertNotEqual(canonical_ring_key([1,3,2,4]),canonical_ring_key([1,2,3,4]))
+
+    def test_rings_through_bond(self):
+        # a chain 1-2-3-4-5-6-7-8 closed by bond 8-4 (5-ring) and then 1-8 (fused 5-ring with a chord)
+        B=Bondlist.fromDataFrame(pd.DataFrame({'ai':[1,2,3,4,5,6,7,4],'aj':[2,3,4,5,6,7,8,8]}))
+        rings=rings_through_bond(B,8,4,max_size=8)
+        self.assertEqual([canonical_ring_key(x) for x in rings],[(4,5,6,7,8)])
+        self.assertEqual(rings_through_bond(B,8,4,max_size=4),[])
+        B.append([1,8])
+        rings=[canonical_ring_key(x) for x in rings_through_bond(B,1,8,max_size=8)]
+        self.assertEqual(rings,[(1,2,3,4,8)])
+        L=RingList([Ring([4,5,6,7,8])])
+        self.assertEqual(L.merge([Ring([8,7,6,5,4]),Ring([1,2,3,4,8])]),1)
+        self.assertEqual(len(L),2)
+
+    def test_ring_list_keys(self):
+        L=RingList([Ring([1,2,3,4,5,6]),Ring([6,5,4,3,2,1]),Ring([11,12,13,14,15])])
+        self.assertEqual(len(L),2)
+        L.shift(10)
+        self.assertTrue(Ring([12,11,16,15,14,13]) in L)
+        self.assertFalse(Ring([1,2,3,4,5,6]) in L)
+        L.remap({x:x-10 for x in L.all_atoms()})
+        self.assertEqual([r.key for r in L],[(1,2,3,4,5,6),(11,12,13,14,15)])
+        self.assertEqual(len(set([Ring([1,2,3]),Ring([3,2,1]),Ring([2,3,1])])),1)
+
     def test_ring_list_basic(self):
         ll=[101,201,301,401,501,601]
         L=RingList([])
@@ -75,6 +107,18 @@ class TestRings(unittest.TestCase):
         self.assertEqual(len(L),10)
         self.assertTrue(Ring([101,201,301,401,501,601]) in L)
         self.assertFalse(Ring([11,12,13,14]) in L)
+        self.assertEqual(L[3].idx,[104,204,304,404,504,604])
+        self.assertEqual(L[-1].idx,[110,210,310,410,510,610])
+        self.assertEqual(len(L[2:5]),3)
+        L.remove(Ring([102,202,302,402,502,602]))
+        self.assertEqual(L[1].idx,[103,203,303,403,503,603])
+        self.assertEqual(L.pop().idx,[110,210,310,410,510,610])
+        self.assertEqual(len(L),8)
+        M=L+RingList([Ring([1,2,3]),Ring([101,201,301,401,501,601])])
+        self.assertEqual(len(M),9)
+        del M[0]
+        self.assertFalse(Ring([101,201,301,401,501,601]) in M)
+        self.assertEqual(M[-1].idx,[1,2,3])
 
     def test_ring_injest_coordinates(self):
         df=pd.DataFrame({
@@ -0,0 +1,86 @@
+"""
+
+.. module:: test_scheduler
+   :synopsis: tests HTPolyNet.scheduler concurrent project runner
+
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import os
+import tempfile
+import time
+import yaml
+
+from HTPolyNet.scheduler import core_slots, run_projects, run_stages, with_slot_options
+
+def _worker(d,mdrun_options,stages,fail,record):
+    def run_stage(stage):
+        if (d,stage) in fail:
+            raise Exception('boom')
+        t0=time.time()
+        time.sleep(0.5)
+        with open(record,'a') as f:
+            f.write(f'{d} {stage} {os.getpid()} {mdrun_options["pinoffset"]} {t0} {time.time()}\n')
+    return run_stages(d,[(s,s) for s in stages],run_stage)
+
+class TestScheduler(unittest.TestCase):
+    def test_core_slots(self):
+        slots=core_slots(4,ncores=128)
+        self.assertEqual([s['nt'] for s in slots],[32]*4)
+        self.assertEqual([s['pinoffset'] for s in slots],[0,32,64,96])
+        self.assertTrue(all([s['pin']=='on' for s in slots]))
+        slots=core_slots(3,ncores=8,pin=False)
+        self.assertEqual(slots,[{'nt':2}]*3)
+    def test_with_slot_options(self):
+        cfg=yaml.safe_load("""
+gromacs:
+  gmx: gmx
+  mdrun_options:
+    nt: 16
+    gpu_id: '0'
+""")
+        ogromacs=cfg['gromacs']
+        slot=core_slots(2,ncores=8)[1]
+        def do(mdp_pfx='npt',**gromacs_dict):
+            return gromacs_dict
+        # the slot's options are merged into the cfg's mdrun_options, not passed alongside them
+        g=do(mdp_pfx='local',**with_slot_options(ogromacs,slot))
+        self.assertEqual(g['gmx'],'gmx')
+        self.assertEqual(g['mdrun_options'],{'nt':4,'gpu_id':'0','pin':'on','pinoffset':4,'pinstride':1})
+        self.assertEqual(ogromacs['mdrun_options'],{'nt':16,'gpu_id':'0'})
+        self.assertEqual(with_slot_options(ogromacs,{}),ogromacs)
+        self.assertEqual(with_slot_options({},slot),{'mdrun_options':slot})
+    def test_sequential(self):
+        seen=[]
+        def worker(d,mdrun_options,stages):
+            return run_stages(d,[(s,s) for s in stages],lambda s:seen.append((d,s,mdrun_options)))
+        timings=run_projects(worker,['p1','p2'],args=(['a','b'],))
+        self.assertEqual(seen,[('p1','a',{}),('p1','b',{}),('p2','a',{}),('p2','b',{})])
+        self.assertEqual([(t.project,t.stage,t.status) for t in timings],[(d,s,'ok') for d,s,o in seen])
+    def test_concurrent(self):
+        projects=['p1','p2','p3','p4']
+        with tempfile.TemporaryDirectory() as tmp:
+            record=os.path.join(tmp,'record')
+            with self.assertRaises(Exception):
+                # a failing stage ends its project's chain, but the other projects finish
+                run_projects(_worker,projects,args=(['a','b'],[('p3','a')],record),max_concurrent=2,ncores=8)
+            with open(record) as f:
+                self.assertEqual(sorted([l.split()[0] for l in f]),['p1','p1','p2','p2','p4','p4'])
+            os.remove(record)
+            t0=time.time()
+            timings=run_projects(_worker,projects,args=(['a','b'],[],record),max_concurrent=2,ncores=8)
+            elapsed=time.time()-t0
+            with open(record) as f:
+                info={tuple(l.split()[:2]):l.split()[2:] for l in f}
+        # 4 projects x 2 stages x 0.5 s, two at a time
+        self.assertLess(elapsed,3.5)
+        self.assertEqual([(t.project,t.stage,t.status) for t in timings],[(p,s,'ok') for p in projects for s in ['a','b']])
+        self.assertLessEqual(len(set([i[0] for i in info.values()])),2)
+        self.assertTrue(set([i[1] for i in info.values()])<=set(['0','4']))
+        for p in projects:
+            # stage b of each project starts after stage a ends, in the same slot
+            self.assertLessEqual(float(info[(p,'a')][3]),float(info[(p,'b')][2]))
+            self.assertEqual(info[(p,'a')][:2],info[(p,'b')][:2])
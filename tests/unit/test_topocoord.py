@@ -0,0 +1,38 @@
+"""
+
+.. module:: test_topocoord
+   :synopsis: tests topocoord
+   
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import numpy as np
+import pandas as pd
+from HTPolyNet.topocoord import TopoCoord
+from HTPolyNet.topology import Topology
+from HTPolyNet.bondlist import Bondlist
+
+class TestTopoCoord(unittest.TestCase):
+    def test_enumerate_1_4_pairs_new_bonds(self):
+        # chain 1-2-3-4-5 plus a five-membered ring 3-6-7-8-9-3; new bonds are 2-3 and 6-7
+        TC=TopoCoord()
+        TC.Topology.bondlist=Bondlist.fromDataFrame(pd.DataFrame({'ai':[1,2,3,4,3,6,7,8,9],'aj':[2,3,4,5,6,7,8,9,3]}))
+        pi=TC.enumerate_1_4_pairs([(2,3),(6,7)])
+        got=set(zip(pi.ai,pi.aj,pi.source))
+        # 3-8, 7-9 and 6-9 are 1-3 neighbors across the ring and are excluded
+        self.assertEqual(got,{(1,4,'c'),(1,6,'c'),(1,9,'c'),(2,5,'r'),(2,7,'r'),(2,8,'r'),(2,7,'l'),(4,7,'l')})
+        self.assertEqual(set(pi[(pi.ai==2)&(pi.aj==7)].bi),{2,6})
+        # as in the per-bond loop this replaces, a new bond to an atom with no other neighbors gives no pairs
+        self.assertEqual(TC.enumerate_1_4_pairs([(4,5)]).shape[0],0)
+        self.assertEqual(set(zip(*[TC.enumerate_1_4_pairs([(4,5),(3,4)])[x] for x in ['ai','aj','source']])),
+            {(2,5,'c'),(6,5,'c'),(9,5,'c'),(1,4,'l'),(7,4,'l'),(8,4,'l')})
+    def test_enumerate_1_4_pairs_system(self):
+        TC=TopoCoord()
+        TC.Topology=Topology.read_top('test_topology/test.top')
+        pi=TC.enumerate_1_4_pairs()
+        p=TC.Topology.D['pairs']
+        self.assertEqual(set(zip(pi.ai,pi.aj)),set(zip(np.minimum(p.ai,p.aj),np.maximum(p.ai,p.aj))))
+        self.assertTrue((pi.ai<pi.aj).all())
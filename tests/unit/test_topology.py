@@ -13,6 +13,7 @@ import HTPolyNet.topology as tp
 import os
 import pandas as pd
 import numpy as np
+from copy import deepcopy
 
 class TestTopology(unittest.TestCase):
     def test_read_top(self):
@@ -43,3 +44,103 @@ class TestTopology(unittest.TestCase):
             self.assertTrue(all(W.D['dihedrals'][c].isna()))
         self.assertTrue(W.D['atoms'].shape==T.D['atoms'].shape)
 
+    def test_delete_atoms(self):
+        T=tp.Topology.read_top('test.top')
+        atoms=T.D['atoms']
+        natoms=atoms.shape[0]
+        idx=atoms[atoms['type'].isin(['ha','hc'])]['nr'].to_list()[:5]
+        keep=[x for x in atoms['nr'] if not x in idx]
+        mapper=T.delete_atoms(idx,debug=True)
+        self.assertEqual(T.D['atoms'].shape[0],natoms-len(idx))
+        self.assertEqual(mapper,{o:n for n,o in enumerate(keep,start=1)})
+        self.assertTrue(all(T.D['atoms']['nr']==np.arange(1,natoms-len(idx)+1)))
+        for d,cols in [('bonds',['ai','aj']),('pairs',['ai','aj']),('angles',['ai','aj','ak']),('dihedrals',['ai','aj','ak','al'])]:
+            for c in cols:
+                self.assertTrue(T.D[d][c].between(1,natoms-len(idx)).all())
+        pk=pd.DataFrame({'lo':np.minimum(T.D['pairs'].ai,T.D['pairs'].aj),'hi':np.maximum(T.D['pairs'].ai,T.D['pairs'].aj)})
+        self.assertFalse(pk.duplicated().any())
+        self.assertEqual(sum([len(v) for v in T.bondlist.B.values()]),2*T.D['bonds'].shape[0])
+    def test_resid_graph(self):
+        T=tp.Topology.read_top('test.top')
+        T.make_resid_graph()
+        adf=T.D['atoms']
+        self.assertEqual(T.residue_network.number_of_nodes(),adf['resnr'].nunique())
+        self.assertEqual(T.residue_network.number_of_edges(),0)
+        self.assertEqual(T.local_resid_cluster(1),[1])
+        a1=adf[(adf['resnr']==1)&(adf['atom']=='C1')]['nr'].iloc[0]
+        a2=adf[(adf['resnr']==2)&(adf['atom']=='C2')]['nr'].iloc[0]
+        a3=adf[(adf['resnr']==3)&(adf['atom']=='C2')]['nr'].iloc[0]
+        T.add_residue_edges([(a1,a2)])
+        self.assertEqual(T.local_resid_cluster(2),[1,2])
+        self.assertEqual(T.local_resid_cluster(3),[3])
+        T.add_residue_edges([(a2,a3)])
+        self.assertEqual(T.local_resid_cluster(1),[1,2,3])
+        self.assertEqual(T.local_resid_cluster(3),[1,2,3])
+    def test_rep_ex(self):
+        T=tp.Topology.read_top('test.top')
+        n=T.D['atoms'].shape[0]
+        nb=T.D['bonds'].shape[0]
+        nr=len(T.rings)
+        R=deepcopy(T)
+        R.rep_ex(3)
+        self.assertTrue(all(R.D['atoms']['nr']==np.arange(1,3*n+1)))
+        self.assertTrue(all(R.D['atoms']['resnr'].iloc[2*n:].to_numpy()==T.D['atoms']['resnr'].to_numpy()+2))
+        self.assertTrue((R.D['bonds'][['ai','aj']].iloc[2*nb:].to_numpy()==T.D['bonds'][['ai','aj']].to_numpy()+2*n).all())
+        self.assertEqual(len(R.rings),3*nr)
+        self.assertEqual(len(R.bondlist),3*nb)
+    def test_merge_list(self):
+        T=tp.Topology.read_top('test.top')
+        S=deepcopy(T)
+        for o in [deepcopy(T),deepcopy(T)]:
+            S.merge(o)
+        L=deepcopy(T)
+        L.merge([deepcopy(T),deepcopy(T)])
+        for d in ['atoms','bonds','pairs','angles','dihedrals','atomtypes','bondtypes','angletypes','dihedraltypes']:
+            self.assertTrue(S.D[d].equals(L.D[d]),msg=d)
+        self.assertEqual(S.bondlist.B,L.bondlist.B)
+    def test_type_index(self):
+        T=tp.Topology.read_top('test.top')
+        bi=T.type_index('bondtypes')
+        self.assertEqual(len(bi),T.D['bondtypes'].shape[0])
+        self.assertTrue(('ca','ha') in bi)
+        di=T.type_index('dihedraltypes')
+        self.assertEqual(len(di[('c3','ca','ca','ca')]),2)
+        q=pd.DataFrame({'i':['ha','ca','xx'],'j':['ca','ca','ca']})
+        p=T.type_parameters('bondtypes',q)
+        self.assertEqual(p['i'].to_list(),['ca','ca','ca'])
+        self.assertEqual(p['j'].to_list(),['ha','ca','xx'])
+        self.assertEqual(p['kb'].iloc[0],289365.44)
+        self.assertTrue(np.isnan(p['kb'].iloc[2]))
+        R=deepcopy(T)
+        R.D['bondtypes']=pd.concat((R.D['bondtypes'],pd.DataFrame({'i':['xx'],'j':['ca'],'func':[1],'b0':[0.1],'kb':[1000.0]})),ignore_index=True)
+        T.merge_types(R)
+        self.assertTrue(('ca','xx') in T.type_index('bondtypes'))
+        # in-place edits are seen once the index is invalidated
+        row=T.type_index('bondtypes')[('ca','ha')][0]
+        T.D['bondtypes'].loc[row,'j']='hx'
+        T.invalidate_type_index('bondtypes')
+        self.assertFalse(('ca','ha') in T.type_index('bondtypes'))
+        self.assertEqual(T.type_index('bondtypes')[('ca','hx')],[row])
+        T.reset_type('bondtypes',('ca','hx'),[1,0.2,500.0])
+        q=pd.DataFrame({'i':['hx'],'j':['ca']})
+        self.assertEqual(T.type_parameters('bondtypes',q)['kb'].iloc[0],500.0)
+        # Topology methods that edit type dataframes in place refresh the index themselves
+        T.reset_type('bondtypes',('ca','hx'),[1,0.2,600.0])
+        self.assertEqual(T.type_parameters('bondtypes',q)['kb'].iloc[0],600.0)
+        T.write_top('type_index_test.top')
+        os.remove('type_index_test.top')
+        self.assertEqual(T.type_index('bondtypes')[('ca','hx')],[row])
+    def test_type_conflicts(self):
+        T=tp.Topology.read_top('test.top')
+        U=deepcopy(T)
+        V=deepcopy(T)
+        row=V.type_index('dihedraltypes')[('c3','ca','ca','ca')]
+        row=[r for r in row if V.D['dihedraltypes'].loc[r,'func']==4][0]
+        V.D['dihedraltypes'].loc[row,'kd']=1.0
+        reg=tp.type_registry({'T':T,'U':U,'V':V},typename='dihedraltypes',funcidx=4)
+        self.assertEqual(set(reg['source']),{'T','U','V'})
+        conflicts=tp.type_conflicts(reg,typename='dihedraltypes')
+        self.assertEqual(list(conflicts.keys()),[('c3','ca','ca','ca')])
+        self.assertEqual(len(conflicts[('c3','ca','ca','ca')]),2)
+        selected=tp.select_topology_type_option(conflicts[('c3','ca','ca','ca')],'dihedraltypes',rule='stiffest')
+        self.assertEqual(selected[2],1.0)
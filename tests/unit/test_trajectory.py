@@ -0,0 +1,95 @@
+"""
+
+.. module:: test_trajectory
+   :synopsis: tests HTPolyNet.trajectory native trr/xtc readers
+   
+.. moduleauthor: Cameron F. Abrams, <cfa22@drexel.edu>
+
+"""
+import unittest
+import logging
+logger=logging.getLogger(__name__)
+import os
+import struct
+import tempfile
+import numpy as np
+
+from HTPolyNet.trajectory import read_frames, count_frames
+from HTPolyNet.gromacs import gro_from_trr, gmx_traj_info
+from HTPolyNet.coordinates import Coordinates
+
+# one compressed xtc frame of six waters and two ions, step 250, t=12.5 ps, 4 nm cubic box, written
+# by the xdrfile port of the Gromacs xtc compressor; the waters have equal run lengths, so once the
+# compressor's small-int size settles, the last three are sent with a zero run flag, meaning "same run
+# length as the previous atom"
+XTC_FRAME=bytes.fromhex('000007cb00000014000000fa4148000040800000000000000000000000000000408000000000000000000000000000004080000000000014447a00000000012c000000c80000019000000c1c00000ce400000898000000140000005154c4a9422134c69e62222112af3a22a2fc78d8105fcdbf044de94fda045a06c7b1ccd01004101bad03cde1849165d419002b16ca7dbb98b2ea0c80158dd6fd527e597506400ac6c2d852938410e1540000000000')
+XTC_COORDS=np.array([[0.500,1.000,1.500],[0.596,1.000,1.500],[0.476,1.093,1.500],
+                     [0.950,1.100,1.500],[1.046,1.100,1.500],[0.926,1.193,1.500],
+                     [1.400,1.200,1.500],[1.496,1.200,1.500],[1.376,1.293,1.500],
+                     [1.850,1.300,1.500],[1.946,1.300,1.500],[1.826,1.393,1.500],
+                     [2.300,1.400,1.500],[2.396,1.400,1.500],[2.276,1.493,1.500],
+                     [2.750,1.500,1.500],[2.846,1.500,1.500],[2.726,1.593,1.500],
+                     [3.100,0.200,0.400],[0.300,3.300,2.200]])
+
+def trr_frame(step,t,box,x,v=None,real='f'):
+    n=x.shape[0]
+    rs=struct.calcsize(real)
+    sizes=[0,0,9*rs,0,0,0,0,3*n*rs,0 if v is None else 3*n*rs,0,n]
+    b=struct.pack('>ii',1993,13)+struct.pack('>i',12)+b'GMX_trn_file'+struct.pack('>11i',*sizes)
+    b+=struct.pack(f'>ii{real}{real}',step,0,t,0.0)
+    b+=struct.pack(f'>9{real}',*box.ravel())+struct.pack(f'>{3*n}{real}',*x.ravel())
+    if v is not None:
+        b+=struct.pack(f'>{3*n}{real}',*v.ravel())
+    return b
+
+class TestTrajectory(unittest.TestCase):
+    def test_trr(self):
+        x=np.arange(12,dtype=float).reshape(4,3)/10
+        box=np.diag([2.0,2.5,3.0])
+        with tempfile.TemporaryDirectory() as d:
+            fn=os.path.join(d,'t.trr')
+            with open(fn,'wb') as f:
+                f.write(trr_frame(0,0.0,box,x))
+                f.write(trr_frame(10,0.5,box,x+1,v=x*2))
+                f.write(trr_frame(20,1.0,box,x+2,real='d'))
+            frames=list(read_frames(fn))
+            info=gmx_traj_info(fn)
+        self.assertEqual(len(frames),3)
+        self.assertEqual([f.step for f in frames],[0,10,20])
+        self.assertTrue(frames[0].v is None)
+        self.assertTrue(np.allclose(frames[1].x,x+1))
+        self.assertTrue(np.allclose(frames[1].v,x*2))
+        self.assertTrue(np.allclose(frames[2].x,x+2))
+        self.assertTrue(np.allclose(frames[2].box,box))
+        self.assertEqual(info.nframes,3)
+        self.assertAlmostEqual(info.time,1.0)
+    def test_xtc(self):
+        with tempfile.TemporaryDirectory() as d:
+            fn=os.path.join(d,'t.xtc')
+            small=np.array([[0.1,0.2,0.3],[0.4,0.5,0.6]])
+            with open(fn,'wb') as f:
+                f.write(XTC_FRAME)
+                # frames of at most nine atoms are stored uncompressed
+                f.write(struct.pack('>iiif',1995,2,500,25.0)+struct.pack('>9f',*np.diag([4.0,4.0,4.0]).ravel()))
+                f.write(struct.pack('>i6f',2,*small.ravel()))
+            frames=list(read_frames(fn))
+            self.assertEqual(count_frames(fn),(2,12.5,25.0))
+        self.assertEqual(frames[0].step,250)
+        self.assertTrue(np.allclose(frames[0].x,XTC_COORDS,atol=1.e-6))
+        self.assertTrue(np.allclose(frames[0].box,np.identity(3)*4))
+        self.assertTrue(np.allclose(frames[1].x,small))
+    def test_gro_from_trr(self):
+        C=Coordinates.read_gro('fixtures/config1.gro',wrap_coords=False)
+        x=C.A[['posX','posY','posZ']].to_numpy()
+        with tempfile.TemporaryDirectory() as d:
+            pfx=os.path.join(d,'conf')
+            C.write_gro(f'{pfx}.gro')
+            with open(f'{pfx}.trr','wb') as f:
+                for i in range(4):
+                    f.write(trr_frame(i*100,i*1.0,C.box,x+0.01*i))
+            written=gro_from_trr(pfx,nzero=3,b=1.0,outpfx=os.path.join(d,'out-'))
+            self.assertEqual([os.path.basename(w) for w in written],['out-000','out-001','out-002'])
+            D=Coordinates.read_gro(f'{written[-1]}.gro',wrap_coords=False)
+        self.assertTrue(D.name.startswith('Generated by trjconv'))
+        self.assertEqual(D.A['atomName'].to_list(),C.A['atomName'].to_list())
+        self.assertTrue(np.allclose(D.A[['posX','posY','posZ']].to_numpy(),x+0.03,atol=1.e-3))